@@ -0,0 +1,206 @@
+"""Incremental achievement progress.
+
+Each user has one `user_achievement_progress` document with a counter (or a
+small set) per `unlock_criteria` type and the ids already unlocked. Events
+apply their delta in a single `find_one_and_update` and only the criteria
+that event can move are evaluated against the returned counters. Like the
+stats rollups, a rebuild stamps `rebuilt_at` and events written no later
+than that are not applied again.
+"""
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+from pymongo import ReturnDocument
+
+from models import MOODS, ACHIEVEMENTS
+
+PROGRESS_COLLECTION = 'user_achievement_progress'
+
+# Criteria a mood entry write can move
+MOOD_CRITERIA = frozenset({
+    'entries_count', 'unique_moods', 'grateful_count', 'voice_notes', 'photos_attached',
+    'weather_conditions', 'midnight_entries', 'total_days', 'streak_days', 'all_moods_used'
+})
+
+COUNTER_FIELDS = (
+    'entries_count', 'grateful_count', 'voice_notes', 'photos_attached', 'midnight_entries',
+    'total_days', 'meditation_sessions', 'custom_moods'
+)
+SET_FIELDS = ('unique_moods', 'weather_conditions')
+
+
+def is_midnight_entry(entry: dict) -> bool:
+    timestamp = entry.get('timestamp')
+    if not isinstance(timestamp, datetime):
+        return False
+    return timestamp.hour >= 23 or timestamp.hour <= 2
+
+
+def weather_condition(entry: dict) -> Optional[str]:
+    weather_data = entry.get('weather')
+    if weather_data and isinstance(weather_data, dict):
+        return weather_data.get('condition') or None
+    return None
+
+
+def entry_counters(entry: Optional[dict]) -> dict:
+    """Counter contributions of a single mood entry"""
+    if not entry:
+        return {}
+    return {
+        'entries_count': 1,
+        'grateful_count': 1 if entry.get('mood_id') == 'grateful' else 0,
+        'voice_notes': 1 if entry.get('voice_note_url') else 0,
+        'photos_attached': 1 if entry.get('photo_url') else 0,
+        'midnight_entries': 1 if is_midnight_entry(entry) else 0
+    }
+
+
+def mood_entry_update(before: Optional[dict], after: Optional[dict]) -> dict:
+    """Mongo update moving progress from the `before` entry to the `after` entry"""
+    inc = {}
+    for field, amount in entry_counters(after).items():
+        inc[field] = inc.get(field, 0) + amount
+    for field, amount in entry_counters(before).items():
+        inc[field] = inc.get(field, 0) - amount
+    # Entries are one per (user, date), so only a brand new entry adds a day
+    if after and not before:
+        inc['total_days'] = 1
+    inc = {field: amount for field, amount in inc.items() if amount}
+
+    # Sets record what has ever been used; edits never shrink them
+    add_to_set = {}
+    if after:
+        add_to_set['unique_moods'] = after['mood_id']
+        condition = weather_condition(after)
+        if condition:
+            add_to_set['weather_conditions'] = condition
+
+    update = {'$set': {'updated_at': datetime.utcnow()}}
+    if inc:
+        update['$inc'] = inc
+    if add_to_set:
+        update['$addToSet'] = add_to_set
+    return update
+
+
+def criterion_met(criterion: str, target, progress: dict, streak: Optional[dict] = None) -> bool:
+    """Whether one `unlock_criteria` entry is satisfied by the progress counters"""
+    if criterion == 'streak_days':
+        return bool(streak) and streak.get('current', 0) >= target
+    if criterion in SET_FIELDS:
+        return len(progress.get(criterion, [])) >= target
+    if criterion == 'all_moods_used':
+        total_available = len(MOODS) + progress.get('custom_moods', 0)
+        return len(progress.get('unique_moods', [])) >= min(16, total_available)
+    if criterion in COUNTER_FIELDS:
+        return progress.get(criterion, 0) >= target
+    # Criteria nothing tracks yet never unlock: friends_helped, exports_count, and
+    # friends_count since no endpoint accepts friend requests
+    return False
+
+
+def evaluate_achievements(progress: dict, changed: Optional[Iterable[str]] = None,
+                          streak: Optional[dict] = None) -> List[str]:
+    """Ids of locked achievements whose criteria are now met.
+
+    Only achievements with a criterion in `changed` are considered; pass None
+    to evaluate everything.
+    """
+    changed = None if changed is None else set(changed)
+    already_unlocked = set(progress.get('unlocked', []))
+    unlocked = []
+    for achievement in ACHIEVEMENTS:
+        if achievement['id'] in already_unlocked:
+            continue
+        criteria = achievement['unlock_criteria']
+        if changed is not None and changed.isdisjoint(criteria):
+            continue
+        if any(criterion_met(criterion, target, progress, streak) for criterion, target in criteria.items()):
+            unlocked.append(achievement['id'])
+    return unlocked
+
+
+async def rebuild_achievement_progress(db, user_id: str) -> dict:
+    """Recompute a user's progress document from their full history"""
+    # Taken before the scan, so any event stamped after it is applied on top as a delta
+    rebuilt_at = datetime.utcnow()
+    progress = {field: 0 for field in COUNTER_FIELDS}
+    unique_moods, weather_conditions, dates = set(), set(), set()
+
+    projection = {'_id': 0, 'date': 1, 'mood_id': 1, 'voice_note_url': 1, 'photo_url': 1, 'weather': 1, 'timestamp': 1}
+    async for entry in db.mood_entries.find({'user_id': user_id}, projection):
+        for field, amount in entry_counters(entry).items():
+            progress[field] += amount
+        unique_moods.add(entry['mood_id'])
+        dates.add(entry.get('date'))
+        condition = weather_condition(entry)
+        if condition:
+            weather_conditions.add(condition)
+
+    progress['total_days'] = len(dates)
+    progress['unique_moods'] = sorted(unique_moods)
+    progress['weather_conditions'] = sorted(weather_conditions)
+    progress['meditation_sessions'] = await db.meditation_sessions.count_documents({'user_id': user_id, 'completed': True})
+    progress['custom_moods'] = await db.custom_moods.count_documents({'user_id': user_id})
+    progress['unlocked'] = await db.achievements.distinct('achievement_id', {'user_id': user_id})
+    progress['user_id'] = user_id
+    progress['rebuilt_at'] = rebuilt_at
+    progress['updated_at'] = datetime.utcnow()
+
+    await db[PROGRESS_COLLECTION].replace_one({'user_id': user_id}, progress, upsert=True)
+    return progress
+
+
+async def claim_achievements(db, user_id: str, achievement_ids: List[str]) -> List[str]:
+    """Mark achievements unlocked, returning only the ones this call claimed"""
+    claimed = []
+    for achievement_id in achievement_ids:
+        result = await db[PROGRESS_COLLECTION].update_one(
+            {'user_id': user_id, 'unlocked': {'$ne': achievement_id}},
+            {'$push': {'unlocked': achievement_id}}
+        )
+        if result.modified_count:
+            claimed.append(achievement_id)
+    return claimed
+
+
+async def apply_progress_update(db, user_id: str, update: dict, changed: Iterable[str],
+                                streak: Optional[dict] = None, written_at: Optional[datetime] = None) -> List[str]:
+    """Apply an event's delta and return the achievements it newly unlocks.
+
+    `written_at` is when the event's own write was stamped; if the last
+    rebuild started after that, it already counted the event.
+    """
+    query = {'user_id': user_id}
+    if isinstance(written_at, datetime):
+        query['$or'] = [{'rebuilt_at': {'$exists': False}}, {'rebuilt_at': {'$lt': written_at}}]
+    progress = await db[PROGRESS_COLLECTION].find_one_and_update(query, update, return_document=ReturnDocument.AFTER)
+    if progress is None:
+        if '$or' in query:
+            # Skipped by the guard: a rebuild that already counted this event
+            progress = await db[PROGRESS_COLLECTION].find_one({'user_id': user_id})
+        if progress is None:
+            # First event for this user: the rebuild already includes it
+            progress = await rebuild_achievement_progress(db, user_id)
+        changed = None
+
+    newly_met = evaluate_achievements(progress, changed, streak)
+    if not newly_met:
+        return []
+    return await claim_achievements(db, user_id, newly_met)
+
+
+async def record_mood_achievements(db, user_id: str, before: Optional[dict] = None,
+                                   after: Optional[dict] = None, streak: Optional[dict] = None) -> List[str]:
+    """Progress update for a mood entry insert (no `before`) or same-day edit"""
+    written_at = (after or {}).get('updated_at')
+    return await apply_progress_update(db, user_id, mood_entry_update(before, after), MOOD_CRITERIA, streak, written_at)
+
+
+async def record_counter_event(db, user_id: str, counter: str, amount: int = 1,
+                               written_at: Optional[datetime] = None) -> List[str]:
+    """Progress update for events outside mood entries (meditations, custom moods)"""
+    update = {'$inc': {counter: amount}, '$set': {'updated_at': datetime.utcnow()}}
+    changed = {'all_moods_used'} if counter == 'custom_moods' else {counter}
+    return await apply_progress_update(db, user_id, update, changed, written_at=written_at)
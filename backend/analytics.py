@@ -0,0 +1,370 @@
+"""Vectorized mood analytics.
+
+`MoodFrame` loads a user's history once into NumPy columns (date ordinals,
+mood codes, intensity, weather codes and (row, tag code) pairs for the
+tags) and computes the stats distributions, correlations and insight
+conditions with array operations. `reference_mood_stats` and
+`reference_insights` keep the original dict-walking implementations as the
+oracle the frame is checked against (see tests/test_analytics.py).
+"""
+import statistics
+from datetime import date
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from models import MOODS
+
+CATEGORIES = ('positive', 'neutral', 'negative')
+_CATEGORY_CODES = {category: code for code, category in enumerate(CATEGORIES)}
+_BUILTIN_MOODS = list(MOODS)
+
+FRAME_PROJECTION = {'_id': 0, 'date': 1, 'mood_id': 1, 'intensity': 1, 'weather': 1, 'tags': 1}
+
+
+def compose_insights(total_entries: int, positive_count: int, recent_count: int, recent_avg: Optional[float],
+                     weather_total: int, sunny_count: int, social_count: int, social_avg: Optional[float],
+                     overall_avg: Optional[float], grateful_count: int, exercise_count: int,
+                     exercise_avg: Optional[float]) -> List[str]:
+    """Turn precomputed signals into the user-facing insight list"""
+    if not total_entries:
+        return ["Start your emotional journey by recording your first mood! 🌟"]
+
+    insights = []
+
+    positive_ratio = positive_count / total_entries
+    if positive_ratio > 0.75:
+        insights.append("🌟 Exceptional emotional well-being! You're maintaining a very positive mindset.")
+    elif positive_ratio > 0.6:
+        insights.append("😊 Great emotional balance! You're handling life's challenges well.")
+    elif positive_ratio < 0.3:
+        insights.append("💙 Consider focusing on self-care activities. Remember, seeking support is a sign of strength.")
+    else:
+        insights.append("🌈 Your emotional journey shows variety - this is completely normal and healthy.")
+
+    if recent_count >= 3 and recent_avg is not None:
+        if recent_avg > 4:
+            insights.append("⚡ Your emotional intensity has been high lately. Consider meditation to find balance.")
+        elif recent_avg < 2:
+            insights.append("🌱 Your emotions seem gentle recently. This could be a time for self-reflection.")
+
+    if weather_total > 3 and sunny_count > weather_total * 0.6:
+        insights.append("☀️ You tend to feel better on sunny days. Try light therapy during gloomy weather.")
+
+    if social_count > 2 and social_avg is not None and overall_avg is not None:
+        if social_avg > overall_avg + 0.5:
+            insights.append("👥 Social activities boost your mood significantly. Stay connected with friends!")
+
+    if grateful_count > 3:
+        insights.append("🙏 Your gratitude practice is strong and contributes to emotional resilience.")
+
+    if exercise_count > 2 and exercise_avg is not None and exercise_avg > 3.5:
+        insights.append("🏃‍♀️ Exercise significantly improves your mood. Keep up the active lifestyle!")
+
+    if not insights:
+        insights.append("📈 Keep tracking your moods to unlock personalized insights about your emotional patterns!")
+
+    return insights[:5]
+
+
+def _date_ordinal(value) -> int:
+    try:
+        return date.fromisoformat(value).toordinal()
+    except (TypeError, ValueError):
+        return 0
+
+
+class MoodFrame:
+    """Columnar view of a mood history, in the order the entries were given"""
+
+    def __init__(self, entries: List[dict]):
+        mood_index = {mood_id: code for code, mood_id in enumerate(_BUILTIN_MOODS)}
+        mood_ids = list(_BUILTIN_MOODS)
+        weather_index: Dict[str, int] = {}
+        tag_index: Dict[str, int] = {}
+
+        n = len(entries)
+        dates = np.zeros(n, dtype=np.int32)
+        moods = np.zeros(n, dtype=np.int16)
+        intensity = np.full(n, 3, dtype=np.int16)
+        has_intensity = np.zeros(n, dtype=bool)
+        weather = np.full(n, -1, dtype=np.int16)
+        tag_rows, tag_cols = [], []
+
+        for row, entry in enumerate(entries):
+            dates[row] = _date_ordinal(entry.get('date'))
+
+            mood_id = entry['mood_id']
+            code = mood_index.get(mood_id)
+            if code is None:
+                code = mood_index[mood_id] = len(mood_ids)
+                mood_ids.append(mood_id)
+            moods[row] = code
+
+            # Stats default a missing intensity to 3; insights skip missing or zero values
+            value = entry.get('intensity', 3)
+            intensity[row] = value if value is not None else 0
+            has_intensity[row] = bool(entry.get('intensity'))
+
+            weather_data = entry.get('weather')
+            if weather_data and isinstance(weather_data, dict) and weather_data.get('condition'):
+                weather[row] = weather_index.setdefault(weather_data['condition'], len(weather_index))
+
+            tags = entry.get('tags', [])
+            if tags and isinstance(tags, list):
+                for tag in tags:
+                    tag_rows.append(row)
+                    tag_cols.append(tag_index.setdefault(tag, len(tag_index)))
+
+        self.size = n
+        self.dates = dates
+        self.moods = moods
+        self.intensity = intensity
+        self.has_intensity = has_intensity
+        self.weather = weather
+        # One (row, tag code) pair per tag occurrence, in entry order; tags may repeat on an entry
+        self.tag_rows = np.array(tag_rows, dtype=np.intp)
+        self.tag_codes = np.array(tag_cols, dtype=np.intp)
+
+        self.mood_ids = mood_ids
+        self.weather_names = list(weather_index)
+        self.tag_names = list(tag_index)
+        self.mood_labels = [MOODS.get(mood_id, {}).get('label', mood_id) for mood_id in mood_ids]
+        self.mood_categories = np.array(
+            [_CATEGORY_CODES[MOODS.get(mood_id, {}).get('category', 'neutral')] for mood_id in mood_ids],
+            dtype=np.int8
+        )
+
+    @classmethod
+    async def load(cls, db, user_id: str, query: Optional[dict] = None) -> 'MoodFrame':
+        """Read a user's history (newest first) straight into a frame"""
+        cursor = db.mood_entries.find({'user_id': user_id, **(query or {})}, FRAME_PROJECTION).sort('date', -1)
+        return cls([entry async for entry in cursor])
+
+    def _mean(self, values: np.ndarray) -> Optional[float]:
+        return float(values.mean()) if values.size else None
+
+    def stats(self) -> dict:
+        """Aggregate fields of `MoodStats` (everything except streaks and insights)"""
+        if not self.size:
+            return {
+                'total_entries': 0, 'mood_counts': {}, 'most_common_mood': "",
+                'weekly_average_intensity': 0.0, 'monthly_average_intensity': 0.0,
+                'mood_distribution': {}, 'weather_correlation': {}, 'activity_correlation': {}
+            }
+
+        categories = self.mood_categories[self.moods]
+
+        # Labels can be shared by several mood ids; ties go to the label seen first
+        mood_totals = np.bincount(self.moods, minlength=len(self.mood_ids))
+        first_seen = np.full(len(self.mood_ids), self.size, dtype=np.int64)
+        np.minimum.at(first_seen, self.moods, np.arange(self.size))
+        label_counts: Dict[str, int] = {}
+        label_first: Dict[str, int] = {}
+        for code in np.nonzero(mood_totals)[0]:
+            label = self.mood_labels[code]
+            label_counts[label] = label_counts.get(label, 0) + int(mood_totals[code])
+            label_first[label] = min(label_first.get(label, self.size), int(first_seen[code]))
+        mood_counts = dict(sorted(label_counts.items(), key=lambda item: label_first[item[0]]))
+        most_common_mood = max(mood_counts.items(), key=lambda x: x[1])[0]
+
+        distribution = np.bincount(categories, minlength=len(CATEGORIES))
+        mood_distribution = {category: int(distribution[code]) for code, category in enumerate(CATEGORIES)}
+
+        weather_correlation = {}
+        has_weather = self.weather >= 0
+        if has_weather.any():
+            cells = self.weather[has_weather].astype(np.int64) * len(CATEGORIES) + categories[has_weather]
+            matrix = np.bincount(cells, minlength=len(self.weather_names) * len(CATEGORIES)).reshape(-1, len(CATEGORIES))
+            for code, name in enumerate(self.weather_names):
+                weather_correlation[name] = {category: int(matrix[code, c]) for c, category in enumerate(CATEGORIES)}
+
+        activity_correlation = {}
+        if self.tag_names:
+            tag_count = len(self.tag_names)
+            tagged = self.intensity[self.tag_rows]
+            counts = np.bincount(self.tag_codes, minlength=tag_count)
+            sums = np.bincount(self.tag_codes, weights=tagged, minlength=tag_count)
+            # Stable, so each tag's intensities stay in entry order
+            by_tag = np.split(tagged[np.argsort(self.tag_codes, kind='stable')], np.cumsum(counts)[:-1])
+            for code, name in enumerate(self.tag_names):
+                activity_correlation[name] = {
+                    'count': int(counts[code]),
+                    'avg_intensity': float(sums[code] / counts[code]),
+                    'moods': by_tag[code].tolist()
+                }
+
+        return {
+            'total_entries': self.size,
+            'mood_counts': mood_counts,
+            'most_common_mood': most_common_mood,
+            'weekly_average_intensity': round(float(self.intensity[:7].mean()), 1),
+            'monthly_average_intensity': round(float(self.intensity[:30].mean()), 1),
+            'mood_distribution': mood_distribution,
+            'weather_correlation': weather_correlation,
+            'activity_correlation': activity_correlation
+        }
+
+    def _tag_signal(self, tag: str):
+        if tag not in self.tag_names:
+            return 0, None
+        rows = np.zeros(self.size, dtype=bool)
+        rows[self.tag_rows[self.tag_codes == self.tag_names.index(tag)]] = True
+        return int(rows.sum()), self._mean(self.intensity[rows & self.has_intensity])
+
+    def insights(self) -> List[str]:
+        recent = slice(0, 14)
+        sunny_count = 0
+        if 'sunny' in self.weather_names:
+            sunny_count = int((self.weather == self.weather_names.index('sunny')).sum())
+        grateful_count = int((self.moods == _BUILTIN_MOODS.index('grateful')).sum())
+        social_count, social_avg = self._tag_signal('social')
+        exercise_count, exercise_avg = self._tag_signal('exercise')
+
+        return compose_insights(
+            total_entries=self.size,
+            positive_count=int((self.mood_categories[self.moods] == _CATEGORY_CODES['positive']).sum()),
+            recent_count=min(self.size, 14),
+            recent_avg=self._mean(self.intensity[recent][self.has_intensity[recent]]),
+            weather_total=int((self.weather >= 0).sum()),
+            sunny_count=sunny_count,
+            social_count=social_count,
+            social_avg=social_avg,
+            overall_avg=self._mean(self.intensity[self.has_intensity]),
+            grateful_count=grateful_count,
+            exercise_count=exercise_count,
+            exercise_avg=exercise_avg
+        )
+
+
+def reference_mood_stats(entries: List[dict]) -> dict:
+    """Original dict-walking stats computation, kept for equivalence checks"""
+    if not entries:
+        return MoodFrame([]).stats()
+
+    mood_counts = {}
+    mood_distribution = {'positive': 0, 'neutral': 0, 'negative': 0}
+    weather_correlation = {}
+    activity_correlation = {}
+
+    for entry in entries:
+        if entry is None:
+            continue
+
+        mood_label = MOODS.get(entry['mood_id'], {}).get('label', entry['mood_id'])
+        mood_counts[mood_label] = mood_counts.get(mood_label, 0) + 1
+
+        category = MOODS.get(entry['mood_id'], {}).get('category', 'neutral')
+        mood_distribution[category] += 1
+
+        weather_data = entry.get('weather')
+        if weather_data and isinstance(weather_data, dict) and weather_data.get('condition'):
+            weather = weather_data['condition']
+            if weather not in weather_correlation:
+                weather_correlation[weather] = {'positive': 0, 'neutral': 0, 'negative': 0}
+            weather_correlation[weather][category] += 1
+
+        tags = entry.get('tags', [])
+        if tags and isinstance(tags, list):
+            for tag in tags:
+                if tag not in activity_correlation:
+                    activity_correlation[tag] = {'count': 0, 'avg_intensity': 0, 'moods': []}
+                activity_correlation[tag]['count'] += 1
+                activity_correlation[tag]['moods'].append(entry.get('intensity', 3))
+
+    for activity in activity_correlation:
+        moods = activity_correlation[activity]['moods']
+        activity_correlation[activity]['avg_intensity'] = statistics.mean(moods) if moods else 0
+
+    most_common_mood = max(mood_counts.items(), key=lambda x: x[1])[0] if mood_counts else ""
+
+    recent_entries = entries[:7]
+    monthly_entries = entries[:30]
+    weekly_avg = statistics.mean([e.get('intensity', 3) for e in recent_entries]) if recent_entries else 0.0
+    monthly_avg = statistics.mean([e.get('intensity', 3) for e in monthly_entries]) if monthly_entries else 0.0
+
+    return {
+        'total_entries': len(entries),
+        'mood_counts': mood_counts,
+        'most_common_mood': most_common_mood,
+        'weekly_average_intensity': round(weekly_avg, 1),
+        'monthly_average_intensity': round(monthly_avg, 1),
+        'mood_distribution': mood_distribution,
+        'weather_correlation': weather_correlation,
+        'activity_correlation': activity_correlation
+    }
+
+
+def reference_insights(entries: List[dict]) -> List[str]:
+    """Original dict-walking insight rules, kept for equivalence checks"""
+    if not entries:
+        return ["Start your emotional journey by recording your first mood! 🌟"]
+
+    insights = []
+
+    positive_moods = [e for e in entries if e and MOODS.get(e.get('mood_id'), {}).get('category') == 'positive']
+
+    if len(entries) > 0:
+        positive_ratio = len(positive_moods) / len(entries)
+
+        if positive_ratio > 0.75:
+            insights.append("🌟 Exceptional emotional well-being! You're maintaining a very positive mindset.")
+        elif positive_ratio > 0.6:
+            insights.append("😊 Great emotional balance! You're handling life's challenges well.")
+        elif positive_ratio < 0.3:
+            insights.append("💙 Consider focusing on self-care activities. Remember, seeking support is a sign of strength.")
+        else:
+            insights.append("🌈 Your emotional journey shows variety - this is completely normal and healthy.")
+
+    recent_entries = entries[:14]
+    if len(recent_entries) >= 3:
+        intensities = [e.get('intensity', 3) for e in recent_entries if e and e.get('intensity')]
+        if intensities:
+            avg_intensity = statistics.mean(intensities)
+            if avg_intensity > 4:
+                insights.append("⚡ Your emotional intensity has been high lately. Consider meditation to find balance.")
+            elif avg_intensity < 2:
+                insights.append("🌱 Your emotions seem gentle recently. This could be a time for self-reflection.")
+
+    weather_entries = []
+    for e in entries:
+        if e and e.get('weather') and isinstance(e.get('weather'), dict) and e['weather'].get('condition'):
+            weather_entries.append(e)
+
+    if len(weather_entries) > 3:
+        sunny_moods = [e for e in weather_entries if e['weather'].get('condition') == 'sunny']
+        if len(sunny_moods) > len(weather_entries) * 0.6:
+            insights.append("☀️ You tend to feel better on sunny days. Try light therapy during gloomy weather.")
+
+    social_entries = []
+    for e in entries:
+        if e and e.get('tags') and isinstance(e.get('tags'), list) and 'social' in e['tags']:
+            social_entries.append(e)
+
+    if len(social_entries) > 2:
+        social_intensities = [e.get('intensity', 3) for e in social_entries if e.get('intensity')]
+        all_intensities = [e.get('intensity', 3) for e in entries if e and e.get('intensity')]
+        if social_intensities and all_intensities:
+            social_avg = statistics.mean(social_intensities)
+            overall_avg = statistics.mean(all_intensities)
+            if social_avg > overall_avg + 0.5:
+                insights.append("👥 Social activities boost your mood significantly. Stay connected with friends!")
+
+    grateful_entries = [e for e in entries if e and e.get('mood_id') == 'grateful']
+    if len(grateful_entries) > 3:
+        insights.append("🙏 Your gratitude practice is strong and contributes to emotional resilience.")
+
+    exercise_entries = []
+    for e in entries:
+        if e and e.get('tags') and isinstance(e.get('tags'), list) and 'exercise' in e['tags']:
+            exercise_entries.append(e)
+
+    if len(exercise_entries) > 2:
+        exercise_intensities = [e.get('intensity', 3) for e in exercise_entries if e.get('intensity')]
+        if exercise_intensities and statistics.mean(exercise_intensities) > 3.5:
+            insights.append("🏃‍♀️ Exercise significantly improves your mood. Keep up the active lifestyle!")
+
+    if not insights:
+        insights.append("📈 Keep tracking your moods to unlock personalized insights about your emotional patterns!")
+
+    return insights[:5]
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the backend's hot paths.
+
+Run from the backend directory:
+    python benchmarks.py            # every benchmark
+    python benchmarks.py streaks    # just one
+"""
+import json
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from analytics import MoodFrame, reference_insights, reference_mood_stats
+from crisis import KeywordMatcher
+from models import CRISIS_KEYWORDS, MOODS, WEATHER_CONDITIONS, MoodData, MoodEntry, MoodEntryCreate
+from mood_catalog import enrich_mood_entry
+from fast_json import FastJSONResponse, trusted_rows
+from http_client import HttpClientPool
+from exports import csv_row, CSV_COLUMNS
+from imports import entry_upsert, iter_csv_records
+from streaks import advance_streak, streak_from_dates
+
+
+def timed(func, *args, repeat: int = 5):
+    """Best wall-clock time of `repeat` runs, in milliseconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def report(name: str, millis: float, baseline: float = None):
+    line = f"  {name:<40} {millis:10.3f} ms"
+    if baseline:
+        line += f"   ({baseline / millis:,.1f}x faster)"
+    print(line)
+
+
+def make_history(days: int, gap_chance: float = 0.05):
+    """Mood entries ending today, with occasional skipped days"""
+    entries = []
+    day = datetime.now()
+    while len(entries) < days:
+        if random.random() >= gap_chance:
+            entries.append({'date': day.strftime('%Y-%m-%d'), 'mood_id': 'happy', 'intensity': random.randint(1, 5)})
+        day -= timedelta(days=1)
+    return entries
+
+
+def legacy_streak(entries):
+    """The original calculate_advanced_streak walk, minus the database read"""
+    current_streak = longest_streak = temp_streak = breaks = 0
+    dates = sorted(set(entry['date'] for entry in entries), reverse=True)
+    today = datetime.now().strftime('%Y-%m-%d')
+    expected_date = datetime.now()
+    for date in dates:
+        if date == expected_date.strftime('%Y-%m-%d'):
+            temp_streak += 1
+            current_streak = temp_streak if date == today or current_streak == 0 else current_streak
+        else:
+            if temp_streak > longest_streak:
+                longest_streak = temp_streak
+            if temp_streak > 0:
+                breaks += 1
+            temp_streak = 1 if date == expected_date.strftime('%Y-%m-%d') else 0
+        expected_date -= timedelta(days=1)
+    if temp_streak > longest_streak:
+        longest_streak = temp_streak
+    return {'current': current_streak, 'longest': longest_streak, 'breaks': breaks}
+
+
+def bench_streaks():
+    print("Streaks (10k-entry history)")
+    entries = make_history(10_000)
+    ascending = sorted(entry['date'] for entry in entries)
+    state = streak_from_dates(ascending[:-1])
+
+    baseline = timed(legacy_streak, entries)
+    report("legacy calculate_advanced_streak", baseline)
+    report("streak_from_dates (full recompute)", timed(streak_from_dates, ascending), baseline)
+    report("advance_streak (new day, O(1))", timed(advance_streak, state, ascending[-1]), baseline)
+
+
+JOURNAL_WORDS = (
+    "today felt long but the walk after work helped me settle my thoughts and "
+    "I talked with a friend about the week ahead while dinner was cooking"
+).split()
+
+
+def make_note(words: int):
+    return ' '.join(random.choice(JOURNAL_WORDS) for _ in range(words))
+
+
+def make_phrases(count: int):
+    vocabulary = [''.join(random.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(6)) for _ in range(200)]
+    return [' '.join(random.sample(vocabulary, random.randint(1, 3))) for _ in range(count)]
+
+
+def legacy_crisis_check(keywords, text):
+    """The original check_crisis_keywords substring loop"""
+    text_lower = text.lower()
+    return any(keyword in text_lower for keyword in keywords)
+
+
+def bench_crisis():
+    note = make_note(5_000)  # ~30KB journal note with no crisis phrases
+    print(f"Crisis keywords ({len(note):,}-character note, no match)")
+    for extra in (0, 500):
+        keywords = CRISIS_KEYWORDS + make_phrases(extra)
+        matcher = KeywordMatcher(keywords)
+        print(f"  {len(keywords)} phrases")
+        report("legacy substring loop", timed(legacy_crisis_check, keywords, note))
+        report("KeywordMatcher.search", timed(matcher.search, note))
+
+
+ANALYTICS_TAGS = ['social', 'exercise', 'work', 'family', 'outdoors', 'reading', 'music', 'travel']
+
+
+def make_mood_history(size: int):
+    """Newest-first entries with weather and tags on most of them, plus a custom mood"""
+    mood_ids = list(MOODS) + ['custom_zen']
+    conditions = list(WEATHER_CONDITIONS)
+    day = datetime.now()
+    entries = []
+    for _ in range(size):
+        entry = {'date': day.strftime('%Y-%m-%d'), 'mood_id': random.choice(mood_ids), 'intensity': random.randint(1, 5)}
+        if random.random() < 0.7:
+            entry['weather'] = {'condition': random.choice(conditions), 'temperature': random.randint(-5, 35)}
+        if random.random() < 0.8:
+            entry['tags'] = random.sample(ANALYTICS_TAGS, random.randint(1, 3))
+        entries.append(entry)
+        day -= timedelta(days=1)
+    return entries
+
+
+def reference_analytics(entries):
+    return reference_mood_stats(entries), reference_insights(entries)
+
+
+def frame_analytics(entries):
+    frame = MoodFrame(entries)
+    return frame.stats(), frame.insights()
+
+
+def bench_analytics():
+    print("Mood stats + insights")
+    for size in (1_000, 10_000, 100_000):
+        entries = make_mood_history(size)
+        frame = MoodFrame(entries)  # equivalence with the reference is checked in tests/test_analytics.py
+
+        print(f"  {size:,} entries")
+        repeat = 3 if size >= 100_000 else 5
+        baseline = timed(reference_analytics, entries, repeat=repeat)
+        report("dict-walking reference", baseline)
+        report("MoodFrame (build + compute)", timed(frame_analytics, entries, repeat=repeat), baseline)
+        report("MoodFrame (compute only)", timed(lambda: (frame.stats(), frame.insights()), repeat=repeat), baseline)
+
+
+def legacy_enrich(entry_dict):
+    """The original enrich_mood_entry: fresh timestamps and a new MoodData per entry"""
+    if not entry_dict.get('timestamp'):
+        entry_dict['timestamp'] = datetime.utcnow()
+    if not entry_dict.get('created_at'):
+        entry_dict['created_at'] = datetime.utcnow()
+    if not entry_dict.get('updated_at'):
+        entry_dict['updated_at'] = datetime.utcnow()
+    mood_id = entry_dict['mood_id']
+    if mood_id in MOODS:
+        entry_dict['mood'] = MoodData(id=mood_id, **MOODS[mood_id])
+    else:
+        entry_dict['mood'] = MoodData(id=mood_id, emoji='❓', label=mood_id.title(), color='bg-gray-100 border-gray-300',
+                                      particles='gray', intensity=3, category='neutral', isCustom=True)
+    return entry_dict
+
+
+def enrich_page(enrich, entries):
+    return [enrich(dict(entry)) for entry in entries]
+
+
+def build_page(enrich, entries):
+    return [MoodEntry(**enrich(dict(entry))) for entry in entries]
+
+
+def bench_enrichment():
+    now = datetime.utcnow()
+    entries = [dict(entry, id=str(i), user_id='bench', timestamp=now, created_at=now, updated_at=now)
+               for i, entry in enumerate(make_mood_history(1_000))]
+    print(f"Mood entry enrichment ({len(entries):,} entries)")
+    baseline = timed(enrich_page, legacy_enrich, entries)
+    report("legacy enrich_mood_entry", baseline)
+    report("catalog enrich_mood_entry", timed(enrich_page, enrich_mood_entry, entries), baseline)
+    baseline = timed(build_page, legacy_enrich, entries)
+    report("legacy enrich + MoodEntry", baseline)
+    report("catalog enrich + MoodEntry", timed(build_page, enrich_mood_entry, entries), baseline)
+
+
+def response_model_path(field, rows):
+    """What FastAPI does for a `response_model=List[MoodEntry]` endpoint returning validated models"""
+    from fastapi.responses import JSONResponse
+    models = [MoodEntry(**row) for row in rows]
+    value, _ = field.validate(models, {}, loc=('response',))
+    return JSONResponse(field.serialize(value, by_alias=True)).body
+
+
+def fast_json_path(rows):
+    return FastJSONResponse(trusted_rows(MoodEntry, rows)).body
+
+
+def bench_serialization():
+    from fastapi.utils import create_response_field
+    field = create_response_field(name='response', type_=List[MoodEntry])
+    now = datetime.utcnow()
+    print("List response serialization (MoodEntry)")
+    for size in (100, 1_000):
+        rows = [enrich_mood_entry(dict(entry, id=str(i), user_id='bench', timestamp=now, created_at=now, updated_at=now))
+                for i, entry in enumerate(make_mood_history(size))]
+        assert json.loads(fast_json_path(rows)) == json.loads(response_model_path(field, rows)), "fast JSON output differs"
+        print(f"  {size:,} items")
+        baseline = timed(response_model_path, field, rows)
+        report("response_model (validate twice + json)", baseline)
+        report("trusted rows + fast encoder", timed(fast_json_path, rows), baseline)
+
+
+async def start_auth_stub():
+    """Local stand-in for the OAuth token and userinfo endpoints"""
+    from aiohttp import web
+
+    async def token(request):
+        await request.read()
+        return web.json_response({'access_token': 'stub-token'})
+
+    async def userinfo(request):
+        return web.json_response({'id': 'stub', 'email': 'stub@example.com', 'name': 'Stub'})
+
+    app = web.Application()
+    app.router.add_post('/token', token)
+    app.router.add_get('/userinfo', userinfo)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+async def login_per_session(base_url):
+    """The original callback: a new ClientSession (and connection) per call"""
+    import aiohttp
+    async with aiohttp.ClientSession() as session:
+        async with session.post(f"{base_url}/token", data={'code': 'x'}) as response:
+            await response.json()
+    async with aiohttp.ClientSession() as session:
+        async with session.get(f"{base_url}/userinfo") as response:
+            await response.json()
+
+
+async def login_pooled(pool, base_url):
+    await pool.request_json('POST', f"{base_url}/token", data={'code': 'x'})
+    await pool.request_json('GET', f"{base_url}/userinfo")
+
+
+async def time_logins(login, logins: int, *args) -> float:
+    start = time.perf_counter()
+    for _ in range(logins):
+        await login(*args)
+    return (time.perf_counter() - start) * 1000 / logins
+
+
+def bench_http_pool():
+    import asyncio
+
+    async def run():
+        runner, base_url = await start_auth_stub()
+        pool = HttpClientPool()
+        await pool.start()
+        try:
+            logins = 200
+            print(f"Login HTTP round trips against a local stub ({logins} sequential logins, per-login mean)")
+            baseline = await time_logins(login_per_session, logins, base_url)
+            report("new ClientSession per call", baseline)
+            report("shared HttpClientPool", await time_logins(login_pooled, logins, pool, base_url), baseline)
+            metrics = pool.metrics()
+            print(f"  pool connections created {metrics['connections_created']}, reused {metrics['connections_reused']}")
+        finally:
+            await pool.close()
+            await runner.cleanup()
+
+    asyncio.run(run())
+
+
+def import_operations(body: bytes) -> int:
+    """Parse, validate and build the bulk upserts for an import body, without the writes"""
+    import asyncio
+
+    async def chunks():
+        for start in range(0, len(body), 65536):
+            yield body[start:start + 65536]
+
+    async def run():
+        now = datetime.utcnow()
+        return [entry_upsert('bench', MoodEntryCreate(**record), now)
+                async for _, record in iter_csv_records(chunks())]
+
+    return len(asyncio.run(run()))
+
+
+def bench_import():
+    import csv
+    import io
+    start = datetime(2020, 1, 1)
+    entries = [dict(entry, date=(start + timedelta(days=i)).strftime('%Y-%m-%d'), timestamp=start + timedelta(days=i, hours=9),
+                    note='Long day\nbut "ok"' if i % 7 == 0 else '', tags=['work'] if i % 3 == 0 else [])
+               for i, entry in enumerate(make_mood_history(5 * 365))]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    writer.writerows(csv_row(entry) for entry in entries)
+    body = buffer.getvalue().encode('utf-8')
+    assert import_operations(body) == len(entries), "rows were dropped"
+    print(f"Mood import, 5 years of exported CSV ({len(entries):,} rows, {len(body) / 1024:,.0f} KiB)")
+    report("parse + validate + build upserts", timed(import_operations, body))
+
+
+BENCHMARKS = {
+    'streaks': bench_streaks,
+    'crisis': bench_crisis,
+    'analytics': bench_analytics,
+    'enrichment': bench_enrichment,
+    'serialization': bench_serialization,
+    'http_pool': bench_http_pool,
+    'import': bench_import,
+}
+
+
+if __name__ == "__main__":
+    random.seed(42)
+    selected = sys.argv[1:] or list(BENCHMARKS)
+    for name in selected:
+        BENCHMARKS[name]()
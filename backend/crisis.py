@@ -0,0 +1,136 @@
+"""Crisis keyword detection.
+
+All of `CRISIS_KEYWORDS` is compiled once into a single regular expression,
+factored into a prefix trie (`hope(?:less)`...) so scan time stays roughly
+flat as phrases are added; a flat `a|b|c` alternation retries every branch
+at every position. For short lists, C-level substring checks for one
+anchor word per phrase first rule out notes that cannot match.
+
+Phrases match on word boundaries, with hyphen and underscore joining words
+("cutting-edge" is not "cutting"), but may carry one of `INFLECTIONS`
+("hopelessness"). Multi-word phrases match across any run of whitespace
+and typographic apostrophes are treated like ASCII ones.
+"""
+import re
+from typing import Iterable, Iterator, List, NamedTuple, Optional
+
+from models import CRISIS_KEYWORDS
+
+_APOSTROPHES = "'’‘ʼ"
+_FOLD_APOSTROPHES = str.maketrans({ch: "'" for ch in _APOSTROPHES[1:]})
+_CHARACTER_PATTERNS = {' ': r'\s+', "'": f'[{_APOSTROPHES}]'}
+
+# A phrase must start and end on a word boundary; hyphen and underscore join words, so
+# "cutting-edge" is not "cutting". These endings may follow it ("hopelessness", "suicides").
+_WORD_CHAR = r'[\w\-]'
+_WORD_JOINED = re.compile(_WORD_CHAR)
+INFLECTIONS = ('s', 'es', 'ed', 'ness', 'ly')
+
+# Up to this many distinct anchor words, C-level substring checks rule out most notes
+# faster than the regex scan; above it the single scan is cheaper
+PREFILTER_LIMIT = 64
+
+
+class KeywordMatch(NamedTuple):
+    keyword: str
+    start: int  # offset into the original text
+    end: int
+
+
+def normalize_phrase(phrase: str) -> str:
+    return ' '.join(phrase.lower().translate(_FOLD_APOSTROPHES).split())
+
+
+def _trie_pattern(phrases: Iterable[str]) -> str:
+    """Prefix-factored alternation; greedy, so the longest phrase at a position wins"""
+    trie: dict = {}
+    for phrase in phrases:
+        node = trie
+        for ch in phrase:
+            node = node.setdefault(ch, {})
+        node[''] = {}
+
+    def build(node: dict) -> str:
+        branches = [_CHARACTER_PATTERNS.get(ch, re.escape(ch)) + build(child)
+                    for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if '' in node:
+            return f'(?:{body})?' if len(branches) == 1 else body + '?'
+        return body
+
+    return build(trie)
+
+
+def _anchor(phrase: str) -> str:
+    """Longest piece of a phrase that any match must contain verbatim"""
+    pieces = [piece for word in phrase.split(' ') for piece in word.split("'")]
+    return max(reversed(pieces), key=len)
+
+
+class KeywordMatcher:
+    """One compiled regular expression over a fixed set of phrases"""
+
+    def __init__(self, keywords: Iterable[str], prefilter_limit: int = PREFILTER_LIMIT):
+        self.keywords: List[str] = []
+        for keyword in keywords:
+            phrase = normalize_phrase(keyword)
+            if phrase and phrase not in self.keywords:
+                self.keywords.append(phrase)
+        if not self.keywords:
+            self._pattern = re.compile(r'(?!)')
+        else:
+            suffixes = '|'.join(sorted(INFLECTIONS, key=len, reverse=True))
+            # The leading boundary is checked per hit in `_matches`: a lookbehind here would stop
+            # the engine skipping ahead to the phrases' first letters
+            self._pattern = re.compile(f'(?P<phrase>{_trie_pattern(self.keywords)})(?:{suffixes})?(?!{_WORD_CHAR})')
+        anchors = {_anchor(phrase) for phrase in self.keywords}
+        self._anchors = sorted(anchors) if len(anchors) <= prefilter_limit else None
+
+    def _candidate(self, text: str) -> Optional[str]:
+        """Lowercased text when it could contain a phrase, else None"""
+        if not text:
+            return None
+        lowered = text.lower()
+        if len(lowered) != len(text):
+            # A few characters lowercase to several; keep offsets aligned
+            lowered = ''.join(ch.lower()[0] for ch in text)
+        if self._anchors is not None and not any(anchor in lowered for anchor in self._anchors):
+            return None
+        return lowered
+
+    def _matches(self, lowered: str) -> Iterator[re.Match]:
+        pos = 0
+        while True:
+            match = self._pattern.search(lowered, pos)
+            if match is None:
+                return
+            start = match.start()
+            if start and _WORD_JOINED.match(lowered, start - 1):
+                pos = start + 1  # starts mid-word; look again from the next character
+                continue
+            yield match
+            pos = match.end()
+
+    def find_all(self, text: str) -> List[KeywordMatch]:
+        """Non-overlapping phrase occurrences in `text`, left to right"""
+        lowered = self._candidate(text)
+        if lowered is None:
+            return []
+        return [
+            KeywordMatch(normalize_phrase(match.group('phrase')), match.start(), match.end())
+            for match in self._matches(lowered)
+        ]
+
+    def search(self, text: str) -> bool:
+        """Whether any phrase occurs, stopping at the first hit"""
+        lowered = self._candidate(text)
+        return lowered is not None and next(self._matches(lowered), None) is not None
+
+
+CRISIS_MATCHER = KeywordMatcher(CRISIS_KEYWORDS)
+
+
+def find_crisis_keywords(text: str) -> List[KeywordMatch]:
+    return CRISIS_MATCHER.find_all(text)
@@ -0,0 +1,50 @@
+"""Per-user custom mood lookups.
+
+Resolved custom moods are cached per user, so validating or enriching a
+known mood id usually costs no query at all. Anything not cached is fetched
+with a single `$in` query. Misses are never cached: a mood created on
+another worker must be accepted straight away, and custom moods are never
+deleted, so a cached hit cannot go stale.
+"""
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable
+
+
+class CustomMoodCache:
+    """LRU of user_id -> {mood_id: custom mood document}"""
+
+    def __init__(self, max_users: int = 5000, ttl_seconds: float = 300.0):
+        self.max_users = max_users
+        self.ttl_seconds = ttl_seconds
+        self._users: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def _moods_for(self, user_id: str) -> Dict[str, dict]:
+        cached = self._users.get(user_id)
+        if cached is None or time.monotonic() - cached[1] > self.ttl_seconds:
+            moods = {}
+            self._users[user_id] = (moods, time.monotonic())
+        else:
+            moods = cached[0]
+        self._users.move_to_end(user_id)
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+        return moods
+
+    async def resolve(self, db, user_id: str, mood_ids: Iterable[str]) -> Dict[str, dict]:
+        """Custom mood documents for whichever of `mood_ids` the user owns"""
+        moods = self._moods_for(user_id)
+        missing = [mood_id for mood_id in set(mood_ids) if mood_id not in moods]
+        if missing:
+            found = await db.custom_moods.find(
+                {'user_id': user_id, 'id': {'$in': missing}}, {'_id': 0}
+            ).to_list(length=len(missing))
+            for mood in found:
+                moods[mood['id']] = mood
+        return {mood_id: moods[mood_id] for mood_id in mood_ids if mood_id in moods}
+
+    async def exists(self, db, user_id: str, mood_id: str) -> bool:
+        return mood_id in await self.resolve(db, user_id, [mood_id])
+
+    def invalidate(self, user_id: str):
+        self._users.pop(user_id, None)
@@ -0,0 +1,289 @@
+"""Streaming mood history exports.
+
+Exports iterate the Motor cursor batch by batch and yield encoded chunks as
+they go, so memory stays flat however long a user's history is.
+
+Besides CSV, the history can be exported as NDJSON, Parquet or an Arrow IPC
+stream. Those flatten the nested weather, location, activity_data and
+sleep_data dicts into typed columns (`weather_condition`, `location_lat`,
+...). Parquet and Arrow need pyarrow.
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime
+from typing import AsyncIterator, Dict, List, Optional
+
+from models import MOODS
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - optional dependency
+    pa = None
+    pq = None
+
+EXPORT_BATCH_SIZE = 500
+COLUMNAR_BATCH_SIZE = 5000  # rows per Parquet row group / Arrow record batch
+
+CSV_COLUMNS = [
+    'Date', 'Mood', 'Emoji', 'Category', 'Intensity', 'Note',
+    'Weather', 'Location', 'Tags', 'Voice Note', 'Photo',
+    'Activity Data', 'Sleep Data', 'Timestamp'
+]
+
+
+def csv_row(entry: dict) -> List:
+    mood_data = MOODS.get(entry['mood_id'], {})
+    return [
+        entry.get('date', ''),
+        mood_data.get('label', entry.get('mood_id', '')),
+        mood_data.get('emoji', ''),
+        mood_data.get('category', 'neutral'),
+        entry.get('intensity', 3),
+        entry.get('note', ''),
+        json.dumps(entry.get('weather', {})) if entry.get('weather') else '',
+        json.dumps(entry.get('location', {})) if entry.get('location') else '',
+        ','.join(entry.get('tags', [])),
+        'Yes' if entry.get('voice_note_url') else 'No',
+        'Yes' if entry.get('photo_url') else 'No',
+        json.dumps(entry.get('activity_data', {})) if entry.get('activity_data') else '',
+        json.dumps(entry.get('sleep_data', {})) if entry.get('sleep_data') else '',
+        entry.get('timestamp', '').strftime('%Y-%m-%d %H:%M:%S') if isinstance(entry.get('timestamp'), datetime) else str(entry.get('timestamp', ''))
+    ]
+
+
+async def iter_csv(cursor, batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[bytes]:
+    """UTF-8 CSV chunks, one per `batch_size` entries"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+
+    pending = 0
+    async for entry in cursor:
+        writer.writerow(csv_row(entry))
+        pending += 1
+        if pending >= batch_size:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+async def gzip_chunks(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Compress a chunk stream into a single gzip member"""
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    if not accept_encoding:
+        return False
+    for coding in accept_encoding.split(','):
+        name, _, params = coding.strip().partition(';')
+        if name.strip().lower() == 'gzip':
+            return params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000')
+    return False
+
+
+# Nested entry fields and the column prefix their keys are flattened under
+NESTED_FIELDS = {
+    'weather': 'weather',
+    'location': 'location',
+    'activity_data': 'activity',
+    'sleep_data': 'sleep'
+}
+
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows')
+}
+COLUMNAR_FORMATS = ('parquet', 'arrow')
+
+
+def parse_entry_date(value) -> Optional[date]:
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def flat_record(entry: dict) -> dict:
+    """One export row with nested dicts spread into prefixed columns"""
+    mood_data = MOODS.get(entry['mood_id'], {})
+    record = {
+        'id': entry.get('id'),
+        'date': entry.get('date'),
+        'mood_id': entry['mood_id'],
+        'mood_label': mood_data.get('label', entry['mood_id']),
+        'mood_emoji': mood_data.get('emoji'),
+        'mood_category': mood_data.get('category', 'neutral'),
+        'intensity': entry.get('intensity', 3),
+        'note': entry.get('note', ''),
+        'tags': list(entry.get('tags') or []),
+        'voice_note_url': entry.get('voice_note_url'),
+        'photo_url': entry.get('photo_url'),
+        'is_private': entry.get('is_private', False),
+        'timestamp': entry.get('timestamp'),
+        'created_at': entry.get('created_at'),
+        'updated_at': entry.get('updated_at')
+    }
+    for field, prefix in NESTED_FIELDS.items():
+        nested = entry.get(field)
+        if isinstance(nested, dict):
+            for key, value in nested.items():
+                record[f'{prefix}_{key}'] = value
+    return record
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+async def iter_ndjson(cursor, batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[bytes]:
+    """One flattened JSON object per line"""
+    lines = []
+    async for entry in cursor:
+        lines.append(json.dumps(flat_record(entry), default=_json_default, ensure_ascii=False))
+        if len(lines) >= batch_size:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+            lines = []
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+async def nested_key_types(db, query: dict) -> Dict[str, set]:
+    """Flattened column name -> BSON type names seen, computed server side"""
+    columns = {}
+    for field, prefix in NESTED_FIELDS.items():
+        pipeline = [
+            {'$match': {**query, field: {'$type': 'object'}}},
+            {'$project': {'_id': 0, 'pairs': {'$objectToArray': f'${field}'}}},
+            {'$unwind': '$pairs'},
+            {'$group': {'_id': '$pairs.k', 'types': {'$addToSet': {'$type': '$pairs.v'}}}}
+        ]
+        async for row in db.mood_entries.aggregate(pipeline):
+            columns[f"{prefix}_{row['_id']}"] = set(row['types']) - {'null'}
+    return columns
+
+
+def _arrow_type(bson_types: set):
+    if not bson_types:
+        return pa.string()
+    if bson_types <= {'int', 'long'}:
+        return pa.int64()
+    if bson_types <= {'int', 'long', 'double'}:
+        return pa.float64()
+    if bson_types == {'bool'}:
+        return pa.bool_()
+    if bson_types == {'string'}:
+        return pa.string()
+    if bson_types == {'date'}:
+        return pa.timestamp('ms')
+    return None  # objects, arrays and mixed types are exported as JSON text
+
+
+def export_schema(nested_types: Dict[str, set]):
+    """Arrow schema for flat_record rows; also returns the JSON-text columns"""
+    fields = [
+        pa.field('id', pa.string()),
+        pa.field('date', pa.date32()),
+        pa.field('mood_id', pa.string()),
+        pa.field('mood_label', pa.string()),
+        pa.field('mood_emoji', pa.string()),
+        pa.field('mood_category', pa.dictionary(pa.int8(), pa.string())),
+        pa.field('intensity', pa.int8()),
+        pa.field('note', pa.string()),
+        pa.field('tags', pa.list_(pa.string())),
+        pa.field('voice_note_url', pa.string()),
+        pa.field('photo_url', pa.string()),
+        pa.field('is_private', pa.bool_()),
+        pa.field('timestamp', pa.timestamp('ms')),
+        pa.field('created_at', pa.timestamp('ms')),
+        pa.field('updated_at', pa.timestamp('ms'))
+    ]
+    json_columns = set()
+    for column in sorted(nested_types):
+        arrow_type = _arrow_type(nested_types[column])
+        if arrow_type is None:
+            arrow_type = pa.string()
+            json_columns.add(column)
+        fields.append(pa.field(column, arrow_type))
+    return pa.schema(fields), json_columns
+
+
+def _typed_record(entry: dict, json_columns: set) -> dict:
+    record = flat_record(entry)
+    record['date'] = parse_entry_date(record['date'])
+    for column in json_columns:
+        if record.get(column) is not None:
+            record[column] = json.dumps(record[column], default=_json_default)
+    return record
+
+
+class _ChunkSink:
+    """Write-only file object that hands back whatever was written since the last drain"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self) -> bool:
+        return True
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+async def iter_columnar(cursor, schema, json_columns: set, export_format: str,
+                        batch_size: int = COLUMNAR_BATCH_SIZE) -> AsyncIterator[bytes]:
+    """Parquet (one row group per batch) or Arrow IPC stream chunks"""
+    sink = _ChunkSink()
+    stream = pa.PythonFile(sink, mode='w')
+    if export_format == 'parquet':
+        writer = pq.ParquetWriter(stream, schema, compression='zstd')
+    else:
+        writer = pa.ipc.new_stream(stream, schema, options=pa.ipc.IpcWriteOptions(compression='zstd'))
+
+    records = []
+    async for entry in cursor:
+        records.append(_typed_record(entry, json_columns))
+        if len(records) >= batch_size:
+            writer.write_batch(pa.RecordBatch.from_pylist(records, schema=schema))
+            records = []
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    if records:
+        writer.write_batch(pa.RecordBatch.from_pylist(records, schema=schema))
+    writer.close()
+    yield sink.drain()
@@ -0,0 +1,114 @@
+"""In-memory friend graph.
+
+Each user's adjacency (accepted friends, followers who accepted them,
+pending requests in and out) is loaded from `friends` with two indexed
+queries on first use and then served from memory. Writes made through the
+graph update the cached adjacency of both users; the TTL bounds how stale
+a worker can be about writes made elsewhere. `connected` only trusts a
+cached positive: a negative is confirmed against `friends`, since acting
+on a stale one would insert a duplicate request.
+"""
+import time
+from collections import OrderedDict
+from typing import Set
+
+
+class Adjacency:
+    __slots__ = ('accepted', 'followers', 'pending_in', 'pending_out', 'loaded_at')
+
+    def __init__(self):
+        self.accepted: Set[str] = set()     # users this user lists as friends
+        self.followers: Set[str] = set()    # users listing this user as a friend (feed audience)
+        self.pending_in: Set[str] = set()
+        self.pending_out: Set[str] = set()
+        self.loaded_at = time.monotonic()
+
+    def connected(self, other_id: str) -> bool:
+        """Any relationship or pending request in either direction"""
+        return (other_id in self.accepted or other_id in self.followers
+                or other_id in self.pending_in or other_id in self.pending_out)
+
+
+class FriendGraph:
+    """LRU of user_id -> Adjacency"""
+
+    def __init__(self, max_users: int = 20000, ttl_seconds: float = 300.0):
+        self.max_users = max_users
+        self.ttl_seconds = ttl_seconds
+        self._users: "OrderedDict[str, Adjacency]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def _load(self, db, user_id: str) -> Adjacency:
+        adjacency = Adjacency()
+        async for edge in db.friends.find({'user_id': user_id}, {'_id': 0, 'friend_id': 1, 'status': 1}):
+            if edge.get('status') == 'accepted':
+                adjacency.accepted.add(edge['friend_id'])
+            elif edge.get('status') == 'pending':
+                adjacency.pending_out.add(edge['friend_id'])
+        async for edge in db.friends.find({'friend_id': user_id}, {'_id': 0, 'user_id': 1, 'status': 1}):
+            if edge.get('status') == 'accepted':
+                adjacency.followers.add(edge['user_id'])
+            elif edge.get('status') == 'pending':
+                adjacency.pending_in.add(edge['user_id'])
+        return adjacency
+
+    async def adjacency(self, db, user_id: str) -> Adjacency:
+        adjacency = self._users.get(user_id)
+        if adjacency is not None and time.monotonic() - adjacency.loaded_at <= self.ttl_seconds:
+            self.hits += 1
+            self._users.move_to_end(user_id)
+            return adjacency
+
+        self.misses += 1
+        adjacency = await self._load(db, user_id)
+        self._users[user_id] = adjacency
+        self._users.move_to_end(user_id)
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+        return adjacency
+
+    async def connected(self, db, user_id: str, other_id: str) -> bool:
+        if (await self.adjacency(db, user_id)).connected(other_id):
+            return True
+        edge = await db.friends.find_one({'$or': [
+            {'user_id': user_id, 'friend_id': other_id},
+            {'user_id': other_id, 'friend_id': user_id}
+        ]}, {'_id': 1})
+        if edge is None:
+            return False
+        # Written by another worker since these were loaded
+        self._users.pop(user_id, None)
+        self._users.pop(other_id, None)
+        return True
+
+    async def friend_ids(self, db, user_id: str) -> Set[str]:
+        return set((await self.adjacency(db, user_id)).accepted)
+
+    async def audience(self, db, user_id: str) -> Set[str]:
+        """Users whose feed should show this user's items"""
+        return set((await self.adjacency(db, user_id)).followers)
+
+    async def add_request(self, db, request: dict):
+        """Insert a pending request and update both users' cached adjacency.
+
+        Raises `DuplicateKeyError` when the pair already has a row.
+        """
+        await db.friends.insert_one(dict(request))
+        sender = self._users.get(request['user_id'])
+        if sender is not None:
+            sender.pending_out.add(request['friend_id'])
+        recipient = self._users.get(request['friend_id'])
+        if recipient is not None:
+            recipient.pending_in.add(request['user_id'])
+
+    def metrics(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'users': len(self._users),
+            'max_users': self.max_users,
+            'ttl_seconds': self.ttl_seconds,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+        }
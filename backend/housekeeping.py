@@ -0,0 +1,168 @@
+"""Periodic purging of dead rows.
+
+Every `interval` seconds one worker (whichever takes the lease in
+`housekeeping_leases`) walks the retention policies and deletes what they
+match in bounded batches, pausing between batches so a large backlog never
+holds a long write lock or starves request traffic. Policies with an
+`archive` collection copy each batch there before deleting it.
+
+Expired sessions are normally removed by the `expires_at` TTL index; the
+sweep here is a backstop for deployments where that index is missing.
+Only read notifications are purged, so unread counters stay exact.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from pymongo import ReplaceOne
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+LEASE_COLLECTION = 'housekeeping_leases'
+
+
+class RetentionPolicy(NamedTuple):
+    name: str
+    collection: str
+    query: Callable[[datetime], dict]  # now -> filter for the rows to purge
+    archive: Optional[str] = None
+
+
+def default_policies(notification_days: int = 90, report_days: int = 365,
+                     payment_days: int = 365) -> List[RetentionPolicy]:
+    return [
+        RetentionPolicy('expired_sessions', 'user_sessions', lambda now: {'expires_at': {'$lt': now}}),
+        RetentionPolicy('inactive_sessions', 'user_sessions', lambda now: {'is_active': False}),
+        RetentionPolicy('read_notifications', 'notifications', lambda now: {
+            'read': True, 'timestamp': {'$lt': now - timedelta(days=notification_days)}
+        }),
+        RetentionPolicy('weekly_reports', 'weekly_reports', lambda now: {
+            'generated_at': {'$lt': now - timedelta(days=report_days)}
+        }),
+        RetentionPolicy('payment_transactions', 'payment_transactions', lambda now: {
+            'updated_at': {'$lt': now - timedelta(days=payment_days)}
+        }, archive='payment_transactions_archive'),
+    ]
+
+
+class Housekeeper:
+    """Runs the retention policies on a schedule and keeps per-policy metrics"""
+
+    def __init__(self, db, policies: List[RetentionPolicy], interval: float = 3600.0,
+                 batch_size: int = 1000, max_batches: int = 100, pause: float = 0.05):
+        self.db = db
+        self.policies = policies
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_batches = max_batches  # per policy per run; the rest waits for the next run
+        self.pause = pause
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.last_run_at: Optional[datetime] = None
+        self.purged: Dict[str, int] = {policy.name: 0 for policy in policies}
+        self.last_run: Dict[str, dict] = {}
+        self.sizes: Dict[str, dict] = {}
+
+    def start(self):
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                if await self._take_lease():
+                    await self.run_once()
+            except Exception as e:
+                logger.error(f"Housekeeping run failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    async def _take_lease(self) -> bool:
+        """One worker per interval does the sweep"""
+        now = datetime.utcnow()
+        try:
+            await self.db[LEASE_COLLECTION].find_one_and_update(
+                {'_id': 'housekeeping', 'until': {'$lte': now}},
+                {'$set': {'until': now + timedelta(seconds=self.interval * 0.9)}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            # The lease exists and hasn't run out, so the upsert tried to insert a second one
+            return False
+
+    async def purge(self, policy: RetentionPolicy, now: datetime) -> int:
+        collection = self.db[policy.collection]
+        query = policy.query(now)
+        purged = 0
+        for _ in range(self.max_batches):
+            projection = None if policy.archive else {'_id': 1}
+            batch = await collection.find(query, projection).limit(self.batch_size).to_list(length=self.batch_size)
+            if not batch:
+                break
+            if policy.archive:
+                # Idempotent, so a batch interrupted between copy and delete is safe to redo
+                await self.db[policy.archive].bulk_write(
+                    [ReplaceOne({'_id': doc['_id']}, doc, upsert=True) for doc in batch], ordered=False
+                )
+            result = await collection.delete_many({'_id': {'$in': [doc['_id'] for doc in batch]}})
+            purged += result.deleted_count
+            if len(batch) < self.batch_size:
+                break
+            await asyncio.sleep(self.pause)
+        return purged
+
+    async def run_once(self) -> Dict[str, int]:
+        """Apply every policy once, returning rows purged per policy"""
+        now = datetime.utcnow()
+        results = {}
+        for policy in self.policies:
+            started = time.perf_counter()
+            try:
+                purged = await self.purge(policy, now)
+            except Exception as e:
+                logger.error(f"Housekeeping policy {policy.name} failed: {str(e)}")
+                continue
+            seconds = time.perf_counter() - started
+            results[policy.name] = purged
+            self.purged[policy.name] += purged
+            self.last_run[policy.name] = {
+                'purged': purged,
+                'seconds': round(seconds, 3),
+                'rows_per_second': round(purged / seconds, 1) if seconds else 0.0
+            }
+        self.runs += 1
+        self.last_run_at = now
+        await self.refresh_sizes()
+        if any(results.values()):
+            logger.info(f"Housekeeping purged {results}")
+        return results
+
+    async def refresh_sizes(self):
+        names = {policy.collection for policy in self.policies}
+        names.update(policy.archive for policy in self.policies if policy.archive)
+        for name in sorted(names):
+            try:
+                stats = await self.db.command('collStats', name)
+                self.sizes[name] = {'count': stats.get('count', 0), 'size_bytes': stats.get('size', 0),
+                                    'storage_bytes': stats.get('storageSize', 0)}
+            except Exception:
+                self.sizes[name] = {'count': await self.db[name].estimated_document_count()}
+
+    def metrics(self) -> dict:
+        return {
+            'interval_seconds': self.interval,
+            'runs': self.runs,
+            'last_run_at': self.last_run_at.isoformat() if self.last_run_at else None,
+            'purged_total': dict(self.purged),
+            'last_run': dict(self.last_run),
+            'collections': dict(self.sizes)
+        }
@@ -0,0 +1,128 @@
+"""Shared outbound HTTP client.
+
+One `aiohttp.ClientSession` per worker, opened at startup, so auth calls to
+Google and Emergent reuse kept-alive connections and cached DNS answers
+instead of paying for a fresh TCP+TLS handshake on every login. Transient
+failures are retried with exponential backoff; POSTs are only retried when
+the connection failed before the request was sent, since a token exchange
+code can only be redeemed once.
+"""
+import asyncio
+import logging
+import random
+from typing import Any, Optional, Tuple
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'})
+
+
+class HttpClientPool:
+    """Keep-alive connection pool with per-host limits, DNS cache, timeouts and retries"""
+
+    def __init__(
+        self,
+        limit: int = 100,
+        limit_per_host: int = 20,
+        dns_ttl: int = 300,
+        keepalive_timeout: float = 30.0,
+        connect_timeout: float = 5.0,
+        total_timeout: float = 15.0,
+        retries: int = 2,
+        backoff: float = 0.2
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_ttl = dns_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = aiohttp.ClientTimeout(total=total_timeout, connect=connect_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.requests = 0
+        self.retried = 0
+        self.failures = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        trace = aiohttp.TraceConfig()
+
+        async def created(session, context, params):
+            self.connections_created += 1
+
+        async def reused(session, context, params):
+            self.connections_reused += 1
+
+        trace.on_connection_create_end.append(created)
+        trace.on_connection_reuseconn.append(reused)
+        return trace
+
+    async def start(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.dns_ttl,
+                keepalive_timeout=self.keepalive_timeout
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=self.timeout, trace_configs=[self._trace_config()]
+            )
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            raise RuntimeError("HttpClientPool used before start()")
+        return self._session
+
+    async def request_json(self, method: str, url: str, **kwargs) -> Tuple[int, Any]:
+        """(status, decoded JSON body or None), retrying transient failures"""
+        if self._session is None:
+            await self.start()
+        method = method.upper()
+        idempotent = method in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            self.requests += 1
+            try:
+                async with self.session.request(method, url, **kwargs) as response:
+                    if response.status in RETRY_STATUSES and idempotent and attempt < self.retries:
+                        await response.release()
+                        raise _Retry(f"HTTP {response.status}")
+                    if response.status != 200:
+                        return response.status, None
+                    return response.status, await response.json(content_type=None)
+            except (_Retry, aiohttp.ClientConnectorError, asyncio.TimeoutError, aiohttp.ServerDisconnectedError) as e:
+                # A connect failure never reached the server; anything later only retries when idempotent
+                retryable = isinstance(e, (_Retry, aiohttp.ClientConnectorError)) or idempotent
+                if not retryable or attempt >= self.retries:
+                    self.failures += 1
+                    raise
+                delay = self.backoff * (2 ** attempt) * (0.5 + random.random())
+                logger.warning(f"Retrying {method} {url.split('?')[0]} in {delay:.2f}s: {str(e) or type(e).__name__}")
+                attempt += 1
+                self.retried += 1
+                await asyncio.sleep(delay)
+
+    def metrics(self) -> dict:
+        return {
+            'requests': self.requests,
+            'retried': self.retried,
+            'failures': self.failures,
+            'connections_created': self.connections_created,
+            'connections_reused': self.connections_reused,
+            'limit_per_host': self.limit_per_host
+        }
+
+
+class _Retry(Exception):
+    pass
@@ -0,0 +1,266 @@
+"""Bulk mood history import.
+
+The request body is streamed and parsed row by row: CSV in the layout
+`iter_csv` exports, or NDJSON with either `MoodEntryCreate` fields or the
+flattened columns `iter_ndjson` exports. Each row is validated with
+`MoodEntryCreate` and becomes the same upsert `POST /moods` makes for a
+day, and the upserts are written with unordered `bulk_write` calls of
+`IMPORT_BATCH_SIZE`. Invalid rows are skipped and reported by line number.
+A line or CSV record longer than `MAX_RECORD_SIZE` characters aborts the
+import with `ImportRecordTooLarge` instead of being buffered.
+
+Nothing per-row happens beyond the write: crisis checks are not run on
+historical notes, and rollups, streaks and achievements are rebuilt once
+afterwards by `rebuild_derived_state`. Callers run that even when the import
+aborts part way, since the batches before the failure are already written.
+"""
+import codecs
+import csv
+import json
+import uuid
+from datetime import datetime, time
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+from pydantic import ValidationError
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from achievements import claim_achievements, evaluate_achievements, rebuild_achievement_progress
+from exports import CSV_COLUMNS, NESTED_FIELDS, parse_entry_date
+from models import MOODS, MoodEntryCreate
+from rollups import rebuild_user_rollup
+from streaks import recompute_streak, streak_summary
+
+IMPORT_BATCH_SIZE = 1000
+IMPORT_FORMATS = {
+    'csv': ('text/csv',),
+    'ndjson': ('application/x-ndjson', 'application/jsonl', 'application/json'),
+}
+MAX_REPORTED_ERRORS = 100
+MAX_RECORD_SIZE = 64 * 1024  # characters per line, or per CSV record with multi-line cells
+
+MOOD_IDS_BY_LABEL = {data['label'].lower(): mood_id for mood_id, data in MOODS.items()}
+
+# CSV column -> MoodEntryCreate field for the JSON-encoded nested columns
+CSV_JSON_COLUMNS = {'Weather': 'weather', 'Location': 'location', 'Activity Data': 'activity_data', 'Sleep Data': 'sleep_data'}
+
+
+class ImportRecordTooLarge(ValueError):
+    def __init__(self, line: int, max_size: int):
+        super().__init__(f"Line {line} is longer than {max_size} characters")
+        self.line = line
+
+
+def import_format(requested: Optional[str], content_type: Optional[str]) -> Optional[str]:
+    """'csv' or 'ndjson' from the `format` parameter, else the Content-Type"""
+    if requested:
+        return requested if requested in IMPORT_FORMATS else None
+    media_type = (content_type or '').split(';')[0].strip().lower()
+    for name, media_types in IMPORT_FORMATS.items():
+        if media_type in media_types:
+            return name
+    return None
+
+
+def mood_id_for(value: str) -> str:
+    """Exports write the label for built-in moods and the id for custom ones"""
+    value = value.strip()
+    if value in MOODS:
+        return value
+    return MOOD_IDS_BY_LABEL.get(value.lower(), value)
+
+
+def parse_timestamp(value: str) -> Optional[datetime]:
+    for parse in (lambda v: datetime.strptime(v, '%Y-%m-%d %H:%M:%S'), datetime.fromisoformat):
+        try:
+            return parse(value)
+        except ValueError:
+            continue
+    return None
+
+
+def csv_record(row: Dict[str, str]) -> dict:
+    """`MoodEntryCreate` fields from an exported CSV row; blank cells are left unset"""
+    record = {'date': (row.get('Date') or '').strip(), 'mood_id': mood_id_for(row.get('Mood') or '')}
+    if row.get('Intensity'):
+        record['intensity'] = row['Intensity']
+    if row.get('Note'):
+        record['note'] = row['Note']
+    if row.get('Tags'):
+        record['tags'] = [tag.strip() for tag in row['Tags'].split(',') if tag.strip()]
+    for column, field in CSV_JSON_COLUMNS.items():
+        if row.get(column):
+            record[field] = json.loads(row[column])
+    if row.get('Timestamp'):
+        timestamp = parse_timestamp(row['Timestamp'])
+        if timestamp is None:
+            raise ValueError(f"Unrecognised timestamp {row['Timestamp']!r}")
+        record['timestamp'] = timestamp
+    return record
+
+
+def ndjson_record(obj: dict) -> dict:
+    """`MoodEntryCreate` fields from an NDJSON object, folding flattened export columns back up"""
+    if not isinstance(obj, dict):
+        raise ValueError("Each line must be a JSON object")
+    record = {key: value for key, value in obj.items() if key in MoodEntryCreate.model_fields and value is not None}
+    for field, prefix in NESTED_FIELDS.items():
+        if field in record:
+            continue
+        nested = {key[len(prefix) + 1:]: value for key, value in obj.items()
+                  if key.startswith(prefix + '_') and value is not None}
+        if nested:
+            record[field] = nested
+    return record
+
+
+async def iter_lines(chunks: AsyncIterator[bytes], max_size: int = MAX_RECORD_SIZE) -> AsyncIterator[str]:
+    """Decoded lines (endings kept) from a byte stream, tolerating a UTF-8 BOM"""
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    pending = ''
+    line_no = 0
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        lines = pending.splitlines(keepends=True)
+        # The last piece may be an incomplete line
+        pending = lines.pop() if lines and not lines[-1].endswith(('\n', '\r')) else ''
+        for line in lines:
+            line_no += 1
+            if len(line) > max_size:
+                raise ImportRecordTooLarge(line_no, max_size)
+            yield line
+        if len(pending) > max_size:
+            raise ImportRecordTooLarge(line_no + 1, max_size)
+    pending += decoder.decode(b'', final=True)
+    if len(pending) > max_size:
+        raise ImportRecordTooLarge(line_no + 1, max_size)
+    if pending:
+        yield pending
+
+
+async def iter_csv_records(chunks: AsyncIterator[bytes], max_size: int = MAX_RECORD_SIZE) -> AsyncIterator[Tuple[int, object]]:
+    """(line number, record or exception); quoted cells may span lines"""
+    header = None
+    record_text, record_line, line_no = '', 0, 0
+    async for line in iter_lines(chunks, max_size):
+        line_no += 1
+        if not record_text:
+            record_line = line_no
+        record_text += line
+        if len(record_text) > max_size:
+            raise ImportRecordTooLarge(record_line, max_size)
+        if record_text.count('"') % 2:
+            continue  # inside a quoted cell
+        text, record_text = record_text, ''
+        if not text.strip():
+            continue
+        values = next(csv.reader([text]))
+        if header is None:
+            header = [value.strip() for value in values]
+            if 'Date' not in header or 'Mood' not in header:
+                yield record_line, ValueError(f"CSV header must include Date and Mood (export columns: {', '.join(CSV_COLUMNS)})")
+                return
+            continue
+        try:
+            yield record_line, csv_record(dict(zip(header, values)))
+        except ValueError as e:
+            yield record_line, e
+    if record_text:
+        yield record_line, ValueError("Unterminated quoted cell")
+
+
+async def iter_ndjson_records(chunks: AsyncIterator[bytes], max_size: int = MAX_RECORD_SIZE) -> AsyncIterator[Tuple[int, object]]:
+    line_no = 0
+    async for line in iter_lines(chunks, max_size):
+        line_no += 1
+        if not line.strip():
+            continue
+        try:
+            yield line_no, ndjson_record(json.loads(line))
+        except ValueError as e:
+            yield line_no, e
+
+
+def entry_upsert(user_id: str, entry: MoodEntryCreate, now: datetime) -> UpdateOne:
+    """The write `POST /moods` makes for the entry's day"""
+    set_fields = entry.dict(exclude_unset=True)
+    set_fields['user_id'] = user_id
+    set_fields['updated_at'] = now
+    set_on_insert = {'id': str(uuid.uuid4()), 'created_at': now}
+    if not set_fields.get('timestamp'):
+        # Midday on the entry's own date rather than the import time, which would skew time-of-day achievements
+        set_fields.pop('timestamp', None)
+        set_on_insert['timestamp'] = datetime.combine(parse_entry_date(entry.date), time(12))
+    return UpdateOne({'user_id': user_id, 'date': entry.date}, {'$set': set_fields, '$setOnInsert': set_on_insert}, upsert=True)
+
+
+async def _write(db, operations: Iterable[UpdateOne], result: dict):
+    operations = list(operations)
+    if not operations:
+        return
+    try:
+        outcome = (await db.mood_entries.bulk_write(operations, ordered=False)).bulk_api_result
+    except BulkWriteError as e:
+        outcome = e.details
+        for error in outcome.get('writeErrors', []):
+            _error(result, None, error.get('errmsg', 'Write failed'))
+    result['inserted'] += outcome.get('nUpserted', 0)
+    result['updated'] += outcome.get('nMatched', 0)
+
+
+def _error(result: dict, line: Optional[int], message: str):
+    result['skipped'] += 1
+    if len(result['errors']) < MAX_REPORTED_ERRORS:
+        result['errors'].append({'line': line, 'error': message})
+
+
+def new_import_result() -> dict:
+    return {'rows': 0, 'inserted': 0, 'updated': 0, 'skipped': 0, 'truncated': False, 'errors': []}
+
+
+async def import_mood_entries(db, user_id: str, records: AsyncIterator[Tuple[int, object]], mood_ids: set,
+                              max_rows: int, batch_size: int = IMPORT_BATCH_SIZE, result: Optional[dict] = None) -> dict:
+    """Validate and bulk-upsert streamed records; returns counts and the first errors.
+
+    Pass `result` (from `new_import_result`) to keep the running counts if the
+    stream raises part way.
+    """
+    result = new_import_result() if result is None else result
+    now = datetime.utcnow()
+    batch: Dict[str, UpdateOne] = {}
+    async for line, record in records:
+        if result['rows'] >= max_rows:
+            result['truncated'] = True
+            break
+        result['rows'] += 1
+        if isinstance(record, Exception):
+            _error(result, line, str(record))
+            continue
+        try:
+            entry = MoodEntryCreate(**record)
+        except ValidationError as e:
+            _error(result, line, '; '.join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()))
+            continue
+        if parse_entry_date(entry.date) is None:
+            _error(result, line, f"Invalid date {entry.date!r}, expected YYYY-MM-DD")
+            continue
+        if entry.mood_id not in mood_ids:
+            _error(result, line, f"Unknown mood {entry.mood_id!r}")
+            continue
+
+        # Keyed by day so a file repeating a date upserts it once (last row wins)
+        batch[entry.date] = entry_upsert(user_id, entry, now)
+        if len(batch) >= batch_size:
+            await _write(db, batch.values(), result)
+            batch = {}
+    await _write(db, batch.values(), result)
+    return result
+
+
+async def rebuild_derived_state(db, user_id: str) -> Tuple[dict, List[str]]:
+    """Rebuild the rollup, streak and achievement progress bulk writes bypass; returns the streak and newly claimed achievements"""
+    await rebuild_user_rollup(db, user_id)
+    streak = streak_summary(await recompute_streak(db, user_id))
+    progress = await rebuild_achievement_progress(db, user_id)
+    unlocked = await claim_achievements(db, user_id, evaluate_achievements(progress, streak=streak))
+    return streak, unlocked
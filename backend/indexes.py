@@ -0,0 +1,256 @@
+"""Index declarations and query-plan self-check.
+
+`ensure_indexes` creates every index the endpoints rely on and is run from
+app startup. `verify_query_plans` explains each registered hot query and
+reports the ones MongoDB would answer with a COLLSCAN. Run
+`python indexes.py` to apply and check from the command line.
+
+Unique indexes cannot build over duplicate rows, and a failed build is
+only logged. `python indexes.py --dedupe-mood-entries` clears duplicate
+days from mood_entries. Duplicate emails in users or duplicate
+(user_id, friend_id) pairs in friends have to be merged by hand, because
+which row to keep is a product decision.
+"""
+import argparse
+import asyncio
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+PLAN_CHECK_DATE = datetime(2024, 1, 1)
+SESSION_TTL_GRACE_SECONDS = 0
+REVOCATION_RETENTION_SECONDS = 8 * 24 * 3600  # outlives the 7-day sessions it revokes
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    'mood_entries': [
+        IndexModel([('user_id', ASCENDING), ('date', ASCENDING)], name='user_date_unique', unique=True),
+        IndexModel([('user_id', ASCENDING), ('date', DESCENDING), ('id', DESCENDING)], name='user_date_id'),
+    ],
+    'user_sessions': [
+        IndexModel([('session_token', ASCENDING), ('is_active', ASCENDING), ('expires_at', ASCENDING)],
+                   name='token_active_expiry'),
+        IndexModel([('expires_at', ASCENDING)], name='expires_at_ttl', expireAfterSeconds=SESSION_TTL_GRACE_SECONDS),
+        # Logged-out sessions only, for housekeeping
+        IndexModel([('is_active', ASCENDING)], name='inactive', partialFilterExpression={'is_active': False}),
+    ],
+    'session_revocations': [
+        IndexModel([('revoked_at', ASCENDING)], name='revoked_at_ttl', expireAfterSeconds=REVOCATION_RETENTION_SECONDS),
+        # Only signed-token revocations carry an expiry; workers load the live ones at startup
+        IndexModel([('expires_at', ASCENDING)], name='expires_at', sparse=True),
+    ],
+    'users': [
+        IndexModel([('id', ASCENDING)], name='id_unique', unique=True),
+        # Unique so concurrent first logins upserting the same email can't create two users
+        IndexModel([('email', ASCENDING)], name='email_unique', unique=True),
+    ],
+    'notifications': [
+        IndexModel([('user_id', ASCENDING), ('timestamp', DESCENDING), ('id', DESCENDING)], name='user_timestamp_id'),
+        IndexModel([('user_id', ASCENDING), ('read', ASCENDING)], name='user_read'),
+        IndexModel([('id', ASCENDING)], name='id'),
+        IndexModel([('read', ASCENDING), ('timestamp', ASCENDING)], name='read_timestamp'),
+    ],
+    'weekly_reports': [
+        IndexModel([('generated_at', ASCENDING)], name='generated_at'),
+    ],
+    'notification_unread': [
+        IndexModel([('user_id', ASCENDING)], name='user_unique', unique=True),
+    ],
+    'friends': [
+        IndexModel([('user_id', ASCENDING), ('status', ASCENDING)], name='user_status'),
+        # Unique so two workers racing the same friend request can't both insert it
+        IndexModel([('user_id', ASCENDING), ('friend_id', ASCENDING)], name='user_friend_unique', unique=True),
+        IndexModel([('friend_id', ASCENDING), ('status', ASCENDING)], name='friend_status'),
+    ],
+    'social_feed': [
+        IndexModel([('user_id', ASCENDING), ('timestamp', DESCENDING)], name='user_timestamp'),
+        IndexModel([('id', ASCENDING)], name='id'),
+    ],
+    'feed_timelines': [
+        IndexModel([('user_id', ASCENDING)], name='user_unique', unique=True),
+    ],
+    'feed_pull_authors': [
+        IndexModel([('user_id', ASCENDING)], name='user_unique', unique=True),
+    ],
+    'payment_transactions': [
+        IndexModel([('session_id', ASCENDING)], name='session_id'),
+        IndexModel([('updated_at', ASCENDING)], name='updated_at'),
+    ],
+    'custom_moods': [
+        IndexModel([('user_id', ASCENDING), ('id', ASCENDING)], name='user_id_mood'),
+    ],
+    'meditation_sessions': [
+        IndexModel([('user_id', ASCENDING), ('completed', ASCENDING)], name='user_completed'),
+    ],
+    'achievements': [
+        IndexModel([('user_id', ASCENDING), ('achievement_id', ASCENDING)], name='user_achievement'),
+    ],
+    'user_mood_rollups': [
+        IndexModel([('user_id', ASCENDING)], name='user_unique', unique=True),
+    ],
+    'user_streaks': [
+        IndexModel([('user_id', ASCENDING)], name='user_unique', unique=True),
+    ],
+    'user_achievement_progress': [
+        IndexModel([('user_id', ASCENDING)], name='user_unique', unique=True),
+    ],
+    'background_jobs': [
+        IndexModel([('status', ASCENDING), ('run_after', ASCENDING)], name='status_run_after'),
+        IndexModel([('status', ASCENDING), ('locked_until', ASCENDING)], name='status_locked_until'),
+        IndexModel([('id', ASCENDING)], name='id_unique', unique=True),
+    ],
+}
+
+# (name, collection, filter, sort) for the queries every request depends on
+HOT_QUERIES: List[Tuple[str, str, dict, list]] = [
+    ('mood entries by user', 'mood_entries', {'user_id': 'plan-check'}, [('date', DESCENDING)]),
+    ('mood history page', 'mood_entries',
+     {'user_id': 'plan-check', '$or': [{'date': {'$lt': '2024-01-01'}}, {'date': '2024-01-01', 'id': {'$lt': 'plan-check'}}]},
+     [('date', DESCENDING), ('id', DESCENDING)]),
+    ('mood entry for a day', 'mood_entries', {'user_id': 'plan-check', 'date': '2024-01-01'}, []),
+    ('active session', 'user_sessions',
+     {'session_token': 'plan-check', 'is_active': True, 'expires_at': {'$gte': PLAN_CHECK_DATE}}, []),
+    ('notifications by user', 'notifications', {'user_id': 'plan-check'}, [('timestamp', DESCENDING), ('id', DESCENDING)]),
+    ('unread notifications', 'notifications', {'user_id': 'plan-check', 'read': False}, []),
+    ('accepted friends', 'friends', {'user_id': 'plan-check', 'status': 'accepted'}, []),
+    ('friendship pair', 'friends', {'user_id': 'plan-check', 'friend_id': 'plan-check'}, []),
+    ('social feed', 'social_feed', {'user_id': {'$in': ['plan-check']}}, [('timestamp', DESCENDING)]),
+    ('feed items by id', 'social_feed', {'id': {'$in': ['plan-check']}}, []),
+    ('feed timeline', 'feed_timelines', {'user_id': 'plan-check'}, []),
+    ('feed audience', 'friends', {'friend_id': 'plan-check', 'status': 'accepted'}, []),
+    ('payment by session', 'payment_transactions', {'session_id': 'plan-check'}, []),
+    ('user by email', 'users', {'email': 'plan-check'}, []),
+    ('stats rollup', 'user_mood_rollups', {'user_id': 'plan-check'}, []),
+    ('pending jobs', 'background_jobs', {'status': 'pending', 'run_after': {'$lte': PLAN_CHECK_DATE}}, [('run_after', ASCENDING)]),
+    ('expired job leases', 'background_jobs',
+     {'status': 'running', 'locked_until': {'$lt': PLAN_CHECK_DATE}}, [('locked_until', ASCENDING)]),
+]
+
+
+async def dedupe_mood_entries(db, dry_run: bool = False, batch_size: int = 1000) -> int:
+    """Delete all but the most recently updated entry per (user_id, day), returning how many go.
+
+    Legacy check-then-insert writes could store a day twice, which keeps
+    `user_date_unique` from building.
+    """
+    pipeline = [
+        {'$sort': {'updated_at': -1, '_id': -1}},
+        {'$group': {'_id': {'user_id': '$user_id', 'date': '$date'}, 'ids': {'$push': '$_id'}, 'count': {'$sum': 1}}},
+        {'$match': {'count': {'$gt': 1}}},
+    ]
+    removed, batch = 0, []
+    async for group in db.mood_entries.aggregate(pipeline, allowDiskUse=True):
+        batch.extend(group['ids'][1:])
+        if len(batch) >= batch_size:
+            removed += len(batch) if dry_run else (await db.mood_entries.delete_many({'_id': {'$in': batch}})).deleted_count
+            batch = []
+    if batch:
+        removed += len(batch) if dry_run else (await db.mood_entries.delete_many({'_id': {'$in': batch}})).deleted_count
+    return removed
+
+
+# Printed with a failed index when there is a scripted way to fix what blocks it
+REMEDIATION = {
+    'mood_entries.user_date_unique': "run `python indexes.py --dedupe-mood-entries` to keep the latest entry per day",
+}
+
+
+async def ensure_indexes(db) -> List[str]:
+    """Create every declared index, returning the names that failed"""
+    failed = []
+    for collection, models in INDEXES.items():
+        for model in models:
+            try:
+                await db[collection].create_indexes([model])
+            except OperationFailure as e:
+                # e.g. duplicate rows left over from before a unique index
+                name = f"{collection}.{model.document['name']}"
+                hint = f"; {REMEDIATION[name]}" if name in REMEDIATION else ''
+                logger.error(f"Could not create index {name}: {str(e)}{hint}")
+                failed.append(name)
+    return failed
+
+
+def _plan_stages(plan) -> List[str]:
+    stages = []
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            stages.append(plan['stage'])
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(_plan_stages(item))
+    return stages
+
+
+async def verify_query_plans(db) -> List[str]:
+    """Names of hot queries whose winning plan includes a COLLSCAN"""
+    collscans = []
+    for name, collection, query, sort in HOT_QUERIES:
+        find = {'find': collection, 'filter': query}
+        if sort:
+            find['sort'] = dict(sort)
+        explain = await db.command({'explain': find, 'verbosity': 'queryPlanner'})
+        if 'COLLSCAN' in _plan_stages(explain['queryPlanner']['winningPlan']):
+            collscans.append(name)
+    return collscans
+
+
+async def bootstrap_indexes(db, plan_check: str = 'warn'):
+    """Startup hook: create indexes, then check plans ('off', 'warn' or 'strict')"""
+    await ensure_indexes(db)
+    if plan_check == 'off':
+        return
+    collscans = await verify_query_plans(db)
+    if not collscans:
+        return
+    message = f"Hot queries would scan whole collections: {', '.join(collscans)}"
+    if plan_check == 'strict':
+        raise RuntimeError(message)
+    logger.warning(message)
+
+
+def main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description="Create MoodVerse indexes and check hot query plans")
+    parser.add_argument('--check-only', action='store_true', help="Skip index creation")
+    parser.add_argument('--dedupe-mood-entries', action='store_true',
+                        help="Before creating indexes, delete all but the latest mood entry per user and day")
+    parser.add_argument('--dry-run', action='store_true', help="With --dedupe-mood-entries, only count the duplicates")
+    args = parser.parse_args()
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+    db = client[os.environ.get('DB_NAME', 'test_database')]
+
+    async def run():
+        if args.dedupe_mood_entries:
+            removed = await dedupe_mood_entries(db, dry_run=args.dry_run)
+            print(f"Duplicate mood entries {'found' if args.dry_run else 'removed'}: {removed}")
+            if args.dry_run:
+                return 0
+        if not args.check_only:
+            failed = await ensure_indexes(db)
+            print(f"Indexes ensured ({len(failed)} failed)")
+        collscans = await verify_query_plans(db)
+        for name in collscans:
+            print(f"COLLSCAN: {name}")
+        return 1 if collscans else 0
+
+    try:
+        raise SystemExit(asyncio.run(run()))
+    finally:
+        client.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+"""In-process background jobs for work that shouldn't hold up a response.
+
+Handlers are registered by name and enqueued with keyword payloads. The
+default mode keeps jobs in an asyncio queue; the persistent mode stores them
+in the `background_jobs` collection so anything still pending at shutdown
+runs after the next start. A claimed job holds a lease; once it expires
+(its worker crashed or hung) any worker may claim the job again.
+"""
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+JOB_COLLECTION = 'background_jobs'
+
+JobHandler = Callable[..., Awaitable[None]]
+
+
+class JobQueue:
+    """Bounded-concurrency worker pool with retry and graceful drain"""
+
+    def __init__(self, db=None, concurrency: int = 4, max_attempts: int = 3, retry_delay: float = 0.5,
+                 persistent: bool = False, poll_interval: float = 1.0, lease_seconds: int = 300):
+        if persistent and db is None:
+            raise ValueError("Persistent job queue needs a database")
+        self.db = db
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.persistent = persistent
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.handlers: Dict[str, JobHandler] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._workers: List[asyncio.Task] = []
+        self._in_flight = 0
+        self._stopping = False
+
+    def register(self, name: str):
+        """Decorator registering an async handler under `name`"""
+        def decorator(handler: JobHandler) -> JobHandler:
+            self.handlers[name] = handler
+            return handler
+        return decorator
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    async def enqueue(self, name: str, **payload):
+        """Schedule a job; runs it inline if the workers aren't running"""
+        if name not in self.handlers:
+            raise KeyError(f"Unknown job: {name}")
+
+        if self.persistent:
+            now = datetime.utcnow()
+            await self.db[JOB_COLLECTION].insert_one({
+                'id': str(uuid.uuid4()),
+                'name': name,
+                'payload': payload,
+                'status': 'pending',
+                'attempts': 0,
+                'run_after': now,
+                'created_at': now
+            })
+            if self._wakeup:
+                self._wakeup.set()
+            return
+
+        if not self.running or self._stopping:
+            await self._run_with_retry(name, payload)
+            return
+        await self._queue.put((name, payload))
+
+    async def start(self):
+        if self.running:
+            return
+        self._stopping = False
+        if self.persistent:
+            self._wakeup = asyncio.Event()
+            worker = self._persistent_worker
+        else:
+            self._queue = asyncio.Queue()
+            worker = self._memory_worker
+        self._workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        logger.info(f"Background jobs started ({'persistent' if self.persistent else 'in-memory'}, {self.concurrency} workers)")
+
+    async def shutdown(self, timeout: float = 10.0):
+        """Stop taking new work and wait up to `timeout` for queued jobs to finish"""
+        if not self.running:
+            return
+        self._stopping = True
+        try:
+            if self.persistent:
+                self._wakeup.set()
+                await asyncio.wait_for(self._wait_idle(), timeout)
+            else:
+                await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            pending = 'left in the database' if self.persistent else f"{self._queue.qsize()} dropped"
+            logger.warning(f"Background jobs did not drain within {timeout}s ({pending})")
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def _wait_idle(self):
+        while self._in_flight:
+            await asyncio.sleep(0.05)
+
+    async def _run_with_retry(self, name: str, payload: dict) -> bool:
+        handler = self.handlers[name]
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                await handler(**payload)
+                return True
+            except Exception as e:
+                logger.error(f"Job {name} failed (attempt {attempt}/{self.max_attempts}): {str(e)}")
+                if attempt < self.max_attempts:
+                    await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+        return False
+
+    async def _memory_worker(self):
+        while True:
+            name, payload = await self._queue.get()
+            try:
+                await self._run_with_retry(name, payload)
+            finally:
+                self._queue.task_done()
+
+    async def _claim(self) -> Optional[dict]:
+        now = datetime.utcnow()
+        jobs = self.db[JOB_COLLECTION]
+        update = {
+            '$set': {'status': 'running', 'locked_until': now + timedelta(seconds=self.lease_seconds)},
+            '$inc': {'attempts': 1}
+        }
+        job = await jobs.find_one_and_update(
+            {'status': 'pending', 'run_after': {'$lte': now}}, update,
+            sort=[('run_after', 1)], return_document=ReturnDocument.AFTER
+        )
+        if job is None:
+            # Separate from the pending query so each is served by its own index without a blocking sort
+            job = await jobs.find_one_and_update(
+                {'status': 'running', 'locked_until': {'$lt': now}}, update,
+                sort=[('locked_until', 1)], return_document=ReturnDocument.AFTER
+            )
+        return job
+
+    async def _persistent_worker(self):
+        while not self._stopping:
+            # Counted from the claim onwards so a drain can't miss a job being picked up
+            self._in_flight += 1
+            try:
+                job = await self._claim()
+                if job is not None:
+                    await self._run_persistent(job)
+            except Exception as e:
+                logger.error(f"Failed to claim background job: {str(e)}")
+                job = None
+            finally:
+                self._in_flight -= 1
+
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _run_persistent(self, job: dict):
+        jobs = self.db[JOB_COLLECTION]
+        try:
+            await self.handlers[job['name']](**job['payload'])
+        except Exception as e:
+            logger.error(f"Job {job['name']} failed (attempt {job['attempts']}/{self.max_attempts}): {str(e)}")
+            if job['attempts'] >= self.max_attempts:
+                update = {'status': 'failed', 'error': str(e)}
+            else:
+                delay = self.retry_delay * 2 ** (job['attempts'] - 1)
+                update = {'status': 'pending', 'run_after': datetime.utcnow() + timedelta(seconds=delay)}
+            await jobs.update_one(self._claimed(job), {'$set': update})
+        else:
+            await jobs.delete_one(self._claimed(job))
+
+    @staticmethod
+    def _claimed(job: dict) -> dict:
+        """Matches the job only while this claim holds it, not after another worker reclaimed it"""
+        return {'id': job['id'], 'attempts': job['attempts']}
@@ -0,0 +1,118 @@
+"""Login pipeline shared by the OAuth and Emergent session endpoints.
+
+A login resolves the provider's user to our user with one atomic upsert
+keyed by email (`$setOnInsert`, so concurrent first logins cannot create
+two users) and then issues a session. Concurrent logins for the same
+email on one worker share a single in-flight upsert; each caller still
+gets its own session token, signed when a `SignedSessionTokens` is passed
+and stored in `user_sessions` otherwise.
+"""
+import asyncio
+import secrets
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+SESSION_DAYS = 7
+
+
+def new_user_doc(user_data: dict, now: datetime) -> dict:
+    return {
+        "id": user_data["id"],
+        "email": user_data["email"],
+        "name": user_data["name"],
+        "picture": user_data.get("picture", ""),
+        "created_at": now,
+        "preferences": {"theme": "dark", "notifications": True},
+        "profile_stats": {
+            "total_moods": 0,
+            "current_streak": 0,
+            "level": 1,
+            "experience": 0
+        }
+    }
+
+
+async def upsert_user(db, user_data: dict) -> str:
+    """Our user id for the provider's user, creating the user on first login"""
+    email = user_data["email"]
+    try:
+        user = await db.users.find_one_and_update(
+            {"email": email},
+            {"$setOnInsert": new_user_doc(user_data, datetime.utcnow())},
+            upsert=True,
+            projection={"_id": 0, "id": 1},
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # Another worker inserted the same email between our match and insert
+        user = await db.users.find_one({"email": email}, {"_id": 0, "id": 1})
+    return user["id"]
+
+
+async def issue_session(db, user_id: str) -> str:
+    now = datetime.utcnow()
+    session_token = secrets.token_hex(32)
+    await db.user_sessions.insert_one({
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "session_token": session_token,
+        "expires_at": now + timedelta(days=SESSION_DAYS),
+        "created_at": now,
+        "is_active": True
+    })
+    return session_token
+
+
+class LoginPipeline:
+    """Single-flight user resolution by email, then per-login session issuance"""
+
+    def __init__(self, db, signed=None):
+        self.db = db
+        self.signed = signed
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.logins = 0
+        self.upserts = 0
+        self.coalesced = 0
+
+    async def _resolve_user(self, user_data: dict) -> str:
+        email = user_data["email"]
+        task = self._inflight.get(email)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            # A task rather than an inline await, so one caller disconnecting doesn't cancel the others
+            self.upserts += 1
+            task = asyncio.ensure_future(upsert_user(self.db, user_data))
+            self._inflight[email] = task
+            task.add_done_callback(lambda _: self._inflight.pop(email, None))
+        return await asyncio.shield(task)
+
+    async def login(self, user_data: dict) -> dict:
+        """Resolve the user and issue a session: {'user': {...}, 'session_token': ...}"""
+        self.logins += 1
+        user_id = await self._resolve_user(user_data)
+        if self.signed is not None:
+            session_token = self.signed.issue(user_id)
+        else:
+            session_token = await issue_session(self.db, user_id)
+        return {
+            "user": {
+                "id": user_id,
+                "email": user_data["email"],
+                "name": user_data["name"],
+                "picture": user_data.get("picture", "")
+            },
+            "session_token": session_token
+        }
+
+    def metrics(self) -> dict:
+        return {
+            'logins': self.logins,
+            'user_upserts': self.upserts,
+            'coalesced': self.coalesced,
+            'in_flight': len(self._inflight)
+        }
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Login storm load test against a local MongoDB.
+
+Fires thousands of concurrent logins over a small pool of emails, the way an
+app release or push campaign does, once through the original
+find/insert/insert sequence and once through `LoginPipeline`, and reports
+throughput, latency and how many duplicate users each created. Uses its own
+throwaway database.
+
+    python login_load_test.py                       # 5000 logins over 500 emails
+    python login_load_test.py --logins 20000 --users 2000 --mode pipeline
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from indexes import INDEXES
+from login import LoginPipeline, new_user_doc
+
+
+async def legacy_login(db, user_data: dict):
+    """The original endpoints: find by email, insert on a miss, insert a session"""
+    existing_user = await db.users.find_one({"email": user_data["email"]})
+    if not existing_user:
+        await db.users.insert_one(new_user_doc(user_data, datetime.utcnow()))
+        user_id = user_data["id"]
+    else:
+        user_id = existing_user["id"]
+    session_token = hashlib.sha256(f"{user_id}_{datetime.utcnow()}_{uuid.uuid4()}".encode()).hexdigest()
+    await db.user_sessions.insert_one({
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "session_token": session_token,
+        "expires_at": datetime.utcnow() + timedelta(days=7),
+        "created_at": datetime.utcnow(),
+        "is_active": True
+    })
+
+
+async def prepare(db, unique_email: bool):
+    await db.users.drop()
+    await db.user_sessions.drop()
+    if unique_email:
+        await db.users.create_indexes(INDEXES['users'])
+    else:
+        await db.users.create_index('email')
+    await db.user_sessions.create_indexes(INDEXES['user_sessions'])
+
+
+async def storm(db, login, logins: int, users: int, concurrency: int) -> dict:
+    # Provider ids are stable per email, as they are for Google and Emergent
+    identities = [{"id": f"load-{i}", "email": f"load-{i}@example.com", "name": f"Load {i}"} for i in range(users)]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(i: int):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await login(identities[i % users])
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(logins)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    user_docs = await db.users.count_documents({})
+    return {
+        'elapsed_s': elapsed,
+        'logins_per_s': logins / elapsed,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p95_ms': latencies[int(len(latencies) * 0.95)] * 1000,
+        'p99_ms': latencies[int(len(latencies) * 0.99)] * 1000,
+        'errors': errors,
+        'users': user_docs,
+        'duplicate_users': user_docs - len(await db.users.distinct('email')),
+        'sessions': await db.user_sessions.count_documents({})
+    }
+
+
+def print_result(name: str, result: dict):
+    print(f"{name}")
+    print(f"  {result['logins_per_s']:,.0f} logins/s over {result['elapsed_s']:.2f}s, "
+          f"p50 {result['p50_ms']:.1f} ms, p95 {result['p95_ms']:.1f} ms, p99 {result['p99_ms']:.1f} ms")
+    print(f"  {result['users']} users ({result['duplicate_users']} duplicates), "
+          f"{result['sessions']} sessions, {result['errors']} errors")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate a burst of concurrent logins")
+    parser.add_argument('--logins', type=int, default=5000)
+    parser.add_argument('--users', type=int, default=500, help="Distinct emails the logins are spread over")
+    parser.add_argument('--concurrency', type=int, default=1000, help="Logins in flight at once")
+    parser.add_argument('--mode', choices=('legacy', 'pipeline', 'both'), default='both')
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'), maxPoolSize=200)
+    db = client[os.environ.get('LOAD_TEST_DB', 'moodverse_login_load_test')]
+
+    async def run():
+        print(f"{args.logins:,} logins over {args.users:,} emails, {args.concurrency:,} in flight")
+        try:
+            if args.mode in ('legacy', 'both'):
+                # The original schema: email is not unique, so racing first logins duplicate users
+                await prepare(db, unique_email=False)
+                print_result("find + insert + insert", await storm(
+                    db, lambda user: legacy_login(db, user), args.logins, args.users, args.concurrency))
+            if args.mode in ('pipeline', 'both'):
+                await prepare(db, unique_email=True)
+                pipeline = LoginPipeline(db)
+                print_result("LoginPipeline", await storm(db, pipeline.login, args.logins, args.users, args.concurrency))
+                print(f"  {pipeline.metrics()}")
+        finally:
+            await client.drop_database(db.name)
+
+    try:
+        asyncio.run(run())
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Prebuilt mood payloads for entry enrichment.
+
+Every built-in mood is turned into a `MoodData` once at import. Enriching
+an entry is then a dict lookup that splices the shared instance in by
+reference. The instances are shared across requests
+and must be treated as read-only.
+"""
+from datetime import datetime
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Dict, Iterable, Mapping, Optional
+
+from models import MOODS, MoodData
+
+BUILTIN_MOODS: Mapping[str, MoodData] = MappingProxyType({
+    mood_id: MoodData(id=mood_id, **mood) for mood_id, mood in MOODS.items()
+})
+
+
+@lru_cache(maxsize=1024)
+def placeholder_mood(mood_id: str) -> MoodData:
+    """Stand-in for a mood id that is neither built in nor a known custom mood"""
+    return MoodData(
+        id=mood_id,
+        emoji='❓',
+        label=mood_id.title(),
+        color='bg-gray-100 border-gray-300',
+        particles='gray',
+        intensity=3,
+        category='neutral',
+        isCustom=True
+    )
+
+
+def custom_mood_data(custom_mood: dict) -> MoodData:
+    return MoodData(
+        id=custom_mood['id'],
+        emoji=custom_mood['emoji'],
+        label=custom_mood['label'],
+        color=custom_mood['color'],
+        particles=custom_mood.get('particles', 'blue'),
+        intensity=custom_mood.get('intensity', 3),
+        category=custom_mood.get('category', 'neutral'),
+        isCustom=True
+    )
+
+
+class MoodCatalog:
+    """Built-in moods merged with one user's custom moods"""
+
+    def __init__(self, custom: Optional[Dict[str, MoodData]] = None):
+        self.custom = custom or {}
+
+    @classmethod
+    def from_custom_moods(cls, custom_moods: Mapping[str, dict]) -> 'MoodCatalog':
+        return cls({mood_id: custom_mood_data(mood) for mood_id, mood in custom_moods.items()})
+
+    def get(self, mood_id: str) -> MoodData:
+        mood = BUILTIN_MOODS.get(mood_id)
+        if mood is None:
+            mood = self.custom.get(mood_id) or placeholder_mood(mood_id)
+        return mood
+
+
+BUILTIN_CATALOG = MoodCatalog()
+
+
+async def catalog_for(db, cache, user_id: str, mood_ids: Iterable[str]) -> MoodCatalog:
+    """Catalog covering `mood_ids`; non-built-in ids are resolved in one batched lookup"""
+    unknown = {mood_id for mood_id in mood_ids if mood_id not in BUILTIN_MOODS}
+    if not unknown:
+        return BUILTIN_CATALOG
+    return MoodCatalog.from_custom_moods(await cache.resolve(db, user_id, unknown))
+
+
+def enrich_mood_entry(entry_dict: dict, catalog: MoodCatalog = BUILTIN_CATALOG) -> dict:
+    """Add mood details to mood entry and ensure proper datetime handling"""
+    missing = [field for field in ('timestamp', 'created_at', 'updated_at') if not entry_dict.get(field)]
+    if missing:
+        now = datetime.utcnow()
+        for field in missing:
+            entry_dict[field] = now
+
+    # Unknown ids get a placeholder unless the catalog carries the user's custom moods
+    entry_dict['mood'] = catalog.get(entry_dict['mood_id'])
+    return entry_dict
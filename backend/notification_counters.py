@@ -0,0 +1,89 @@
+"""Unread notification counters and bulk read flips.
+
+Each user's unread count lives in `notification_unread` and moves with
+every write that changes it: inserts add one, read flips subtract exactly
+the number of documents `update_many` modified. Reading the badge is one
+document lookup; a missing or negative counter is recounted from
+`notifications`.
+
+A recount covers notifications stamped before its `counted_at`, and only
+inserts stamped from then on are added to it, so writes racing the
+counter's creation are counted once.
+"""
+from datetime import datetime
+from typing import List, Optional
+
+UNREAD_COLLECTION = 'notification_unread'
+
+
+async def _count_unread(db, user_id: str) -> dict:
+    # Truncated to what BSON stores, so every timestamp falls on exactly one side of it
+    now = datetime.utcnow()
+    counted_at = now.replace(microsecond=now.microsecond // 1000 * 1000)
+    unread = await db.notifications.count_documents({'user_id': user_id, 'read': False, 'timestamp': {'$lt': counted_at}})
+    return {'unread': unread, 'counted_at': counted_at}
+
+
+async def _adjust(db, user_id: str, delta: int, written_at: Optional[datetime] = None):
+    """Move a user's counter; `written_at` is the timestamp of an inserted notification"""
+    if not delta:
+        return
+    query = {'user_id': user_id}
+    if isinstance(written_at, datetime):
+        query['$or'] = [{'counted_at': {'$exists': False}}, {'counted_at': {'$lte': written_at}}]
+    update = {'$inc': {'unread': delta}}
+    result = await db[UNREAD_COLLECTION].update_one(query, update)
+    if result.matched_count:
+        return
+    # No counter yet (or the guard skipped this insert): create it from a recount unless another write just did
+    await db[UNREAD_COLLECTION].update_one(
+        {'user_id': user_id}, {'$setOnInsert': await _count_unread(db, user_id)}, upsert=True
+    )
+    if '$or' in query:
+        # Whichever recount created it, the guard adds this insert only if that recount did not have it
+        await db[UNREAD_COLLECTION].update_one(query, update)
+
+
+async def insert_notification(db, notification: dict):
+    await db.notifications.insert_one(notification)
+    if not notification.get('read'):
+        await _adjust(db, notification['user_id'], 1, notification.get('timestamp'))
+
+
+async def recount_unread(db, user_id: str) -> int:
+    counter = await _count_unread(db, user_id)
+    await db[UNREAD_COLLECTION].update_one({'user_id': user_id}, {'$set': counter}, upsert=True)
+    return counter['unread']
+
+
+async def unread_count(db, user_id: str) -> int:
+    counter = await db[UNREAD_COLLECTION].find_one({'user_id': user_id}, {'_id': 0, 'unread': 1})
+    if counter is None or counter.get('unread', 0) < 0:
+        return await recount_unread(db, user_id)
+    return counter['unread']
+
+
+async def mark_notification_read(db, notification_id: str) -> bool:
+    """Flip one notification to read, whoever owns it"""
+    notification = await db.notifications.find_one_and_update(
+        {'id': notification_id, 'read': False}, {'$set': {'read': True}}, projection={'_id': 0, 'user_id': 1}
+    )
+    if notification is None:
+        return False
+    await _adjust(db, notification['user_id'], -1)
+    return True
+
+
+async def mark_read(db, user_id: str, notification_ids: List[str]) -> int:
+    result = await db.notifications.update_many(
+        {'user_id': user_id, 'id': {'$in': notification_ids}, 'read': False}, {'$set': {'read': True}}
+    )
+    await _adjust(db, user_id, -result.modified_count)
+    return result.modified_count
+
+
+async def mark_all_read(db, user_id: str) -> int:
+    # Decrement rather than zero, so a notification inserted meanwhile still counts
+    result = await db.notifications.update_many({'user_id': user_id, 'read': False}, {'$set': {'read': True}})
+    await _adjust(db, user_id, -result.modified_count)
+    return result.modified_count
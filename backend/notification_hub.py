@@ -0,0 +1,227 @@
+"""Real-time notification delivery.
+
+`NotificationHub` is an in-process pub/sub: every open WebSocket or SSE
+connection subscribes a bounded queue for its user and `publish` drops new
+notifications into those queues. `NotificationFeed` keeps the hub fed: it
+follows inserts into `notifications` with a change stream so every worker
+sees every notification. A dropped stream is reopened with backoff and
+resumed where it left off; where change streams are unsupported the feed
+polls `notifications` by timestamp instead. Only `mode='local'` makes the
+inserting worker publish directly, which reaches its own clients alone.
+"""
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Dict, Optional, Set
+
+from fastapi import WebSocket, WebSocketDisconnect
+from pymongo.errors import OperationFailure
+
+from fast_json import dumps
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIBER_QUEUE_SIZE = 100
+SSE_HEARTBEAT_SECONDS = 15.0
+RECONNECT_BACKOFF_SECONDS = (1.0, 60.0)  # initial, max; doubles per consecutive failure
+
+
+class NotificationHub:
+    """user_id -> subscriber queues, plus delivery metrics"""
+
+    def __init__(self, queue_size: int = SUBSCRIBER_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._transports: Dict[str, int] = {}
+        self.connections_total = 0
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self._latency_total = 0.0
+        self.latency_max = 0.0
+
+    @asynccontextmanager
+    async def subscription(self, user_id: str, transport: str):
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        self._transports[transport] = self._transports.get(transport, 0) + 1
+        self.connections_total += 1
+        try:
+            yield queue
+        finally:
+            self._transports[transport] -= 1
+            queues = self._subscribers.get(user_id)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del self._subscribers[user_id]
+
+    def publish(self, notification: dict) -> int:
+        """Queue a notification for its user's connections on this worker"""
+        queues = self._subscribers.get(notification['user_id'])
+        if not queues:
+            return 0
+        self.published += 1
+        for queue in queues:
+            if queue.full():
+                # A stalled client loses its oldest pending notification, not the newest
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait(notification)
+        return len(queues)
+
+    def record_delivery(self, notification: dict):
+        timestamp = notification.get('timestamp')
+        self.delivered += 1
+        if isinstance(timestamp, datetime):
+            latency = max((datetime.utcnow() - timestamp).total_seconds(), 0.0)
+            self._latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+
+    def metrics(self) -> dict:
+        return {
+            'connections': sum(self._transports.values()),
+            'connections_by_transport': dict(self._transports),
+            'connections_total': self.connections_total,
+            'subscribed_users': len(self._subscribers),
+            'published': self.published,
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+            'avg_delivery_ms': round(self._latency_total * 1000 / self.delivered, 3) if self.delivered else 0.0,
+            'max_delivery_ms': round(self.latency_max * 1000, 3)
+        }
+
+
+class NotificationFeed:
+    """Routes `notifications` inserts from every worker into this worker's hub"""
+
+    def __init__(self, db, hub: NotificationHub, mode: str = 'auto', poll_interval: float = 2.0):
+        self.db = db
+        self.hub = hub
+        self.mode = mode  # 'auto' tries a change stream first, 'poll' never does, 'local' skips the database
+        self.poll_interval = poll_interval
+        self.active_mode: Optional[str] = None
+        self.reconnects = 0
+        self._resume_token = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def publishes_locally(self) -> bool:
+        """Whether the inserting worker has to hand notifications to the hub itself.
+
+        Also true until the feed first connects, when nothing else would
+        deliver them; after that a reconnecting stream resumes from its token.
+        """
+        return self.active_mode in (None, 'local')
+
+    def start(self):
+        if self.mode == 'local':
+            self.active_mode = 'local'
+        elif self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        if self.mode != 'poll':
+            if await self._follow():
+                return
+        await self._poll()
+
+    async def _follow(self) -> bool:
+        """Follow the change stream until cancelled; False when the deployment can't provide one"""
+        delay, max_delay = RECONNECT_BACKOFF_SECONDS
+        while True:
+            try:
+                await self._watch()
+            except OperationFailure as e:
+                if self._resume_token is None:
+                    # Standalone servers don't support change streams
+                    logger.info(f"Notification change stream unavailable, polling instead: {str(e)}")
+                    return False
+                # Most likely the resume point has left the oplog; start from now
+                logger.warning(f"Notification change stream could not resume, restarting: {str(e)}")
+                self._resume_token = None
+            except Exception as e:
+                if self.active_mode == 'change_stream':
+                    delay = RECONNECT_BACKOFF_SECONDS[0]  # it had been up, so start the backoff over
+                logger.error(f"Notification change stream failed, reconnecting in {delay:.0f}s: {str(e)}")
+                if self.active_mode is not None:
+                    self.active_mode = 'reconnecting'
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, max_delay)
+
+    async def _watch(self):
+        pipeline = [{'$match': {'operationType': 'insert'}}]
+        async with self.db.notifications.watch(pipeline, resume_after=self._resume_token) as stream:
+            if self.active_mode is not None:
+                self.reconnects += 1
+            self.active_mode = 'change_stream'
+            async for change in stream:
+                document = change['fullDocument']
+                document.pop('_id', None)
+                self.hub.publish(document)
+                self._resume_token = stream.resume_token
+
+    async def _poll(self):
+        self.active_mode = 'poll'
+        since = datetime.utcnow()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                # New notifications are unread, which lets (read, timestamp) serve this
+                cursor = self.db.notifications.find(
+                    {'read': False, 'timestamp': {'$gt': since}}, {'_id': 0}
+                ).sort('timestamp', 1)
+                async for notification in cursor:
+                    self.hub.publish(notification)
+                    since = notification['timestamp']
+            except Exception as e:
+                logger.error(f"Notification poll failed: {str(e)}")
+
+
+def _wire(notification: dict) -> dict:
+    return {key: value for key, value in notification.items() if key != '_id'}
+
+
+async def pump_websocket(hub: NotificationHub, websocket: WebSocket, user_id: str):
+    """Send the user's notifications until the client disconnects"""
+    async with hub.subscription(user_id, 'websocket') as queue:
+        receiver = asyncio.create_task(websocket.receive_text())
+        try:
+            while True:
+                getter = asyncio.create_task(queue.get())
+                done, _ = await asyncio.wait({getter, receiver}, return_when=asyncio.FIRST_COMPLETED)
+                if getter in done:
+                    notification = getter.result()
+                    await websocket.send_text(dumps(_wire(notification)).decode('utf-8'))
+                    hub.record_delivery(notification)
+                else:
+                    getter.cancel()
+                if receiver in done:
+                    # Client messages are ignored; this raises WebSocketDisconnect once the client is gone
+                    receiver.result()
+                    receiver = asyncio.create_task(websocket.receive_text())
+        except WebSocketDisconnect:
+            pass
+        finally:
+            receiver.cancel()
+
+
+async def sse_events(hub: NotificationHub, request, user_id: str):
+    """`text/event-stream` chunks for the user's notifications, with heartbeats"""
+    async with hub.subscription(user_id, 'sse') as queue:
+        yield b": connected\n\n"
+        while not await request.is_disconnected():
+            try:
+                notification = await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield b": heartbeat\n\n"
+                continue
+            yield b"id: " + notification['id'].encode('utf-8') + b"\nevent: notification\ndata: " + dumps(_wire(notification)) + b"\n\n"
+            hub.record_delivery(notification)
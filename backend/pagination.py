@@ -0,0 +1,58 @@
+"""Keyset pagination helpers.
+
+A page is continued from the sort key of its last row rather than an
+offset, so every page costs one index range scan however deep the client
+has scrolled. The key travels as an opaque URL-safe token.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Sequence, Tuple
+
+
+def encode_cursor(*values) -> str:
+    """Opaque continuation token for the given sort key values"""
+    encoded = [{'$dt': value.isoformat()} if isinstance(value, datetime) else value for value in values]
+    raw = json.dumps(encoded, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+# JSON scalars a cursor may carry; anything else (e.g. {"$gt": ""}) would reach the query as an operator
+_CURSOR_SCALARS = (str, int, float, type(None))
+
+
+def _cursor_value(value):
+    if isinstance(value, _CURSOR_SCALARS) and not isinstance(value, bool):
+        return value
+    if isinstance(value, dict) and list(value) == ['$dt'] and isinstance(value['$dt'], str):
+        return datetime.fromisoformat(value['$dt'])
+    raise ValueError("Malformed cursor")
+
+
+def decode_cursor(token: str, size: int) -> Tuple:
+    """Sort key values from a token; raises ValueError if it was not issued by `encode_cursor`"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Malformed cursor") from e
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Malformed cursor")
+    return tuple(_cursor_value(value) for value in values)
+
+
+def keyset_filter(fields: Sequence[str], values: Sequence, descending: bool = True) -> dict:
+    """Rows strictly after `values` in (fields...) order"""
+    if len(values) != len(fields):
+        raise ValueError(f"Expected {len(fields)} sort key values, got {len(values)}")
+    op = '$lt' if descending else '$gt'
+    branches = []
+    for i, field in enumerate(fields):
+        branch = {fields[j]: values[j] for j in range(i)}
+        branch[field] = {op: values[i]}
+        branches.append(branch)
+    return {'$or': branches}
+
+
+def clamp_page_size(limit: int, maximum: int) -> int:
+    return max(1, min(limit, maximum))
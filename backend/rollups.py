@@ -0,0 +1,242 @@
+"""Per-user mood statistics rollups.
+
+Every mood write applies a small `$inc` delta to the user's document in
+`user_mood_rollups`, so the stats endpoint reads one document instead of
+walking the whole history. Run `python rollups.py` to backfill existing users.
+"""
+import argparse
+import asyncio
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+from analytics import compose_insights
+from models import MOODS
+
+ROLLUP_COLLECTION = 'user_mood_rollups'
+CATEGORIES = ('positive', 'neutral', 'negative')
+
+# Tags and weather conditions are user supplied and become field names,
+# so the characters MongoDB reserves in keys are swapped for look-alikes.
+_KEY_ESCAPES = (('.', '．'), ('$', '＄'))
+
+
+def encode_key(value) -> str:
+    key = str(value)
+    for raw, escaped in _KEY_ESCAPES:
+        key = key.replace(raw, escaped)
+    return key
+
+
+def decode_key(key: str) -> str:
+    for raw, escaped in _KEY_ESCAPES:
+        key = key.replace(escaped, raw)
+    return key
+
+
+def mood_category(mood_id: str) -> str:
+    return MOODS.get(mood_id, {}).get('category', 'neutral')
+
+
+def rollup_increments(entry: Optional[dict], sign: int = 1) -> dict:
+    """Build the `$inc` paths contributed by a single mood entry"""
+    inc = {}
+    if not entry:
+        return inc
+
+    def add(path, amount):
+        inc[path] = inc.get(path, 0) + amount
+
+    intensity = entry.get('intensity', 3)
+    category = mood_category(entry['mood_id'])
+
+    add('total_entries', sign)
+    add('intensity_sum', sign * intensity)
+    add(f"mood_counts.{encode_key(entry['mood_id'])}", sign)
+    add(f'mood_distribution.{category}', sign)
+
+    weather_data = entry.get('weather')
+    if weather_data and isinstance(weather_data, dict) and weather_data.get('condition'):
+        add(f"weather_correlation.{encode_key(weather_data['condition'])}.{category}", sign)
+
+    tags = entry.get('tags', [])
+    if tags and isinstance(tags, list):
+        for tag in tags:
+            tag_key = encode_key(tag)
+            add(f'activity_correlation.{tag_key}.count', sign)
+            add(f'activity_correlation.{tag_key}.intensity_sum', sign * intensity)
+            add(f'activity_correlation.{tag_key}.intensity_hist.{intensity}', sign)
+
+    return inc
+
+
+def merge_increments(*deltas: dict) -> dict:
+    """Sum several `$inc` documents, dropping paths that cancel out"""
+    merged = {}
+    for delta in deltas:
+        for path, amount in delta.items():
+            merged[path] = merged.get(path, 0) + amount
+    return {path: amount for path, amount in merged.items() if amount}
+
+
+def expand_increments(inc: dict) -> dict:
+    """Turn dotted `$inc` paths into the nested document they describe"""
+    doc = {}
+    for path, amount in inc.items():
+        node = doc
+        *parents, leaf = path.split('.')
+        for part in parents:
+            node = node.setdefault(part, {})
+        node[leaf] = node.get(leaf, 0) + amount
+    return doc
+
+
+async def apply_mood_write(db, user_id: str, before: Optional[dict] = None, after: Optional[dict] = None) -> bool:
+    """Atomically move a user's rollup from the `before` entry to the `after` entry.
+
+    Users without a rollup are left alone: a delta on its own would stand in
+    for their whole history, so `get_user_rollup` builds it from scratch
+    instead. Writes the last rebuild already counted (stamped no later than
+    its `rebuilt_at`) are skipped as well.
+    """
+    inc = merge_increments(rollup_increments(before, -1), rollup_increments(after, 1))
+    if not inc:
+        return False
+    query = {'user_id': user_id}
+    written_at = (after or {}).get('updated_at')
+    if isinstance(written_at, datetime):
+        query['$or'] = [{'rebuilt_at': {'$exists': False}}, {'rebuilt_at': {'$lt': written_at}}]
+    result = await db[ROLLUP_COLLECTION].update_one(query, {'$inc': inc, '$set': {'updated_at': datetime.utcnow()}})
+    return bool(result.matched_count)
+
+
+async def rebuild_user_rollup(db, user_id: str) -> dict:
+    """Recompute a user's rollup from their full history and store it"""
+    # Taken before the scan, so any write stamped after it is applied on top as a delta
+    rebuilt_at = datetime.utcnow()
+    inc = {}
+    async for entry in db.mood_entries.find({'user_id': user_id}):
+        for path, amount in rollup_increments(entry).items():
+            inc[path] = inc.get(path, 0) + amount
+
+    rollup = expand_increments(inc)
+    rollup['user_id'] = user_id
+    rollup['rebuilt_at'] = rebuilt_at
+    rollup['updated_at'] = datetime.utcnow()
+    await db[ROLLUP_COLLECTION].replace_one({'user_id': user_id}, rollup, upsert=True)
+    return rollup
+
+
+async def get_user_rollup(db, user_id: str) -> dict:
+    """Read a user's rollup, building it on first access"""
+    rollup = await db[ROLLUP_COLLECTION].find_one({'user_id': user_id})
+    if rollup is None:
+        rollup = await rebuild_user_rollup(db, user_id)
+    return rollup
+
+
+def rollup_stats(rollup: dict) -> dict:
+    """Shape a rollup document into the aggregate fields of `MoodStats`"""
+    mood_counts = {}
+    for mood_key, count in rollup.get('mood_counts', {}).items():
+        if count <= 0:
+            continue
+        mood_id = decode_key(mood_key)
+        mood_label = MOODS.get(mood_id, {}).get('label', mood_id)
+        mood_counts[mood_label] = mood_counts.get(mood_label, 0) + count
+
+    distribution = rollup.get('mood_distribution', {})
+    mood_distribution = {category: distribution.get(category, 0) for category in CATEGORIES}
+
+    weather_correlation = {}
+    for weather_key, counts in rollup.get('weather_correlation', {}).items():
+        if sum(counts.values()) <= 0:
+            continue
+        weather_correlation[decode_key(weather_key)] = {category: counts.get(category, 0) for category in CATEGORIES}
+
+    activity_correlation = {}
+    for tag_key, tag_data in rollup.get('activity_correlation', {}).items():
+        count = tag_data.get('count', 0)
+        if count <= 0:
+            continue
+        moods = []
+        for intensity, hits in sorted(tag_data.get('intensity_hist', {}).items(), key=lambda x: int(x[0])):
+            moods.extend([int(intensity)] * hits)
+        activity_correlation[decode_key(tag_key)] = {
+            'count': count,
+            'avg_intensity': tag_data.get('intensity_sum', 0) / count,
+            'moods': moods
+        }
+
+    most_common_mood = max(mood_counts.items(), key=lambda x: x[1])[0] if mood_counts else ""
+
+    return {
+        'total_entries': rollup.get('total_entries', 0),
+        'mood_counts': mood_counts,
+        'most_common_mood': most_common_mood,
+        'mood_distribution': mood_distribution,
+        'weather_correlation': weather_correlation,
+        'activity_correlation': activity_correlation
+    }
+
+
+def rollup_insights(rollup: dict, recent_entries: List[dict]) -> List[str]:
+    """Same rules as `generate_ai_insights`, fed from the rollup and the latest entries"""
+    total = rollup.get('total_entries', 0)
+    if total <= 0:
+        return compose_insights(0, 0, 0, None, 0, 0, 0, None, None, 0, 0, None)
+
+    activities = rollup.get('activity_correlation', {})
+    weather = rollup.get('weather_correlation', {})
+    social = activities.get('social', {})
+    exercise = activities.get('exercise', {})
+
+    recent = recent_entries[:14]
+    intensities = [e.get('intensity', 3) for e in recent if e.get('intensity')]
+
+    return compose_insights(
+        total_entries=total,
+        positive_count=rollup.get('mood_distribution', {}).get('positive', 0),
+        recent_count=len(recent),
+        recent_avg=sum(intensities) / len(intensities) if intensities else None,
+        weather_total=sum(sum(counts.values()) for counts in weather.values()),
+        sunny_count=sum(weather.get('sunny', {}).values()),
+        social_count=social.get('count', 0),
+        social_avg=social['intensity_sum'] / social['count'] if social.get('count') else None,
+        overall_avg=rollup.get('intensity_sum', 0) / total,
+        grateful_count=rollup.get('mood_counts', {}).get('grateful', 0),
+        exercise_count=exercise.get('count', 0),
+        exercise_avg=exercise['intensity_sum'] / exercise['count'] if exercise.get('count') else None
+    )
+
+
+async def rebuild_all_rollups(db, user_ids: Optional[List[str]] = None) -> int:
+    """Backfill rollups for the given users, or for everyone with mood entries"""
+    if not user_ids:
+        user_ids = await db.mood_entries.distinct('user_id')
+    for user_id in user_ids:
+        await rebuild_user_rollup(db, user_id)
+    return len(user_ids)
+
+
+def main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description="Rebuild MoodVerse per-user stats rollups")
+    parser.add_argument('--user-id', action='append', dest='user_ids', help="Only rebuild this user (repeatable)")
+    args = parser.parse_args()
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+    db = client[os.environ.get('DB_NAME', 'test_database')]
+    try:
+        rebuilt = asyncio.run(rebuild_all_rollups(db, args.user_ids))
+        print(f"Rebuilt {rebuilt} mood rollups")
+    finally:
+        client.close()
+
+
+if __name__ == '__main__':
+    main()
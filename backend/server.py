@@ -1,29 +1,55 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Response, UploadFile, File, Header, Request
+from fastapi import FastAPI, APIRouter, HTTPException, Response, UploadFile, File, Header, Request, WebSocket
 from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
-import aiohttp
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 import os
 import logging
 from pathlib import Path
-import hashlib
 from typing import List, Optional
 from datetime import datetime, timedelta
 from emergentintegrations.payments.stripe.checkout import StripeCheckout, CheckoutSessionResponse, CheckoutStatusResponse, CheckoutSessionRequest
-import csv
-import io
 import statistics
-import json
 import re
 import uuid
 
 from models import (
-    MoodEntry, MoodEntryCreate, MoodEntryUpdate, MoodStats, MoodData, 
+    MoodEntry, MoodEntryCreate, MoodEntryUpdate, MoodStats,
     Achievement, User, Friend, SocialFeedItem, Notification, CustomMood,
-    MeditationSession, WeeklyReport, LoginResponse, MOODS, ACHIEVEMENTS, CRISIS_KEYWORDS,
+    MeditationSession, WeeklyReport, LoginResponse, MOODS, ACHIEVEMENTS,
     WEATHER_CONDITIONS, ACTIVITY_IMPACT, PaymentTransaction, SUBSCRIPTION_PACKAGES
 )
+from rollups import apply_mood_write, get_user_rollup, rollup_stats, rollup_insights
+from analytics import MoodFrame
+from stats_pipeline import aggregate_mood_stats
+from streaks import get_streak_state, record_mood_date, streak_summary
+from achievements import record_mood_achievements, record_counter_event
+from crisis import CRISIS_MATCHER
+from jobs import JobQueue
+from indexes import bootstrap_indexes
+from custom_moods import CustomMoodCache
+from exports import (
+    EXPORT_BATCH_SIZE, EXPORT_FORMATS, COLUMNAR_FORMATS, iter_csv, iter_ndjson, iter_columnar,
+    gzip_chunks, accepts_gzip, nested_key_types, export_schema, pa
+)
+from sessions import SessionCache, RevocationListener, lookup_session_user, revoke_session
+from session_tokens import SignedSessionTokens, is_signed_token
+from pagination import encode_cursor, decode_cursor, keyset_filter, clamp_page_size
+from mood_catalog import catalog_for, enrich_mood_entry
+from fast_json import FastJSONResponse, trusted_rows
+from timelines import FANOUT_LIMIT, share_achievement, fan_out_item, read_timeline
+from friend_graph import FriendGraph
+from notification_hub import NotificationHub, NotificationFeed, pump_websocket, sse_events
+import notification_counters
+from http_client import HttpClientPool
+from login import LoginPipeline, SESSION_DAYS
+from housekeeping import Housekeeper, default_policies
+from imports import (
+    IMPORT_FORMATS, ImportRecordTooLarge, import_format, iter_csv_records, iter_ndjson_records, import_mood_entries,
+    new_import_result, rebuild_derived_state
+)
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -33,258 +59,182 @@ mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
 client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ.get('DB_NAME', 'test_database')]
 
+# Background jobs for post-write side effects ('memory' or 'mongo' to survive restarts)
+job_queue = JobQueue(
+    db,
+    concurrency=int(os.environ.get('JOB_QUEUE_CONCURRENCY', '4')),
+    persistent=os.environ.get('JOB_QUEUE_MODE', 'memory') == 'mongo'
+)
+
+# Validated session tokens, shared by every authenticated request on this worker
+session_cache = SessionCache(
+    max_size=int(os.environ.get('SESSION_CACHE_SIZE', '10000')),
+    ttl_seconds=float(os.environ.get('SESSION_CACHE_TTL', '60'))
+)
+
+# 'opaque' tokens are looked up in user_sessions; 'signed' tokens are JWTs verified in-process.
+# Signed mode still accepts opaque tokens, so enabling it doesn't log existing sessions out.
+SESSION_TOKENS = os.environ.get('SESSION_TOKENS', 'opaque')
+signed_tokens = (
+    SignedSessionTokens(os.environ.get('SESSION_TOKEN_SECRET', ''), ttl=timedelta(days=SESSION_DAYS))
+    if SESSION_TOKENS == 'signed' else None
+)
+revocation_listener = RevocationListener(
+    db, session_cache, mode=os.environ.get('SESSION_INVALIDATION', 'auto'),
+    revoked=signed_tokens.revoked if signed_tokens else None
+)
+
+# Custom mood lookups for validation and enrichment
+custom_mood_cache = CustomMoodCache()
+
+# Where /moods/stats gets its aggregates: 'rollup' documents, a vectorized 'frame' over the
+# history, or a server-side 'aggregation' that returns one result document
+STATS_BACKEND = os.environ.get('STATS_BACKEND', 'rollup')
+
+# Largest page GET /moods will return, whatever `limit` the client asks for
+MOOD_PAGE_SIZE_MAX = int(os.environ.get('MOOD_PAGE_SIZE_MAX', '100'))
+NOTIFICATION_PAGE_SIZE_MAX = int(os.environ.get('NOTIFICATION_PAGE_SIZE_MAX', '100'))
+
+# POST /moods/import: rows per bulk_write, and rows per request (50,000 days is well over a century)
+MOOD_IMPORT_BATCH_SIZE = int(os.environ.get('MOOD_IMPORT_BATCH_SIZE', '1000'))
+MOOD_IMPORT_MAX_ROWS = int(os.environ.get('MOOD_IMPORT_MAX_ROWS', '50000'))
+
+# List endpoints ('moods', 'notifications', 'meditation_sessions', 'social_feed') whose rows are
+# serialized without re-validation
+FAST_JSON_ENDPOINTS = {name.strip() for name in os.environ.get('FAST_JSON_ENDPOINTS', '').split(',') if name.strip()}
+
+# Friend adjacency served from memory, written through by this worker
+friend_graph = FriendGraph(
+    max_users=int(os.environ.get('FRIEND_GRAPH_SIZE', '20000')),
+    ttl_seconds=float(os.environ.get('FRIEND_GRAPH_TTL', '300'))
+)
+
+# Push delivery of notifications over WebSocket/SSE ('auto' follows a change stream, 'local' is single-worker)
+notification_hub = NotificationHub()
+notification_feed = NotificationFeed(db, notification_hub, mode=os.environ.get('NOTIFICATION_DELIVERY', 'auto'))
+
+# Outbound HTTP (OAuth token exchange, userinfo, Emergent session data) over one kept-alive pool
+http_pool = HttpClientPool(
+    limit_per_host=int(os.environ.get('HTTP_POOL_PER_HOST', '20')),
+    dns_ttl=int(os.environ.get('HTTP_DNS_TTL', '300')),
+    connect_timeout=float(os.environ.get('HTTP_CONNECT_TIMEOUT', '5')),
+    total_timeout=float(os.environ.get('HTTP_TIMEOUT', '15')),
+    retries=int(os.environ.get('HTTP_RETRIES', '2'))
+)
+
+# User upsert + session issuance for both login endpoints, coalesced by email
+login_pipeline = LoginPipeline(db, signed=signed_tokens)
+
+# Batched purging of expired/logged-out sessions, old read notifications and weekly reports, and
+# archiving of old payment transactions; HOUSEKEEPING_INTERVAL=0 turns it off
+housekeeper = Housekeeper(
+    db,
+    default_policies(
+        notification_days=int(os.environ.get('NOTIFICATION_RETENTION_DAYS', '90')),
+        report_days=int(os.environ.get('WEEKLY_REPORT_RETENTION_DAYS', '365')),
+        payment_days=int(os.environ.get('PAYMENT_ARCHIVE_DAYS', '365'))
+    ),
+    interval=float(os.environ.get('HOUSEKEEPING_INTERVAL', '3600')),
+    batch_size=int(os.environ.get('HOUSEKEEPING_BATCH_SIZE', '1000'))
+)
+
+# Social feed: materialized per-user 'timeline' (fan-out on write) or the original fan-out on 'read'
+FEED_MODE = os.environ.get('FEED_MODE', 'timeline')
+FEED_FANOUT_LIMIT = int(os.environ.get('FEED_FANOUT_LIMIT', str(FANOUT_LIMIT)))
+
 # Create the main app
 app = FastAPI(title="MoodVerse Ultimate API", description="Complete Social Emotional Intelligence Platform")
 api_router = APIRouter(prefix="/api")
 
-def enrich_mood_entry(entry_dict):
-    """Add mood details to mood entry and ensure proper datetime handling"""
-    # Ensure required datetime fields are present
-    if not entry_dict.get('timestamp'):
-        entry_dict['timestamp'] = datetime.utcnow()
-    if not entry_dict.get('created_at'):
-        entry_dict['created_at'] = datetime.utcnow()
-    if not entry_dict.get('updated_at'):
-        entry_dict['updated_at'] = datetime.utcnow()
-    
-    mood_id = entry_dict['mood_id']
-    if mood_id in MOODS:
-        entry_dict['mood'] = MoodData(
-            id=mood_id,
-            **MOODS[mood_id]
-        )
-    else:
-        # Check custom moods (this would query the database in real implementation)
-        entry_dict['mood'] = MoodData(
-            id=mood_id,
-            emoji='❓',
-            label=mood_id.title(),
-            color='bg-gray-100 border-gray-300',
-            particles='gray',
-            intensity=3,
-            category='neutral',
-            isCustom=True
-        )
-    return entry_dict
+def list_response(endpoint: str, model, rows: List[dict], response: Response = None, headers: dict = None):
+    """Models for `response_model`, or a pre-encoded response when the endpoint opted into fast JSON"""
+    if endpoint in FAST_JSON_ENDPOINTS:
+        return FastJSONResponse(trusted_rows(model, rows), headers=headers)
+    if headers:
+        response.headers.update(headers)
+    return [model(**row) for row in rows]
 
 async def calculate_advanced_streak(user_id: str):
     """Calculate comprehensive streak data"""
-    entries = await db.mood_entries.find({'user_id': user_id}).sort('date', -1).to_list(length=None)
-    if not entries:
-        return {'current': 0, 'longest': 0, 'breaks': 0}
-    
-    current_streak = 0
-    longest_streak = 0
-    temp_streak = 0
-    breaks = 0
-    
-    # Group entries by date
-    dates = sorted(set(entry['date'] for entry in entries), reverse=True)
-    
-    today = datetime.now().strftime('%Y-%m-%d')
-    expected_date = datetime.now()
-    
-    for date in dates:
-        if date == expected_date.strftime('%Y-%m-%d'):
-            temp_streak += 1
-            current_streak = temp_streak if date == today or current_streak == 0 else current_streak
-        else:
-            if temp_streak > longest_streak:
-                longest_streak = temp_streak
-            if temp_streak > 0:
-                breaks += 1
-            temp_streak = 1 if date == expected_date.strftime('%Y-%m-%d') else 0
-        
-        expected_date -= timedelta(days=1)
-    
-    if temp_streak > longest_streak:
-        longest_streak = temp_streak
-    
-    return {'current': current_streak, 'longest': longest_streak, 'breaks': breaks}
+    state = await get_streak_state(db, user_id)
+    return streak_summary(state)
 
 async def generate_ai_insights(user_id: str, entries: List[dict]):
     """Generate comprehensive AI insights"""
-    if not entries:
-        return ["Start your emotional journey by recording your first mood! 🌟"]
-    
-    insights = []
-    
-    # Mood pattern analysis
-    positive_moods = [e for e in entries if e and MOODS.get(e.get('mood_id'), {}).get('category') == 'positive']
-    negative_moods = [e for e in entries if e and MOODS.get(e.get('mood_id'), {}).get('category') == 'negative']
-    
-    if len(entries) > 0:
-        positive_ratio = len(positive_moods) / len(entries)
-        
-        if positive_ratio > 0.75:
-            insights.append("🌟 Exceptional emotional well-being! You're maintaining a very positive mindset.")
-        elif positive_ratio > 0.6:
-            insights.append("😊 Great emotional balance! You're handling life's challenges well.")
-        elif positive_ratio < 0.3:
-            insights.append("💙 Consider focusing on self-care activities. Remember, seeking support is a sign of strength.")
-        else:
-            insights.append("🌈 Your emotional journey shows variety - this is completely normal and healthy.")
-    
-    # Time pattern analysis
-    recent_entries = entries[:14]  # Last 2 weeks
-    if len(recent_entries) >= 3:
-        intensities = [e.get('intensity', 3) for e in recent_entries if e and e.get('intensity')]
-        if intensities:
-            avg_intensity = statistics.mean(intensities)
-            if avg_intensity > 4:
-                insights.append("⚡ Your emotional intensity has been high lately. Consider meditation to find balance.")
-            elif avg_intensity < 2:
-                insights.append("🌱 Your emotions seem gentle recently. This could be a time for self-reflection.")
-    
-    # Weather correlation
-    weather_entries = []
-    for e in entries:
-        if e and e.get('weather') and isinstance(e.get('weather'), dict) and e['weather'].get('condition'):
-            weather_entries.append(e)
-    
-    if len(weather_entries) > 3:
-        sunny_moods = [e for e in weather_entries if e['weather'].get('condition') == 'sunny']
-        if len(sunny_moods) > len(weather_entries) * 0.6:
-            insights.append("☀️ You tend to feel better on sunny days. Try light therapy during gloomy weather.")
-    
-    # Social activity correlation
-    social_entries = []
-    for e in entries:
-        if e and e.get('tags') and isinstance(e.get('tags'), list) and 'social' in e['tags']:
-            social_entries.append(e)
-    
-    if len(social_entries) > 2:
-        social_intensities = [e.get('intensity', 3) for e in social_entries if e.get('intensity')]
-        all_intensities = [e.get('intensity', 3) for e in entries if e and e.get('intensity')]
-        if social_intensities and all_intensities:
-            social_avg = statistics.mean(social_intensities)
-            overall_avg = statistics.mean(all_intensities)
-            if social_avg > overall_avg + 0.5:
-                insights.append("👥 Social activities boost your mood significantly. Stay connected with friends!")
-    
-    # Gratitude practice
-    grateful_entries = [e for e in entries if e and e.get('mood_id') == 'grateful']
-    if len(grateful_entries) > 3:
-        insights.append("🙏 Your gratitude practice is strong and contributes to emotional resilience.")
-    
-    # Exercise correlation
-    exercise_entries = []
-    for e in entries:
-        if e and e.get('tags') and isinstance(e.get('tags'), list) and 'exercise' in e['tags']:
-            exercise_entries.append(e)
-    
-    if len(exercise_entries) > 2:
-        exercise_intensities = [e.get('intensity', 3) for e in exercise_entries if e.get('intensity')]
-        if exercise_intensities and statistics.mean(exercise_intensities) > 3.5:
-            insights.append("🏃‍♀️ Exercise significantly improves your mood. Keep up the active lifestyle!")
-    
-    # Ensure we always return at least one insight
-    if not insights:
-        insights.append("📈 Keep tracking your moods to unlock personalized insights about your emotional patterns!")
-    
-    return insights[:5]  # Return top 5 insights
+    return MoodFrame(entries).insights()
 
 async def check_crisis_keywords(text: str):
     """Check for crisis-related keywords"""
     if not text:
         return False
     
-    text_lower = text.lower()
-    return any(keyword in text_lower for keyword in CRISIS_KEYWORDS)
+    return CRISIS_MATCHER.search(text)
 
-async def check_and_unlock_achievements(user_id: str):
-    """Comprehensive achievement checking"""
-    # Get user data
-    entries = await db.mood_entries.find({'user_id': user_id}).to_list(length=None)
-    user_achievements = await db.achievements.find({'user_id': user_id}).to_list(length=None)
-    friends = await db.friends.find({'user_id': user_id, 'status': 'accepted'}).to_list(length=None)
-    meditations = await db.meditation_sessions.find({'user_id': user_id, 'completed': True}).to_list(length=None)
-    custom_moods = await db.custom_moods.find({'user_id': user_id}).to_list(length=None)
-    
-    unlocked = []
-    streak_data = await calculate_advanced_streak(user_id)
-    
-    # Check all achievements
-    for achievement in ACHIEVEMENTS:
-        # Skip if already unlocked
-        if any(ua['achievement_id'] == achievement['id'] for ua in user_achievements):
-            continue
-        
-        criteria = achievement['unlock_criteria']
-        
-        # Basic milestones
-        if 'entries_count' in criteria and len(entries) >= criteria['entries_count']:
-            unlocked.append(achievement['id'])
-        
-        # Streak achievements
-        if 'streak_days' in criteria and streak_data['current'] >= criteria['streak_days']:
-            unlocked.append(achievement['id'])
-        
-        # Mood exploration
-        if 'unique_moods' in criteria:
-            unique_moods = set(entry['mood_id'] for entry in entries)
-            if len(unique_moods) >= criteria['unique_moods']:
-                unlocked.append(achievement['id'])
-        
-        # Specific mood counts
-        if 'grateful_count' in criteria:
-            grateful_count = len([e for e in entries if e['mood_id'] == 'grateful'])
-            if grateful_count >= criteria['grateful_count']:
-                unlocked.append(achievement['id'])
-        
-        # Social achievements
-        if 'friends_count' in criteria and len(friends) >= criteria['friends_count']:
-            unlocked.append(achievement['id'])
-        
-        # Wellness achievements
-        if 'meditation_sessions' in criteria and len(meditations) >= criteria['meditation_sessions']:
-            unlocked.append(achievement['id'])
-        
-        # Expression achievements
-        if 'voice_notes' in criteria:
-            voice_count = len([e for e in entries if e.get('voice_note_url')])
-            if voice_count >= criteria['voice_notes']:
-                unlocked.append(achievement['id'])
-        
-        if 'photos_attached' in criteria:
-            photo_count = len([e for e in entries if e.get('photo_url')])
-            if photo_count >= criteria['photos_attached']:
-                unlocked.append(achievement['id'])
-        
-        # All moods used
-        if 'all_moods_used' in criteria:
-            unique_moods = set(entry['mood_id'] for entry in entries)
-            total_available = len(MOODS) + len(custom_moods)
-            if len(unique_moods) >= min(16, total_available):
-                unlocked.append(achievement['id'])
-        
-        # Total days
-        if 'total_days' in criteria:
-            unique_dates = set(entry['date'] for entry in entries)
-            if len(unique_dates) >= criteria['total_days']:
-                unlocked.append(achievement['id'])
-        
-        # Weather conditions
-        if 'weather_conditions' in criteria:
-            weather_conditions = set()
-            for entry in entries:
-                if entry.get('weather', {}).get('condition'):
-                    weather_conditions.add(entry['weather']['condition'])
-            if len(weather_conditions) >= criteria['weather_conditions']:
-                unlocked.append(achievement['id'])
-        
-        # Midnight entries
-        if 'midnight_entries' in criteria:
-            midnight_count = 0
-            for entry in entries:
-                if entry.get('timestamp'):
-                    hour = entry['timestamp'].hour
-                    if hour >= 23 or hour <= 2:
-                        midnight_count += 1
-            if midnight_count >= criteria['midnight_entries']:
-                unlocked.append(achievement['id'])
-    
-    return unlocked
+async def send_notification(notification: Notification):
+    """Store a notification and push it to the user's open connections"""
+    notification_doc = notification.dict()
+    await notification_counters.insert_notification(db, notification_doc)
+    if notification_feed.publishes_locally:
+        notification_hub.publish(notification_doc)
+
+async def award_achievements(user_id: str, achievement_ids: List[str]):
+    """Store newly unlocked achievements, notify the user and share them if they opted in"""
+    for achievement_id in achievement_ids:
+        achievement_doc = {
+            'id': str(uuid.uuid4()),
+            'user_id': user_id,
+            'achievement_id': achievement_id,
+            'unlock_date': datetime.utcnow()
+        }
+        await db.achievements.insert_one(achievement_doc)
+        
+        # Create achievement notification
+        achievement = next((a for a in ACHIEVEMENTS if a['id'] == achievement_id), None)
+        if achievement:
+            notif = Notification(
+                user_id=user_id,
+                type="achievement",
+                title="🎉 Achievement Unlocked!",
+                body=f"You've earned: {achievement['name']}",
+                priority="high"
+            )
+            await send_notification(notif)
+            # Friends' timelines are updated in the background
+            feed_item = await share_achievement(db, user_id, achievement)
+            if feed_item:
+                await job_queue.enqueue('feed_fanout', item_id=feed_item['id'])
+
+@job_queue.register('crisis_support')
+async def send_crisis_support(user_id: str):
+    """Notify a user whose note matched crisis keywords"""
+    crisis_notification = Notification(
+        user_id=user_id,
+        type="crisis_support",
+        title="Support Available",
+        body="We noticed you might need support. Help is available 24/7.",
+        priority="urgent"
+    )
+    await send_notification(crisis_notification)
+
+@job_queue.register('feed_fanout')
+async def fan_out_feed_item(item_id: str):
+    """Push a new feed item onto its audience's timelines"""
+    await fan_out_item(db, item_id, fanout_limit=FEED_FANOUT_LIMIT, graph=friend_graph)
+
+@job_queue.register('mood_rollup')
+async def update_mood_rollup(user_id: str, before: Optional[dict] = None, after: Optional[dict] = None):
+    """Apply a mood write to the user's stats rollup"""
+    await apply_mood_write(db, user_id, before=before, after=after)
+
+@job_queue.register('mood_achievements')
+async def update_mood_achievements(user_id: str, before: Optional[dict] = None, after: Optional[dict] = None):
+    """Advance streak and achievement progress for a mood write"""
+    streak = None
+    if not before:
+        streak_state = await record_mood_date(db, user_id, after['date'])
+        streak = streak_summary(streak_state)
+    new_achievements = await record_mood_achievements(db, user_id, before=before, after=after, streak=streak)
+    await award_achievements(user_id, new_achievements)
 
 @api_router.post("/auth/google-callback")
 async def google_oauth_callback(request_data: dict):
@@ -306,73 +256,23 @@ async def google_oauth_callback(request_data: dict):
             "redirect_uri": redirect_uri,
         }
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(token_url, data=token_data) as response:
-                if response.status != 200:
-                    return {"success": False, "message": "Failed to exchange code for token"}
-                
-                token_response = await response.json()
-                access_token = token_response.get('access_token')
-                
-                if not access_token:
-                    return {"success": False, "message": "No access token received"}
+        status, token_response = await http_pool.request_json('POST', token_url, data=token_data)
+        if status != 200:
+            return {"success": False, "message": "Failed to exchange code for token"}
+        
+        access_token = token_response.get('access_token')
+        if not access_token:
+            return {"success": False, "message": "No access token received"}
         
         # Get user info from Google
         user_info_url = f"https://www.googleapis.com/oauth2/v2/userinfo?access_token={access_token}"
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(user_info_url) as response:
-                if response.status != 200:
-                    return {"success": False, "message": "Failed to get user info"}
-                
-                user_data = await response.json()
-        
-        # Check if user exists or create new one
-        existing_user = await db.users.find_one({"email": user_data["email"]})
-        
-        if not existing_user:
-            # Create new user
-            user_doc = {
-                "id": user_data["id"],
-                "email": user_data["email"],
-                "name": user_data["name"],
-                "picture": user_data.get("picture", ""),
-                "created_at": datetime.utcnow(),
-                "preferences": {"theme": "dark", "notifications": True},
-                "profile_stats": {
-                    "total_moods": 0,
-                    "current_streak": 0,
-                    "level": 1,
-                    "experience": 0
-                }
-            }
-            await db.users.insert_one(user_doc)
-            user_id = user_data["id"]
-        else:
-            user_id = existing_user["id"]
-        
-        # Create session token
-        session_token = hashlib.sha256(f"{user_id}_{datetime.utcnow()}_{uuid.uuid4()}".encode()).hexdigest()
-        session_doc = {
-            "id": str(uuid.uuid4()),
-            "user_id": user_id,
-            "session_token": session_token,
-            "expires_at": datetime.utcnow() + timedelta(days=7),
-            "created_at": datetime.utcnow(),
-            "is_active": True
-        }
-        await db.user_sessions.insert_one(session_doc)
+        status, user_data = await http_pool.request_json('GET', user_info_url)
+        if status != 200:
+            return {"success": False, "message": "Failed to get user info"}
         
-        return {
-            "success": True,
-            "user": {
-                "id": user_id,
-                "email": user_data["email"],
-                "name": user_data["name"],
-                "picture": user_data.get("picture", "")
-            },
-            "session_token": session_token
-        }
+        login = await login_pipeline.login(user_data)
+        return {"success": True, **login}
         
     except Exception as e:
         logger.error(f"Google OAuth callback error: {str(e)}")
@@ -388,63 +288,16 @@ async def authenticate_session(request_data: dict):
             return LoginResponse(success=False, message="Session ID is required")
         
         # Call Emergent auth API for real sessions
-        async with aiohttp.ClientSession() as session:
-            headers = {"X-Session-ID": session_id}
-            async with session.get(
-                "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data",
-                headers=headers
-            ) as response:
-                if response.status != 200:
-                    return LoginResponse(success=False, message="Invalid session")
-                
-                user_data = await response.json()
-        
-        # Check if user exists
-        existing_user = await db.users.find_one({"email": user_data["email"]})
-        
-        if not existing_user:
-            # Create new user
-            user_doc = {
-                "id": user_data["id"],
-                "email": user_data["email"],
-                "name": user_data["name"],
-                "picture": user_data.get("picture", ""),
-                "created_at": datetime.utcnow(),
-                "preferences": {"theme": "dark", "notifications": True},
-                "profile_stats": {
-                    "total_moods": 0,
-                    "current_streak": 0,
-                    "level": 1,
-                    "experience": 0
-                }
-            }
-            await db.users.insert_one(user_doc)
-            user_id = user_data["id"]
-        else:
-            user_id = existing_user["id"]
-        
-        # Create session token (7-day expiry)
-        session_token = hashlib.sha256(f"{user_id}_{datetime.utcnow()}_{uuid.uuid4()}".encode()).hexdigest()
-        session_doc = {
-            "id": str(uuid.uuid4()),
-            "user_id": user_id,
-            "session_token": session_token,
-            "expires_at": datetime.utcnow() + timedelta(days=7),
-            "created_at": datetime.utcnow(),
-            "is_active": True
-        }
-        await db.user_sessions.insert_one(session_doc)
-        
-        return LoginResponse(
-            success=True,
-            user={
-                "id": user_id,
-                "email": user_data["email"],
-                "name": user_data["name"],
-                "picture": user_data.get("picture", "")
-            },
-            session_token=session_token
+        status, user_data = await http_pool.request_json(
+            'GET',
+            "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data",
+            headers={"X-Session-ID": session_id}
         )
+        if status != 200:
+            return LoginResponse(success=False, message="Invalid session")
+        
+        login = await login_pipeline.login(user_data)
+        return LoginResponse(success=True, **login)
         
     except Exception as e:
         logger.error(f"Authentication error: {str(e)}")
@@ -458,6 +311,7 @@ async def logout(session_token: str):
             {"session_token": session_token},
             {"$set": {"is_active": False}}
         )
+        await revoke_session(db, session_cache, session_token, signed=signed_tokens)
         return {"success": True, "message": "Logged out successfully"}
     except Exception as e:
         logger.error(f"Logout error: {str(e)}")
@@ -473,17 +327,13 @@ async def get_current_user(authorization: str = Header(None)):
         session_token = authorization.replace("Bearer ", "")
         
         # Find active session
-        session = await db.user_sessions.find_one({
-            "session_token": session_token,
-            "is_active": True,
-            "expires_at": {"$gte": datetime.utcnow()}
-        })
+        session_user_id = await session_user(session_token)
         
-        if not session:
+        if not session_user_id:
             raise HTTPException(status_code=401, detail="Session expired")
         
         # Get user
-        user = await db.users.find_one({"id": session["user_id"]})
+        user = await db.users.find_one({"id": session_user_id})
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
@@ -502,6 +352,12 @@ async def get_current_user(authorization: str = Header(None)):
         logger.error(f"Get user error: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to get user")
 
+async def session_user(session_token: str) -> Optional[str]:
+    """User id for a live session token, signed or opaque"""
+    if signed_tokens is not None and is_signed_token(session_token):
+        return signed_tokens.verify(session_token)
+    return await lookup_session_user(db, session_cache, session_token)
+
 # Helper function to get authenticated user ID
 async def get_authenticated_user_id(authorization: str = Header(None)) -> str:
     """Extract user ID from session token"""
@@ -511,14 +367,9 @@ async def get_authenticated_user_id(authorization: str = Header(None)) -> str:
     session_token = authorization.replace("Bearer ", "")
     
     try:
-        session = await db.user_sessions.find_one({
-            "session_token": session_token,
-            "is_active": True,
-            "expires_at": {"$gte": datetime.utcnow()}
-        })
-        
-        if session:
-            return session["user_id"]
+        session_user_id = await session_user(session_token)
+        if session_user_id:
+            return session_user_id
     except:
         pass
     
@@ -530,12 +381,30 @@ async def get_authenticated_user_id(authorization: str = Header(None)) -> str:
 async def root():
     return {"message": "Welcome to MoodVerse Ultimate - Your Complete Emotional Intelligence Platform"}
 
+@api_router.get("/metrics")
+async def get_metrics():
+    """Runtime metrics for this worker"""
+    return {
+        "session_cache": {**session_cache.metrics(), "invalidation_mode": revocation_listener.active_mode,
+                          "invalidation_reconnects": revocation_listener.reconnects},
+        "signed_tokens": signed_tokens.metrics() if signed_tokens else None,
+        "friend_graph": friend_graph.metrics(),
+        "http_pool": http_pool.metrics(),
+        "logins": login_pipeline.metrics(),
+        "housekeeping": housekeeper.metrics(),
+        "notifications": {**notification_hub.metrics(), "delivery_mode": notification_feed.active_mode,
+                          "delivery_reconnects": notification_feed.reconnects}
+    }
+
 # User Management
 @api_router.post("/users", response_model=User)
 async def create_user(user_data: dict):
     """Create new user account"""
     user = User(**user_data)
-    await db.users.insert_one(user.dict())
+    try:
+        await db.users.insert_one(user.dict())
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="A user with this email already exists")
     return user
 
 @api_router.get("/users/{user_id}", response_model=User)
@@ -556,79 +425,47 @@ async def create_mood_entry(mood_data: MoodEntryCreate, authorization: str = Hea
         # Validate mood_id
         if mood_data.mood_id not in MOODS:
             # Check if it's a custom mood
-            custom_mood = await db.custom_moods.find_one({'id': mood_data.mood_id, 'user_id': user_id})
-            if not custom_mood:
+            if not await custom_mood_cache.exists(db, user_id, mood_data.mood_id):
                 raise HTTPException(status_code=400, detail="Invalid mood_id")
         
         # Check for crisis keywords
         if await check_crisis_keywords(mood_data.note):
-            # Create crisis notification
-            crisis_notification = Notification(
-                user_id=user_id,
-                type="crisis_support",
-                title="Support Available",
-                body="We noticed you might need support. Help is available 24/7.",
-                priority="urgent"
+            await job_queue.enqueue('crisis_support', user_id=user_id)
+        
+        # Upsert the day's entry in one round trip; the pre-image tells us
+        # whether this was an insert and what the stats should move from
+        now = datetime.utcnow()
+        set_fields = mood_data.dict(exclude_unset=True)
+        set_fields['user_id'] = user_id
+        set_fields['updated_at'] = now
+        set_on_insert = {'id': str(uuid.uuid4()), 'created_at': now}
+        if not set_fields.get('timestamp'):
+            set_fields.pop('timestamp', None)
+            set_on_insert['timestamp'] = now
+        
+        entry_filter = {'user_id': user_id, 'date': mood_data.date}
+        update = {'$set': set_fields, '$setOnInsert': set_on_insert}
+        try:
+            existing_entry = await db.mood_entries.find_one_and_update(
+                entry_filter, update, upsert=True, return_document=ReturnDocument.BEFORE
+            )
+        except DuplicateKeyError:
+            # A concurrent post inserted the same day first; now it's a plain update
+            existing_entry = await db.mood_entries.find_one_and_update(
+                entry_filter, update, upsert=True, return_document=ReturnDocument.BEFORE
             )
-            await db.notifications.insert_one(crisis_notification.dict())
-        
-        # Check if entry exists for this date
-        existing_entry = await db.mood_entries.find_one({'user_id': user_id, 'date': mood_data.date})
         
         if existing_entry:
-            # Update existing entry
-            update_data = mood_data.dict(exclude_unset=True)
-            update_data['updated_at'] = datetime.utcnow()
-            update_data['user_id'] = user_id
-            
-            await db.mood_entries.update_one(
-                {'user_id': user_id, 'date': mood_data.date},
-                {'$set': update_data}
-            )
-            
-            updated_entry = await db.mood_entries.find_one({'user_id': user_id, 'date': mood_data.date})
-            return MoodEntry(**enrich_mood_entry(updated_entry))
+            saved_entry = {**existing_entry, **set_fields}
         else:
-            # Create new entry - fix datetime serialization
-            mood_entry_dict = mood_data.dict(exclude_unset=True)
-            mood_entry_dict['user_id'] = user_id
-            mood_entry_dict['id'] = str(uuid.uuid4())
-            mood_entry_dict['created_at'] = datetime.utcnow()
-            mood_entry_dict['updated_at'] = datetime.utcnow()
-            
-            # Ensure timestamp is set properly
-            if not mood_entry_dict.get('timestamp'):
-                mood_entry_dict['timestamp'] = datetime.utcnow()
-            
-            # Insert directly without double validation
-            await db.mood_entries.insert_one(mood_entry_dict)
-            
-            # Check for achievements
-            new_achievements = await check_and_unlock_achievements(user_id)
-            for achievement_id in new_achievements:
-                achievement_doc = {
-                    'id': str(uuid.uuid4()),
-                    'user_id': user_id,
-                    'achievement_id': achievement_id,
-                    'unlock_date': datetime.utcnow()
-                }
-                await db.achievements.insert_one(achievement_doc)
-                
-                # Create achievement notification
-                achievement = next((a for a in ACHIEVEMENTS if a['id'] == achievement_id), None)
-                if achievement:
-                    notif = Notification(
-                        user_id=user_id,
-                        type="achievement",
-                        title="🎉 Achievement Unlocked!",
-                        body=f"You've earned: {achievement['name']}",
-                        priority="high"
-                    )
-                    await db.notifications.insert_one(notif.dict())
-            
-            # Retrieve and enrich the entry
-            saved_entry = await db.mood_entries.find_one({'user_id': user_id, 'date': mood_data.date})
-            return MoodEntry(**enrich_mood_entry(saved_entry))
+            saved_entry = {**set_on_insert, **set_fields}
+        
+        # Stats, streak and achievements are updated off the request path
+        await job_queue.enqueue('mood_rollup', user_id=user_id, before=existing_entry, after=dict(saved_entry))
+        await job_queue.enqueue('mood_achievements', user_id=user_id, before=existing_entry, after=dict(saved_entry))
+        
+        catalog = await catalog_for(db, custom_mood_cache, user_id, [saved_entry['mood_id']])
+        return MoodEntry(**enrich_mood_entry(saved_entry, catalog))
     
     except HTTPException:
         raise
@@ -638,12 +475,15 @@ async def create_mood_entry(mood_data: MoodEntryCreate, authorization: str = Hea
 
 @api_router.get("/moods", response_model=List[MoodEntry])
 async def get_mood_entries(
+    request: Request,
+    response: Response,
     authorization: str = Header(None),
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
-    limit: int = 100
+    limit: int = 100,
+    cursor: Optional[str] = None
 ):
-    """Get enhanced mood entries with all features"""
+    """Get enhanced mood entries with all features, newest first, one page at a time"""
     user_id = await get_authenticated_user_id(authorization)
     query = {'user_id': user_id}
     
@@ -655,23 +495,67 @@ async def get_mood_entries(
             date_query['$lte'] = end_date
         query['date'] = date_query
     
-    cursor = db.mood_entries.find(query).sort('date', -1).limit(limit)
-    entries = await cursor.to_list(length=limit)
+    if cursor:
+        try:
+            after = decode_cursor(cursor, 2)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = {'$and': [query, keyset_filter(('date', 'id'), after)]}
     
-    enriched_entries = []
-    for entry in entries:
-        enriched_entry = enrich_mood_entry(entry)
-        enriched_entries.append(MoodEntry(**enriched_entry))
+    # One extra row tells us whether another page follows
+    limit = clamp_page_size(limit, MOOD_PAGE_SIZE_MAX)
+    entries = await db.mood_entries.find(query).sort([('date', -1), ('id', -1)]).limit(limit + 1).to_list(length=limit + 1)
+    
+    headers = {}
+    if len(entries) > limit:
+        entries = entries[:limit]
+        next_cursor = encode_cursor(entries[-1]['date'], entries[-1]['id'])
+        headers['Link'] = f'<{request.url.include_query_params(cursor=next_cursor)}>; rel="next"'
+        headers['X-Next-Cursor'] = next_cursor
+    
+    # Custom moods on the page are resolved together, usually from the per-user cache
+    catalog = await catalog_for(db, custom_mood_cache, user_id, {entry['mood_id'] for entry in entries})
+    
+    enriched_entries = [enrich_mood_entry(entry, catalog) for entry in entries]
+    return list_response('moods', MoodEntry, enriched_entries, response, headers)
+
+async def rollup_mood_stats(user_id: str):
+    """Stats aggregates and insights from the user's rollup document"""
+    rollup = await get_user_rollup(db, user_id)
+    if not rollup.get('total_entries'):
+        return {'total_entries': 0}, []
     
-    return enriched_entries
+    stats = rollup_stats(rollup)
+    
+    # Time-based averages only need the latest month of entries
+    monthly_entries = await db.mood_entries.find({'user_id': user_id}).sort('date', -1).limit(30).to_list(length=30)
+    recent_entries = monthly_entries[:7]  # Last 7 days
+    
+    weekly_avg = statistics.mean([e.get('intensity', 3) for e in recent_entries]) if recent_entries else 0.0
+    monthly_avg = statistics.mean([e.get('intensity', 3) for e in monthly_entries]) if monthly_entries else 0.0
+    stats['weekly_average_intensity'] = round(weekly_avg, 1)
+    stats['monthly_average_intensity'] = round(monthly_avg, 1)
+    
+    return stats, rollup_insights(rollup, monthly_entries)
+
+async def frame_mood_stats(user_id: str):
+    """Stats aggregates and insights computed over the full history in NumPy"""
+    frame = await MoodFrame.load(db, user_id)
+    return frame.stats(), frame.insights()
 
 @api_router.get("/moods/stats", response_model=MoodStats)
 async def get_comprehensive_mood_stats(authorization: str = Header(None)):
     """Get advanced mood statistics with AI insights"""
     user_id = await get_authenticated_user_id(authorization)
-    entries = await db.mood_entries.find({'user_id': user_id}).to_list(length=None)
     
-    if not entries:
+    if STATS_BACKEND == 'frame':
+        stats, insights = await frame_mood_stats(user_id)
+    elif STATS_BACKEND == 'aggregation':
+        stats, insights = await aggregate_mood_stats(db, user_id)
+    else:
+        stats, insights = await rollup_mood_stats(user_id)
+    
+    if not stats['total_entries']:
         return MoodStats(
             total_entries=0,
             mood_counts={},
@@ -688,70 +572,20 @@ async def get_comprehensive_mood_stats(authorization: str = Header(None)):
             goals_progress={}
         )
     
-    # Calculate comprehensive stats
-    mood_counts = {}
-    mood_distribution = {'positive': 0, 'neutral': 0, 'negative': 0}
-    weather_correlation = {}
-    activity_correlation = {}
-    
-    for entry in entries:
-        if entry is None:
-            continue
-            
-        mood_label = MOODS.get(entry['mood_id'], {}).get('label', entry['mood_id'])
-        mood_counts[mood_label] = mood_counts.get(mood_label, 0) + 1
-        
-        category = MOODS.get(entry['mood_id'], {}).get('category', 'neutral')
-        mood_distribution[category] += 1
-        
-        # Weather correlation
-        weather_data = entry.get('weather')
-        if weather_data and isinstance(weather_data, dict) and weather_data.get('condition'):
-            weather = weather_data['condition']
-            if weather not in weather_correlation:
-                weather_correlation[weather] = {'positive': 0, 'neutral': 0, 'negative': 0}
-            weather_correlation[weather][category] += 1
-        
-        # Activity correlation
-        tags = entry.get('tags', [])
-        if tags and isinstance(tags, list):
-            for tag in tags:
-                if tag not in activity_correlation:
-                    activity_correlation[tag] = {'count': 0, 'avg_intensity': 0, 'moods': []}
-                activity_correlation[tag]['count'] += 1
-                activity_correlation[tag]['moods'].append(entry.get('intensity', 3))
-    
-    # Calculate averages
-    for activity in activity_correlation:
-        moods = activity_correlation[activity]['moods']
-        activity_correlation[activity]['avg_intensity'] = statistics.mean(moods) if moods else 0
-    
-    most_common_mood = max(mood_counts.items(), key=lambda x: x[1])[0] if mood_counts else ""
-    
     # Streak data
     streak_data = await calculate_advanced_streak(user_id)
     
-    # Time-based averages
-    recent_entries = entries[:7]  # Last 7 days
-    monthly_entries = entries[:30]  # Last 30 days
-    
-    weekly_avg = statistics.mean([e.get('intensity', 3) for e in recent_entries]) if recent_entries else 0.0
-    monthly_avg = statistics.mean([e.get('intensity', 3) for e in monthly_entries]) if monthly_entries else 0.0
-    
-    # AI insights
-    insights = await generate_ai_insights(user_id, entries)
-    
     return MoodStats(
-        total_entries=len(entries),
-        mood_counts=mood_counts,
-        most_common_mood=most_common_mood,
+        total_entries=stats['total_entries'],
+        mood_counts=stats['mood_counts'],
+        most_common_mood=stats['most_common_mood'],
         current_streak=streak_data['current'],
         longest_streak=streak_data['longest'],
-        weekly_average_intensity=round(weekly_avg, 1),
-        monthly_average_intensity=round(monthly_avg, 1),
-        mood_distribution=mood_distribution,
-        weather_correlation=weather_correlation,
-        activity_correlation=activity_correlation,
+        weekly_average_intensity=stats['weekly_average_intensity'],
+        monthly_average_intensity=stats['monthly_average_intensity'],
+        mood_distribution=stats['mood_distribution'],
+        weather_correlation=stats['weather_correlation'],
+        activity_correlation=stats['activity_correlation'],
         recommendations=insights,
         insights=insights,
         goals_progress={}
@@ -777,15 +611,8 @@ async def send_friend_request(request_data: dict, authorization: str = Header(No
         if target_user_id == user_id:
             raise HTTPException(status_code=400, detail="Cannot send friend request to yourself")
         
-        # Check if friendship already exists
-        existing = await db.friends.find_one({
-            '$or': [
-                {'user_id': user_id, 'friend_id': target_user_id},
-                {'user_id': target_user_id, 'friend_id': user_id}
-            ]
-        })
-        
-        if existing:
+        # Check if friendship already exists (in either direction)
+        if await friend_graph.connected(db, user_id, target_user_id):
             raise HTTPException(status_code=400, detail="Friendship already exists or request pending")
         
         # Create friend request
@@ -797,7 +624,10 @@ async def send_friend_request(request_data: dict, authorization: str = Header(No
             'connection_date': datetime.utcnow()
         }
         
-        await db.friends.insert_one(friend_request)
+        try:
+            await friend_graph.add_request(db, friend_request)
+        except DuplicateKeyError:
+            raise HTTPException(status_code=400, detail="Friendship already exists or request pending")
         
         # Create notification
         notification = Notification(
@@ -807,7 +637,7 @@ async def send_friend_request(request_data: dict, authorization: str = Header(No
             body=f"You have a new friend request!",
             priority="normal"
         )
-        await db.notifications.insert_one(notification.dict())
+        await send_notification(notification)
         
         return {"message": "Friend request sent successfully"}
         
@@ -831,6 +661,9 @@ async def create_custom_mood(mood_data: dict, authorization: str = Header(None))
     user_id = await get_authenticated_user_id(authorization)
     custom_mood = CustomMood(user_id=user_id, **mood_data)
     await db.custom_moods.insert_one(custom_mood.dict())
+    custom_mood_cache.invalidate(user_id)
+    new_achievements = await record_counter_event(db, user_id, 'custom_moods', written_at=custom_mood.created_at)
+    await award_achievements(user_id, new_achievements)
     return custom_mood
 
 # Meditation & Wellness
@@ -841,17 +674,9 @@ async def create_meditation_session(session_data: dict, user_id: str = "demo_use
     await db.meditation_sessions.insert_one(session.dict())
     
     # Check for achievements
-    sessions = await db.meditation_sessions.find({'user_id': user_id, 'completed': True}).to_list(length=None)
-    if len(sessions) >= 10:
-        # Unlock zen master achievement if not already unlocked
-        existing = await db.achievements.find_one({'user_id': user_id, 'achievement_id': 'zen_master'})
-        if not existing:
-            achievement_doc = {
-                'user_id': user_id,
-                'achievement_id': 'zen_master',
-                'unlock_date': datetime.utcnow()
-            }
-            await db.achievements.insert_one(achievement_doc)
+    if session.completed:
+        new_achievements = await record_counter_event(db, user_id, 'meditation_sessions', written_at=session.timestamp)
+        await award_achievements(user_id, new_achievements)
     
     return session
 
@@ -859,7 +684,7 @@ async def create_meditation_session(session_data: dict, user_id: str = "demo_use
 async def get_meditation_sessions(user_id: str = "demo_user"):
     """Get user's meditation sessions"""
     sessions = await db.meditation_sessions.find({'user_id': user_id}).to_list(length=None)
-    return [MeditationSession(**session) for session in sessions]
+    return list_response('meditation_sessions', MeditationSession, sessions)
 
 # Achievements
 @api_router.get("/user/achievements")
@@ -882,19 +707,92 @@ async def get_user_achievements(authorization: str = Header(None)):
 
 # Notifications
 @api_router.get("/notifications", response_model=List[Notification])
-async def get_notifications(authorization: str = Header(None), limit: int = 50):
-    """Get user notifications"""
+async def get_notifications(
+    request: Request,
+    response: Response,
+    authorization: str = Header(None),
+    limit: int = 50,
+    cursor: Optional[str] = None
+):
+    """Get user notifications, newest first, one page at a time"""
+    user_id = await get_authenticated_user_id(authorization)
+    query = {'user_id': user_id}
+    if cursor:
+        try:
+            after = decode_cursor(cursor, 2)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = {'$and': [query, keyset_filter(('timestamp', 'id'), after)]}
+    
+    limit = clamp_page_size(limit, NOTIFICATION_PAGE_SIZE_MAX)
+    notifications = await db.notifications.find(query).sort([('timestamp', -1), ('id', -1)]).limit(limit + 1).to_list(length=limit + 1)
+    
+    headers = {}
+    if len(notifications) > limit:
+        notifications = notifications[:limit]
+        next_cursor = encode_cursor(notifications[-1]['timestamp'], notifications[-1]['id'])
+        headers['Link'] = f'<{request.url.include_query_params(cursor=next_cursor)}>; rel="next"'
+        headers['X-Next-Cursor'] = next_cursor
+    
+    return list_response('notifications', Notification, notifications, response, headers)
+
+@api_router.get("/notifications/unread_count")
+async def get_unread_notification_count(authorization: str = Header(None)):
+    """Unread badge count"""
+    user_id = await get_authenticated_user_id(authorization)
+    return {"unread": await notification_counters.unread_count(db, user_id)}
+
+@api_router.put("/notifications/read")
+async def mark_notifications_read(request_data: dict, authorization: str = Header(None)):
+    """Mark the given notifications as read"""
     user_id = await get_authenticated_user_id(authorization)
-    notifications = await db.notifications.find({'user_id': user_id}).sort('timestamp', -1).limit(limit).to_list(length=limit)
-    return [Notification(**notif) for notif in notifications]
+    notification_ids = request_data.get('ids')
+    if not isinstance(notification_ids, list) or not all(isinstance(i, str) for i in notification_ids):
+        raise HTTPException(status_code=400, detail="ids must be a list of notification ids")
+    updated = await notification_counters.mark_read(db, user_id, notification_ids)
+    return {"message": "Notifications marked as read", "updated": updated}
+
+@api_router.put("/notifications/read_all")
+async def mark_all_notifications_read(authorization: str = Header(None)):
+    """Mark every notification as read"""
+    user_id = await get_authenticated_user_id(authorization)
+    updated = await notification_counters.mark_all_read(db, user_id)
+    return {"message": "All notifications marked as read", "updated": updated}
+
+async def notification_stream_user(authorization: Optional[str], token: Optional[str]) -> Optional[str]:
+    """Session owner for a push connection; browsers can't set headers on these, so `?token=` is accepted too"""
+    if authorization and authorization.startswith("Bearer "):
+        token = authorization.replace("Bearer ", "")
+    if not token:
+        return None
+    return await session_user(token)
+
+@api_router.websocket("/notifications/ws")
+async def notifications_websocket(websocket: WebSocket, token: Optional[str] = None):
+    """Push notifications as they are created"""
+    user_id = await notification_stream_user(websocket.headers.get('authorization'), token)
+    if not user_id:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    await pump_websocket(notification_hub, websocket, user_id)
+
+@api_router.get("/notifications/stream")
+async def notifications_event_stream(request: Request, authorization: str = Header(None), token: Optional[str] = None):
+    """Server-sent events fallback for clients without WebSockets"""
+    user_id = await notification_stream_user(authorization, token)
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Authentication required")
+    return StreamingResponse(
+        sse_events(notification_hub, request, user_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @api_router.put("/notifications/{notification_id}/read")
 async def mark_notification_read(notification_id: str):
     """Mark notification as read"""
-    await db.notifications.update_one(
-        {'id': notification_id},
-        {'$set': {'read': True}}
-    )
+    await notification_counters.mark_notification_read(db, notification_id)
     return {"message": "Notification marked as read"}
 
 # File Upload
@@ -960,6 +858,7 @@ async def upload_voice(file: UploadFile = File(None)):
 @api_router.get("/moods/export/csv")
 async def export_comprehensive_csv(
     authorization: str = Header(None),
+    accept_encoding: str = Header(None),
     start_date: Optional[str] = None,
     end_date: Optional[str] = None
 ):
@@ -975,50 +874,107 @@ async def export_comprehensive_csv(
                 date_query['$lte'] = end_date
             query['date'] = date_query
         
-        # Use limit to prevent timeout
-        entries = await db.mood_entries.find(query).sort('date', 1).limit(1000).to_list(length=1000)
-        
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Enhanced header with all fields
-        writer.writerow([
-            'Date', 'Mood', 'Emoji', 'Category', 'Intensity', 'Note',
-            'Weather', 'Location', 'Tags', 'Voice Note', 'Photo',
-            'Activity Data', 'Sleep Data', 'Timestamp'
-        ])
-        
-        for entry in entries:
-            mood_data = MOODS.get(entry['mood_id'], {})
-            writer.writerow([
-                entry.get('date', ''),
-                mood_data.get('label', entry.get('mood_id', '')),
-                mood_data.get('emoji', ''),
-                mood_data.get('category', 'neutral'),
-                entry.get('intensity', 3),
-                entry.get('note', ''),
-                json.dumps(entry.get('weather', {})) if entry.get('weather') else '',
-                json.dumps(entry.get('location', {})) if entry.get('location') else '',
-                ','.join(entry.get('tags', [])),
-                'Yes' if entry.get('voice_note_url') else 'No',
-                'Yes' if entry.get('photo_url') else 'No',
-                json.dumps(entry.get('activity_data', {})) if entry.get('activity_data') else '',
-                json.dumps(entry.get('sleep_data', {})) if entry.get('sleep_data') else '',
-                entry.get('timestamp', '').strftime('%Y-%m-%d %H:%M:%S') if isinstance(entry.get('timestamp'), datetime) else str(entry.get('timestamp', ''))
-            ])
-        
-        output.seek(0)
-        
-        return StreamingResponse(
-            io.BytesIO(output.getvalue().encode('utf-8')),
-            media_type='text/csv',
-            headers={'Content-Disposition': f'attachment; filename=moodverse-ultimate-{datetime.now().strftime("%Y-%m-%d")}.csv'}
-        )
+        # Rows are written and sent batch by batch straight off the cursor
+        cursor = db.mood_entries.find(query).sort('date', 1).batch_size(EXPORT_BATCH_SIZE)
+        chunks = iter_csv(cursor)
+        headers = {'Content-Disposition': f'attachment; filename=moodverse-ultimate-{datetime.now().strftime("%Y-%m-%d")}.csv'}
+        if accepts_gzip(accept_encoding):
+            chunks = gzip_chunks(chunks)
+            headers['Content-Encoding'] = 'gzip'
+            headers['Vary'] = 'Accept-Encoding'
+        
+        return StreamingResponse(chunks, media_type='text/csv', headers=headers)
         
     except Exception as e:
         logger.error(f"Error exporting CSV: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to export CSV: {str(e)}")
 
+@api_router.get("/moods/export/{export_format}")
+async def export_mood_history(
+    export_format: str,
+    authorization: str = Header(None),
+    accept_encoding: str = Header(None),
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None
+):
+    """Export mood history as NDJSON, Parquet or an Arrow IPC stream with flattened, typed columns"""
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported export format. Choose from: csv, {', '.join(EXPORT_FORMATS)}")
+    if export_format in COLUMNAR_FORMATS and pa is None:
+        raise HTTPException(status_code=501, detail=f"{export_format} export requires pyarrow")
+    
+    user_id = await get_authenticated_user_id(authorization)
+    try:
+        query = {'user_id': user_id}
+        if start_date or end_date:
+            date_query = {}
+            if start_date:
+                date_query['$gte'] = start_date
+            if end_date:
+                date_query['$lte'] = end_date
+            query['date'] = date_query
+        
+        cursor = db.mood_entries.find(query).sort('date', 1).batch_size(EXPORT_BATCH_SIZE)
+        media_type, extension = EXPORT_FORMATS[export_format]
+        headers = {'Content-Disposition': f'attachment; filename=moodverse-ultimate-{datetime.now().strftime("%Y-%m-%d")}.{extension}'}
+        
+        if export_format in COLUMNAR_FORMATS:
+            # Nested keys and their types decide the schema before the first batch is written
+            schema, json_columns = export_schema(await nested_key_types(db, query))
+            chunks = iter_columnar(cursor, schema, json_columns, export_format)
+        else:
+            chunks = iter_ndjson(cursor)
+            if accepts_gzip(accept_encoding):
+                chunks = gzip_chunks(chunks)
+                headers['Content-Encoding'] = 'gzip'
+                headers['Vary'] = 'Accept-Encoding'
+        
+        return StreamingResponse(chunks, media_type=media_type, headers=headers)
+        
+    except Exception as e:
+        logger.error(f"Error exporting {export_format}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to export {export_format}: {str(e)}")
+
+# Bulk Import
+@api_router.post("/moods/import")
+async def import_mood_history(
+    request: Request,
+    authorization: str = Header(None),
+    content_type: str = Header(None),
+    format: Optional[str] = None
+):
+    """Import mood history from an exported CSV or NDJSON body; existing days are overwritten"""
+    user_id = await get_authenticated_user_id(authorization)
+    import_as = import_format(format, content_type)
+    if import_as is None:
+        raise HTTPException(status_code=415, detail=f"Send text/csv or application/x-ndjson, or pass format={' or '.join(IMPORT_FORMATS)}")
+    
+    result = new_import_result()
+    try:
+        try:
+            mood_ids = set(MOODS) | set(await db.custom_moods.distinct('id', {'user_id': user_id}))
+            parse = iter_csv_records if import_as == 'csv' else iter_ndjson_records
+            await import_mood_entries(
+                db, user_id, parse(request.stream()), mood_ids, max_rows=MOOD_IMPORT_MAX_ROWS,
+                batch_size=MOOD_IMPORT_BATCH_SIZE, result=result
+            )
+        finally:
+            # Derived state is rebuilt once for the whole import instead of per entry, and also
+            # when the import fails part way, since the batches before the failure are written
+            if result['inserted'] or result['updated']:
+                result['streak'], result['achievements_unlocked'] = await rebuild_derived_state(db, user_id)
+                await award_achievements(user_id, result['achievements_unlocked'])
+        
+        return result
+    
+    except HTTPException:
+        raise
+    except ImportRecordTooLarge as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error importing mood history: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to import mood history: {str(e)}")
+
 # Weekly Reports
 @api_router.get("/reports/weekly", response_model=WeeklyReport)
 async def generate_weekly_report(user_id: str = "demo_user"):
@@ -1079,16 +1035,19 @@ async def generate_weekly_report(user_id: str = "demo_user"):
 @api_router.get("/social/feed", response_model=List[SocialFeedItem])
 async def get_social_feed(user_id: str = "demo_user", limit: int = 20):
     """Get social activity feed"""
+    if FEED_MODE == 'timeline':
+        feed_items = await read_timeline(db, user_id, limit, graph=friend_graph)
+        return list_response('social_feed', SocialFeedItem, feed_items)
+    
     # Get user's friends
-    friends = await db.friends.find({'user_id': user_id, 'status': 'accepted'}).to_list(length=None)
-    friend_ids = [f['friend_id'] for f in friends] + [user_id]  # Include self
+    friend_ids = list(await friend_graph.friend_ids(db, user_id)) + [user_id]  # Include self
     
     # Get recent activities from friends
     feed_items = await db.social_feed.find({
         'user_id': {'$in': friend_ids}
     }).sort('timestamp', -1).limit(limit).to_list(length=limit)
     
-    return [SocialFeedItem(**item) for item in feed_items]
+    return list_response('social_feed', SocialFeedItem, feed_items)
 
 # Include router
 # Payment & Subscription System
@@ -1294,6 +1253,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Link", "X-Next-Cursor"],
 )
 
 logging.basicConfig(level=logging.INFO)
@@ -1302,8 +1262,19 @@ logger = logging.getLogger(__name__)
 @app.on_event("startup")
 async def startup_event():
     logger.info("🚀 MoodVerse Ultimate API is starting up!")
+    await bootstrap_indexes(db, plan_check=os.environ.get('INDEX_PLAN_CHECK', 'warn'))
+    await job_queue.start()
+    revocation_listener.start()
+    notification_feed.start()
+    await http_pool.start()
+    housekeeper.start()
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
     logger.info("👋 MoodVerse Ultimate API is shutting down...")
+    await job_queue.shutdown()
+    await revocation_listener.stop()
+    await notification_feed.stop()
+    await http_pool.close()
+    await housekeeper.stop()
     client.close()
\ No newline at end of file
@@ -0,0 +1,107 @@
+"""Stateless signed session tokens.
+
+With `SESSION_TOKENS=signed`, logins issue HS256 JWTs carrying the user id,
+a random `jti` and an expiry, and authenticating one is a signature check
+with no database I/O. Logout keeps working through a revocation set of
+`jti`s: revocations are written to `session_revocations` like opaque-token
+logouts, loaded when the worker starts and applied incrementally by
+`RevocationListener`. Entries are dropped once the token would have
+expired anyway, so the set only holds live revoked tokens.
+
+Opaque tokens are not JWTs (no dots), so both kinds authenticate side by
+side and existing sessions survive switching modes.
+"""
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+import jwt
+
+ALGORITHM = 'HS256'
+
+
+def is_signed_token(token: str) -> bool:
+    return token.count('.') == 2
+
+
+class RevokedTokens:
+    """jti -> expiry (epoch seconds) of revoked, not yet expired signed tokens"""
+
+    def __init__(self):
+        self._expiry: Dict[str, float] = {}
+        self._next_prune = 0.0
+
+    def add(self, jti: str, expires_at: datetime):
+        # Stored expiries are naive UTC datetimes
+        if isinstance(expires_at, datetime):
+            expires_at = expires_at.replace(tzinfo=timezone.utc).timestamp()
+        self._expiry[jti] = float(expires_at)
+
+    def __contains__(self, jti: str) -> bool:
+        return jti in self._expiry
+
+    def __len__(self) -> int:
+        return len(self._expiry)
+
+    def prune(self, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        if now < self._next_prune:
+            return
+        self._next_prune = now + 60
+        self._expiry = {jti: exp for jti, exp in self._expiry.items() if exp > now}
+
+
+class SignedSessionTokens:
+    """Issue and verify signed session tokens"""
+
+    def __init__(self, secret: str, ttl: timedelta = timedelta(days=7), leeway: float = 30.0):
+        if not secret:
+            raise RuntimeError("SESSION_TOKEN_SECRET must be set to use signed session tokens")
+        self.secret = secret
+        self.ttl = ttl
+        self.leeway = leeway
+        self.revoked = RevokedTokens()
+        self.issued = 0
+        self.verified = 0
+        self.rejected = 0
+
+    def issue(self, user_id: str) -> str:
+        now = datetime.utcnow()
+        self.issued += 1
+        return jwt.encode(
+            {'sub': user_id, 'jti': uuid.uuid4().hex, 'iat': now, 'exp': now + self.ttl},
+            self.secret,
+            algorithm=ALGORITHM
+        )
+
+    def claims(self, token: str, verify_exp: bool = True) -> Optional[dict]:
+        """Decoded claims when the signature checks out (and, by default, the token is unexpired)"""
+        try:
+            return jwt.decode(
+                token,
+                self.secret,
+                algorithms=[ALGORITHM],
+                leeway=self.leeway,
+                options={'require': ['sub', 'jti', 'exp'], 'verify_exp': verify_exp}
+            )
+        except jwt.InvalidTokenError:
+            return None
+
+    def verify(self, token: str) -> Optional[str]:
+        """User id for a valid, unexpired, unrevoked token"""
+        claims = self.claims(token)
+        if claims is None or claims['jti'] in self.revoked:
+            self.rejected += 1
+            return None
+        self.verified += 1
+        self.revoked.prune()
+        return claims['sub']
+
+    def metrics(self) -> dict:
+        return {
+            'issued': self.issued,
+            'verified': self.verified,
+            'rejected': self.rejected,
+            'revoked': len(self.revoked)
+        }
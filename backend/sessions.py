@@ -0,0 +1,242 @@
+"""Session token validation cache.
+
+Validated tokens are kept in an in-memory LRU with a short TTL so repeat
+requests authenticate without touching `user_sessions`. Logouts are
+published to `session_revocations`; every worker follows that collection
+(change stream when the deployment supports it, polling otherwise) and
+drops revoked tokens from its own cache, or adds them to its revocation
+set when they are signed tokens (see `session_tokens`). While the change
+stream is down the cache TTL is cut to `DEGRADED_TTL_SECONDS`, since
+revocations are going unseen, and the stream is reopened with backoff.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Tuple
+
+from pymongo.errors import OperationFailure
+
+from session_tokens import RevokedTokens, SignedSessionTokens, is_signed_token
+
+logger = logging.getLogger(__name__)
+
+REVOCATION_COLLECTION = 'session_revocations'
+RECONNECT_BACKOFF_SECONDS = (1.0, 60.0)  # initial, max; doubles per consecutive failure
+DEGRADED_TTL_SECONDS = 5.0
+
+
+class SessionCache:
+    """LRU + TTL map of session_token -> (user_id, expires_at)"""
+
+    def __init__(self, max_size: int = 10000, ttl_seconds: float = 60.0):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[str, datetime, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+        self._lookup_seconds = {'hit': 0.0, 'miss': 0.0}
+
+    def get(self, token: str) -> Optional[Tuple[str, datetime]]:
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+        user_id, expires_at, cached_at = entry
+        if time.monotonic() - cached_at > self.ttl_seconds or expires_at < datetime.utcnow():
+            del self._entries[token]
+            return None
+        self._entries.move_to_end(token)
+        return user_id, expires_at
+
+    def put(self, token: str, user_id: str, expires_at: datetime):
+        self._entries[token] = (user_id, expires_at, time.monotonic())
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, token: str):
+        if self._entries.pop(token, None) is not None:
+            self.invalidations += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def record_lookup(self, hit: bool, seconds: float):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        self._lookup_seconds['hit' if hit else 'miss'] += seconds
+
+    def metrics(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'ttl_seconds': self.ttl_seconds,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'invalidations': self.invalidations,
+            'evictions': self.evictions,
+            'avg_hit_ms': round(self._lookup_seconds['hit'] * 1000 / self.hits, 4) if self.hits else 0.0,
+            'avg_miss_ms': round(self._lookup_seconds['miss'] * 1000 / self.misses, 4) if self.misses else 0.0
+        }
+
+
+async def lookup_session_user(db, cache: SessionCache, session_token: str) -> Optional[str]:
+    """User id for an active, unexpired session token"""
+    started = time.perf_counter()
+    cached = cache.get(session_token)
+    if cached is not None:
+        cache.record_lookup(True, time.perf_counter() - started)
+        return cached[0]
+
+    session = await db.user_sessions.find_one({
+        "session_token": session_token,
+        "is_active": True,
+        "expires_at": {"$gte": datetime.utcnow()}
+    })
+    cache.record_lookup(False, time.perf_counter() - started)
+    if not session:
+        return None
+    cache.put(session_token, session["user_id"], session["expires_at"])
+    return session["user_id"]
+
+
+async def revoke_session(db, cache: SessionCache, session_token: str, signed: Optional[SignedSessionTokens] = None):
+    """Drop a token locally and tell the other workers to do the same"""
+    if signed is not None and is_signed_token(session_token):
+        claims = signed.claims(session_token, verify_exp=False)
+        if claims is None:
+            return
+        expires_at = datetime.utcfromtimestamp(claims['exp'])
+        signed.revoked.add(claims['jti'], expires_at)
+        await db[REVOCATION_COLLECTION].insert_one({
+            'jti': claims['jti'],
+            'expires_at': expires_at,
+            'revoked_at': datetime.utcnow()
+        })
+        return
+    cache.invalidate(session_token)
+    await db[REVOCATION_COLLECTION].insert_one({
+        'session_token': session_token,
+        'revoked_at': datetime.utcnow()
+    })
+
+
+class RevocationListener:
+    """Follows `session_revocations` and invalidates this worker's cache and revocation set"""
+
+    def __init__(self, db, cache: SessionCache, mode: str = 'auto', poll_interval: float = 5.0,
+                 revoked: Optional[RevokedTokens] = None):
+        self.db = db
+        self.cache = cache
+        self.revoked = revoked
+        self.mode = mode  # 'auto' tries a change stream first, 'poll' never does
+        self.poll_interval = poll_interval
+        self.active_mode: Optional[str] = None
+        self.reconnects = 0
+        self._normal_ttl: Optional[float] = None  # set while degraded
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        if self.mode != 'poll':
+            if await self._follow():
+                return
+        await self._poll()
+
+    async def _follow(self) -> bool:
+        """Follow the change stream until cancelled; False when the deployment can't provide one"""
+        delay, max_delay = RECONNECT_BACKOFF_SECONDS
+        while True:
+            try:
+                await self._watch()
+            except Exception as e:
+                if isinstance(e, OperationFailure) and self.active_mode is None:
+                    # Standalone servers don't support change streams
+                    logger.info(f"Session revocation change stream unavailable, polling instead: {str(e)}")
+                    return False
+                logger.error(f"Session revocation change stream failed, reconnecting in {delay:.0f}s: {str(e)}")
+            if self.active_mode == 'change_stream':
+                delay = RECONNECT_BACKOFF_SECONDS[0]  # it had been up, so start the backoff over
+            self._degrade()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_delay)
+
+    def _degrade(self):
+        """Stop trusting cached sessions for long while revocations may be missed"""
+        if self._normal_ttl is None:
+            self._normal_ttl = self.cache.ttl_seconds
+            self.cache.ttl_seconds = min(self._normal_ttl, DEGRADED_TTL_SECONDS)
+        self.cache.clear()
+        if self.active_mode is not None:
+            self.active_mode = 'reconnecting'
+
+    def _recover(self):
+        if self._normal_ttl is None:
+            return
+        # Anything cached during the outage may have been revoked since
+        self.cache.clear()
+        self.cache.ttl_seconds = self._normal_ttl
+        self._normal_ttl = None
+
+    def _apply(self, revocation: dict):
+        if 'session_token' in revocation:
+            self.cache.invalidate(revocation['session_token'])
+        elif self.revoked is not None and 'jti' in revocation:
+            self.revoked.add(revocation['jti'], revocation['expires_at'])
+
+    async def _load_revoked(self):
+        """Signed tokens revoked before this worker started and not expired yet"""
+        if self.revoked is None:
+            return
+        cursor = self.db[REVOCATION_COLLECTION].find(
+            {'expires_at': {'$gt': datetime.utcnow()}}, {'_id': 0, 'jti': 1, 'expires_at': 1}
+        )
+        async for revocation in cursor:
+            self._apply(revocation)
+
+    async def _watch(self):
+        pipeline = [{'$match': {'operationType': 'insert'}}]
+        async with self.db[REVOCATION_COLLECTION].watch(pipeline) as stream:
+            # Opened before loading, so nothing revoked in between is missed
+            await self._load_revoked()
+            self._recover()
+            if self.active_mode is not None:
+                self.reconnects += 1
+            self.active_mode = 'change_stream'
+            async for change in stream:
+                self._apply(change['fullDocument'])
+
+    async def _poll(self):
+        self._recover()
+        self.active_mode = 'poll'
+        since = datetime.utcnow()
+        try:
+            await self._load_revoked()
+        except Exception as e:
+            logger.error(f"Loading revoked session tokens failed: {str(e)}")
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                cursor = self.db[REVOCATION_COLLECTION].find({'revoked_at': {'$gt': since}}).sort('revoked_at', 1)
+                async for revocation in cursor:
+                    self._apply(revocation)
+                    since = revocation['revoked_at']
+            except Exception as e:
+                logger.error(f"Session revocation poll failed: {str(e)}")
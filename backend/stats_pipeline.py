@@ -0,0 +1,172 @@
+"""Mood statistics computed inside MongoDB.
+
+`mood_stats_pipeline` runs every stats aggregate in one `$facet` stage, so
+the server returns a single small document instead of a user's whole
+history. Mood categories come from a `$switch` generated from `MOODS`, so
+the pipeline needs no `$lookup`.
+"""
+from typing import List, Tuple
+
+from analytics import CATEGORIES, compose_insights
+from models import MOODS
+
+# Missing or null intensities count as 3 in the stats, like the Python paths
+INTENSITY = {'$ifNull': ['$intensity', 3]}
+HAS_INTENSITY = {'$gt': [{'$ifNull': ['$intensity', 0]}, 0]}
+
+
+def category_expression(field: str = '$mood_id') -> dict:
+    """`$switch` mapping a mood id to its category; unknown ids are neutral"""
+    branches = []
+    for category in CATEGORIES:
+        mood_ids = [mood_id for mood_id, mood in MOODS.items() if mood.get('category', 'neutral') == category]
+        if mood_ids and category != 'neutral':
+            branches.append({'case': {'$in': [field, mood_ids]}, 'then': category})
+    return {'$switch': {'branches': branches, 'default': 'neutral'}}
+
+
+MOOD_CATEGORY = category_expression()
+
+
+def mood_stats_pipeline(user_id: str) -> List[dict]:
+    has_weather = {'$and': [
+        {'$eq': [{'$type': '$weather'}, 'object']},
+        {'$not': [{'$in': [{'$ifNull': ['$weather.condition', None]}, [None, '', 0, False]]}]}
+    ]}
+    return [
+        {'$match': {'user_id': user_id}},
+        {'$sort': {'date': -1}},
+        {'$project': {
+            '_id': 0,
+            'date': 1,
+            'mood_id': 1,
+            'intensity': INTENSITY,
+            'has_intensity': HAS_INTENSITY,
+            'category': MOOD_CATEGORY,
+            'weather': {'$cond': [has_weather, '$weather.condition', None]},
+            'tags': {'$cond': [{'$isArray': '$tags'}, '$tags', []]}
+        }},
+        {'$facet': {
+            'totals': [
+                {'$group': {
+                    '_id': None,
+                    'entries': {'$sum': 1},
+                    'known_sum': {'$sum': {'$cond': ['$has_intensity', '$intensity', 0]}},
+                    'known_count': {'$sum': {'$cond': ['$has_intensity', 1, 0]}}
+                }}
+            ],
+            'moods': [
+                # Entries arrive newest first, so the latest date breaks count ties like the Python paths
+                {'$group': {'_id': '$mood_id', 'count': {'$sum': 1}, 'latest': {'$max': '$date'}}}
+            ],
+            'categories': [
+                {'$group': {'_id': '$category', 'count': {'$sum': 1}}}
+            ],
+            'weather': [
+                {'$match': {'weather': {'$ne': None}}},
+                {'$group': {'_id': {'condition': '$weather', 'category': '$category'}, 'count': {'$sum': 1}}}
+            ],
+            'tags': [
+                {'$unwind': '$tags'},
+                {'$group': {
+                    '_id': {'tag': '$tags', 'intensity': '$intensity'},
+                    'count': {'$sum': 1}
+                }}
+            ],
+            'tagged_entries': [
+                {'$match': {'tags': {'$in': ['social', 'exercise']}}},
+                {'$project': {
+                    'social': {'$in': ['social', '$tags']},
+                    'exercise': {'$in': ['exercise', '$tags']},
+                    'intensity': 1,
+                    'has_intensity': 1
+                }},
+                {'$group': {
+                    '_id': None,
+                    'social_count': {'$sum': {'$cond': ['$social', 1, 0]}},
+                    'social_sum': {'$sum': {'$cond': [{'$and': ['$social', '$has_intensity']}, '$intensity', 0]}},
+                    'social_known': {'$sum': {'$cond': [{'$and': ['$social', '$has_intensity']}, 1, 0]}},
+                    'exercise_count': {'$sum': {'$cond': ['$exercise', 1, 0]}},
+                    'exercise_sum': {'$sum': {'$cond': [{'$and': ['$exercise', '$has_intensity']}, '$intensity', 0]}},
+                    'exercise_known': {'$sum': {'$cond': [{'$and': ['$exercise', '$has_intensity']}, 1, 0]}}
+                }}
+            ],
+            'recent': [
+                {'$limit': 30},
+                {'$project': {'intensity': 1, 'has_intensity': 1}}
+            ]
+        }}
+    ]
+
+
+def _average(total, count):
+    return total / count if count else None
+
+
+def shape_mood_stats(result: dict) -> Tuple[dict, List[str]]:
+    """`MoodStats` aggregates and insights from the `$facet` result document"""
+    totals = result['totals'][0] if result['totals'] else {'entries': 0, 'known_sum': 0, 'known_count': 0}
+    if not totals['entries']:
+        return {'total_entries': 0}, []
+
+    label_counts, label_latest = {}, {}
+    for row in result['moods']:
+        label = MOODS.get(row['_id'], {}).get('label', row['_id'])
+        label_counts[label] = label_counts.get(label, 0) + row['count']
+        label_latest[label] = max(label_latest.get(label, ''), row['latest'] or '')
+    mood_counts = dict(sorted(label_counts.items(), key=lambda item: label_latest[item[0]], reverse=True))
+    most_common_mood = max(mood_counts.items(), key=lambda x: x[1])[0]
+
+    distribution = {row['_id']: row['count'] for row in result['categories']}
+    mood_distribution = {category: distribution.get(category, 0) for category in CATEGORIES}
+
+    weather_correlation = {}
+    for row in result['weather']:
+        counts = weather_correlation.setdefault(row['_id']['condition'], dict.fromkeys(CATEGORIES, 0))
+        counts[row['_id']['category']] += row['count']
+
+    activity_correlation = {}
+    for row in sorted(result['tags'], key=lambda r: r['_id']['intensity']):
+        tag = activity_correlation.setdefault(row['_id']['tag'], {'count': 0, 'avg_intensity': 0, 'moods': []})
+        tag['count'] += row['count']
+        tag['moods'].extend([row['_id']['intensity']] * row['count'])
+    for tag in activity_correlation.values():
+        tag['avg_intensity'] = sum(tag['moods']) / tag['count']
+
+    recent = result['recent']
+    weekly = [e['intensity'] for e in recent[:7]]
+    monthly = [e['intensity'] for e in recent]
+    stats = {
+        'total_entries': totals['entries'],
+        'mood_counts': mood_counts,
+        'most_common_mood': most_common_mood,
+        'weekly_average_intensity': round(sum(weekly) / len(weekly), 1),
+        'monthly_average_intensity': round(sum(monthly) / len(monthly), 1),
+        'mood_distribution': mood_distribution,
+        'weather_correlation': weather_correlation,
+        'activity_correlation': activity_correlation
+    }
+
+    tagged = result['tagged_entries'][0] if result['tagged_entries'] else {}
+    recent_known = [e['intensity'] for e in recent[:14] if e['has_intensity']]
+    insights = compose_insights(
+        total_entries=totals['entries'],
+        positive_count=mood_distribution['positive'],
+        recent_count=len(recent[:14]),
+        recent_avg=_average(sum(recent_known), len(recent_known)),
+        weather_total=sum(sum(counts.values()) for counts in weather_correlation.values()),
+        sunny_count=sum(weather_correlation.get('sunny', {}).values()),
+        social_count=tagged.get('social_count', 0),
+        social_avg=_average(tagged.get('social_sum', 0), tagged.get('social_known', 0)),
+        overall_avg=_average(totals['known_sum'], totals['known_count']),
+        grateful_count=sum(row['count'] for row in result['moods'] if row['_id'] == 'grateful'),
+        exercise_count=tagged.get('exercise_count', 0),
+        exercise_avg=_average(tagged.get('exercise_sum', 0), tagged.get('exercise_known', 0))
+    )
+    return stats, insights
+
+
+async def aggregate_mood_stats(db, user_id: str) -> Tuple[dict, List[str]]:
+    """Run the `$facet` pipeline and shape its single result document"""
+    results = await db.mood_entries.aggregate(mood_stats_pipeline(user_id)).to_list(length=1)
+    return shape_mood_stats(results[0])
@@ -0,0 +1,121 @@
+"""Persisted mood streak state.
+
+Each user has one `user_streaks` document holding `current`, `longest`,
+`breaks` and `last_date`. Logging a newer day advances it in O(1); a day
+logged before `last_date` (a backfill) triggers one sorted pass over the
+user's distinct dates instead.
+"""
+from datetime import date, datetime
+from typing import Iterable, Optional
+
+STREAK_COLLECTION = 'user_streaks'
+
+
+def date_ordinal(value: str) -> Optional[int]:
+    """Day number for a YYYY-MM-DD string, or None when it doesn't parse"""
+    try:
+        return date.fromisoformat(value).toordinal()
+    except (TypeError, ValueError):
+        return None
+
+
+def streak_from_dates(dates: Iterable[str]) -> dict:
+    """Single pass over dates sorted ascending; duplicates are skipped"""
+    current = longest = breaks = 0
+    last_ordinal = None
+    last_date = None
+
+    for value in dates:
+        ordinal = date_ordinal(value)
+        if ordinal is None or ordinal == last_ordinal:
+            continue
+        if last_ordinal is not None and ordinal == last_ordinal + 1:
+            current += 1
+        else:
+            if last_ordinal is not None:
+                breaks += 1
+            current = 1
+        longest = max(longest, current)
+        last_ordinal = ordinal
+        last_date = value
+
+    return {'current': current, 'longest': longest, 'breaks': breaks, 'last_date': last_date}
+
+
+def advance_streak(state: dict, new_date: str) -> Optional[dict]:
+    """Fold a newly logged day into a streak state.
+
+    Returns None when the day can't be applied incrementally (it precedes
+    `last_date` or doesn't parse) and the state must be recomputed.
+    """
+    ordinal = date_ordinal(new_date)
+    if ordinal is None:
+        return None
+
+    last_ordinal = date_ordinal(state['last_date']) if state.get('last_date') else None
+    if last_ordinal is None:
+        return {'current': 1, 'longest': max(state.get('longest', 0), 1), 'breaks': 0, 'last_date': new_date}
+    if ordinal < last_ordinal:
+        return None
+    if ordinal == last_ordinal:
+        return dict(state)
+
+    if ordinal == last_ordinal + 1:
+        current = state['current'] + 1
+        breaks = state['breaks']
+    else:
+        current = 1
+        breaks = state['breaks'] + 1
+    return {
+        'current': current,
+        'longest': max(state['longest'], current),
+        'breaks': breaks,
+        'last_date': new_date
+    }
+
+
+def streak_summary(state: dict, today: Optional[str] = None) -> dict:
+    """Report a stored state; the current streak only counts if it reaches today"""
+    today = today or datetime.now().strftime('%Y-%m-%d')
+    current = state['current'] if state.get('last_date') == today else 0
+    return {'current': current, 'longest': state.get('longest', 0), 'breaks': state.get('breaks', 0)}
+
+
+async def recompute_streak(db, user_id: str) -> dict:
+    """Rebuild a user's streak state from their full history"""
+    cursor = db.mood_entries.find({'user_id': user_id}, {'date': 1, '_id': 0}).sort('date', 1)
+    state = streak_from_dates([entry['date'] async for entry in cursor if entry.get('date')])
+    state['updated_at'] = datetime.utcnow()
+    await db[STREAK_COLLECTION].update_one({'user_id': user_id}, {'$set': state}, upsert=True)
+    return state
+
+
+async def get_streak_state(db, user_id: str) -> dict:
+    """Stored streak state, computed once on first access"""
+    state = await db[STREAK_COLLECTION].find_one({'user_id': user_id})
+    if state is None:
+        state = await recompute_streak(db, user_id)
+    return state
+
+
+async def record_mood_date(db, user_id: str, new_date: str) -> dict:
+    """Advance the stored streak for a newly logged day"""
+    state = await db[STREAK_COLLECTION].find_one({'user_id': user_id})
+    if state is None:
+        return await recompute_streak(db, user_id)
+
+    advanced = advance_streak(state, new_date)
+    if advanced is None:
+        return await recompute_streak(db, user_id)
+    if advanced['last_date'] == state.get('last_date'):
+        return state
+
+    # Only apply if nobody else advanced the streak since we read it
+    advanced['updated_at'] = datetime.utcnow()
+    result = await db[STREAK_COLLECTION].update_one(
+        {'user_id': user_id, 'last_date': state.get('last_date')},
+        {'$set': advanced}
+    )
+    if result.matched_count == 0:
+        return await recompute_streak(db, user_id)
+    return advanced
@@ -0,0 +1,170 @@
+"""Materialized social feed timelines.
+
+Publishing a feed item pushes a reference to it onto the capped timeline
+document of every friend following the author (fan-out on write); users
+without a timeline yet get one built on their next read. Reading
+a feed is then one timeline document plus one `$in` fetch of the items,
+however many friends the reader has.
+
+Authors whose audience exceeds `fanout_limit` are not fanned out. They are
+recorded in `feed_pull_authors`, and readers who follow one of them merge
+that author's recent items in at read time (fan-out on read).
+
+Passing a `FriendGraph` answers audience and friend lookups from memory.
+
+Unlocked achievements are shared to the feed for users who opted in with
+the `share_achievements` preference.
+"""
+from datetime import datetime
+from typing import List, Optional
+
+from pymongo import UpdateOne
+
+from models import SocialFeedItem
+
+TIMELINE_COLLECTION = 'feed_timelines'
+PULL_AUTHORS_COLLECTION = 'feed_pull_authors'
+TIMELINE_SIZE = 500
+FANOUT_LIMIT = 1000
+FANOUT_BATCH_SIZE = 500
+
+
+def timeline_ref(item: dict) -> dict:
+    return {'id': item['id'], 'user_id': item['user_id'], 'timestamp': item['timestamp']}
+
+
+def push_ref_update(owner_id: str, ref: dict) -> UpdateOne:
+    """Newest-first insert into an existing timeline, trimmed to TIMELINE_SIZE.
+
+    Missing timelines are not created here: one holding just this item would
+    hide everything older, so `read_timeline` builds them from scratch. The
+    `items.id` guard skips timelines a rebuild already gave this item.
+    """
+    return UpdateOne(
+        {'user_id': owner_id, 'items.id': {'$ne': ref['id']}},
+        {
+            '$push': {'items': {'$each': [ref], '$sort': {'timestamp': -1}, '$slice': TIMELINE_SIZE}},
+            '$set': {'updated_at': datetime.utcnow()}
+        }
+    )
+
+
+async def publish_feed_item(db, item: dict):
+    """Store a feed item; call `fan_out_item` afterwards (usually from a background job)"""
+    await db.social_feed.insert_one(dict(item))
+
+
+async def share_achievement(db, user_id: str, achievement: dict) -> Optional[dict]:
+    """Publish an unlocked achievement if the user shares achievements, returning the feed item"""
+    user = await db.users.find_one({'id': user_id}, {'_id': 0, 'preferences': 1})
+    if not user or not (user.get('preferences') or {}).get('share_achievements'):
+        return None
+    item = SocialFeedItem(
+        user_id=user_id,
+        type='achievement',
+        content={key: achievement[key] for key in ('id', 'name', 'icon', 'rarity') if key in achievement}
+    ).dict()
+    await publish_feed_item(db, item)
+    return item
+
+
+async def fan_out_item(db, item_id: str, fanout_limit: int = FANOUT_LIMIT, graph=None) -> int:
+    """Push a published item onto its audience's existing timelines, returning how many were updated"""
+    item = await db.social_feed.find_one({'id': item_id}, {'_id': 0, 'id': 1, 'user_id': 1, 'timestamp': 1})
+    if not item:
+        return 0
+    author_id = item['user_id']
+    ref = timeline_ref(item)
+
+    # The author always sees their own items
+    result = await db[TIMELINE_COLLECTION].bulk_write([push_ref_update(author_id, ref)])
+    written = result.modified_count
+
+    audience = {'friend_id': author_id, 'status': 'accepted'}
+    followers = await graph.audience(db, author_id) if graph is not None else None
+    if followers is not None:
+        audience_size = len(followers)
+    else:
+        audience_size = await db.friends.count_documents(audience, limit=fanout_limit + 1)
+    if audience_size > fanout_limit:
+        await db[PULL_AUTHORS_COLLECTION].update_one(
+            {'user_id': author_id}, {'$set': {'user_id': author_id, 'since': datetime.utcnow()}}, upsert=True
+        )
+        return written
+
+    if followers is None:
+        # Bounded by fanout_limit, so the ids fit in memory
+        followers = [edge['user_id'] async for edge in db.friends.find(audience, {'_id': 0, 'user_id': 1})]
+
+    batch = []
+    for follower_id in followers:
+        batch.append(push_ref_update(follower_id, ref))
+        if len(batch) >= FANOUT_BATCH_SIZE:
+            written += (await db[TIMELINE_COLLECTION].bulk_write(batch, ordered=False)).modified_count
+            batch = []
+    if batch:
+        written += (await db[TIMELINE_COLLECTION].bulk_write(batch, ordered=False)).modified_count
+    return written
+
+
+async def _friend_ids(db, user_id: str, graph=None) -> List[str]:
+    if graph is not None:
+        return list(await graph.friend_ids(db, user_id))
+    friends = await db.friends.find({'user_id': user_id, 'status': 'accepted'}, {'_id': 0, 'friend_id': 1}).to_list(length=None)
+    return [f['friend_id'] for f in friends]
+
+
+async def rebuild_timeline(db, user_id: str, graph=None) -> List[dict]:
+    """Recompute a timeline from the friends' items (fan-out on read) and store it"""
+    author_ids = await _friend_ids(db, user_id, graph) + [user_id]
+    items = await db.social_feed.find(
+        {'user_id': {'$in': author_ids}}, {'_id': 0, 'id': 1, 'user_id': 1, 'timestamp': 1}
+    ).sort('timestamp', -1).limit(TIMELINE_SIZE).to_list(length=TIMELINE_SIZE)
+    refs = [timeline_ref(item) for item in items]
+    await db[TIMELINE_COLLECTION].update_one(
+        {'user_id': user_id},
+        {'$set': {'user_id': user_id, 'items': refs, 'updated_at': datetime.utcnow()}},
+        upsert=True
+    )
+    return refs
+
+
+async def _pulled_items(db, user_id: str, limit: int, before: Optional[datetime], graph=None) -> List[dict]:
+    pull_authors = await db[PULL_AUTHORS_COLLECTION].distinct('user_id')
+    if not pull_authors:
+        return []
+    if graph is not None:
+        followed = list(await graph.friend_ids(db, user_id) & set(pull_authors))
+    else:
+        edges = await db.friends.find(
+            {'user_id': user_id, 'friend_id': {'$in': pull_authors}, 'status': 'accepted'}, {'_id': 0, 'friend_id': 1}
+        ).to_list(length=None)
+        followed = [edge['friend_id'] for edge in edges]
+    if not followed:
+        return []
+    query = {'user_id': {'$in': followed}}
+    if before is not None:
+        query['timestamp'] = {'$lt': before}
+    return await db.social_feed.find(query, {'_id': 0}).sort('timestamp', -1).limit(limit).to_list(length=limit)
+
+
+async def read_timeline(db, user_id: str, limit: int = 20, before: Optional[datetime] = None, graph=None) -> List[dict]:
+    """Newest feed items for a user, optionally older than `before`"""
+    timeline = await db[TIMELINE_COLLECTION].find_one({'user_id': user_id}, {'_id': 0, 'items': 1})
+    refs = timeline['items'] if timeline else await rebuild_timeline(db, user_id, graph)
+    if before is not None:
+        refs = [ref for ref in refs if ref['timestamp'] < before]
+    refs = refs[:limit]
+
+    items = []
+    if refs:
+        found = await db.social_feed.find({'id': {'$in': [ref['id'] for ref in refs]}}, {'_id': 0}).to_list(length=len(refs))
+        by_id = {item['id']: item for item in found}
+        items = [by_id[ref['id']] for ref in refs if ref['id'] in by_id]
+
+    pulled = await _pulled_items(db, user_id, limit, before, graph)
+    if pulled:
+        seen = {item['id'] for item in items}
+        items.extend(item for item in pulled if item['id'] not in seen)
+        items.sort(key=lambda item: item['timestamp'], reverse=True)
+    return items[:limit]
@@ -0,0 +1,31 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+# The backend is a flat set of modules run from its own directory
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+
+
+@pytest.fixture
+def mock_db():
+    mongomock_motor = pytest.importorskip('mongomock_motor')
+    return mongomock_motor.AsyncMongoMockClient()['moodverse_test']
+
+
+@pytest.fixture(scope='session')
+def mongo_url():
+    """For tests that need a real server; skipped when MONGO_URL (default localhost) is unreachable"""
+    client = MongoClient(MONGO_URL, serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command('ping')
+    except PyMongoError:
+        pytest.skip(f"No MongoDB server at {MONGO_URL}")
+    finally:
+        client.close()
+    return MONGO_URL
@@ -0,0 +1,40 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from achievements import PROGRESS_COLLECTION, record_counter_event, record_mood_achievements
+
+
+def mood_entry(day: int, written_at: datetime) -> dict:
+    return {'id': f'e{day}', 'user_id': 'alice', 'date': f'2024-05-{day:02d}', 'mood_id': 'happy',
+            'timestamp': written_at, 'updated_at': written_at}
+
+
+def test_first_event_rebuild_is_not_counted_twice(mock_db):
+    async def scenario():
+        written_at = datetime.utcnow() - timedelta(seconds=1)
+        first, second = mood_entry(1, written_at), mood_entry(2, written_at)
+        # Both inserted before either job runs; the first job's rebuild counts both
+        await mock_db.mood_entries.insert_many([dict(first), dict(second)])
+        await record_mood_achievements(mock_db, 'alice', after=first)
+        await record_mood_achievements(mock_db, 'alice', after=second)
+        third = mood_entry(3, datetime.utcnow() + timedelta(seconds=1))
+        await mock_db.mood_entries.insert_one(dict(third))
+        await record_mood_achievements(mock_db, 'alice', after=third)
+        return await mock_db[PROGRESS_COLLECTION].find_one({'user_id': 'alice'})
+
+    progress = asyncio.run(scenario())
+    assert progress['entries_count'] == 3
+    assert progress['total_days'] == 3
+    assert 'friends_count' not in progress
+
+
+def test_counter_event_respects_rebuild(mock_db):
+    async def scenario():
+        stamped = datetime.utcnow() - timedelta(seconds=1)
+        await mock_db.custom_moods.insert_one({'id': 'zen', 'user_id': 'alice', 'created_at': stamped})
+        await record_counter_event(mock_db, 'alice', 'custom_moods', written_at=stamped)
+        await record_counter_event(mock_db, 'alice', 'custom_moods', written_at=stamped)
+        await record_counter_event(mock_db, 'alice', 'custom_moods', written_at=datetime.utcnow() + timedelta(seconds=1))
+        return await mock_db[PROGRESS_COLLECTION].find_one({'user_id': 'alice'})
+
+    assert asyncio.run(scenario())['custom_moods'] == 2
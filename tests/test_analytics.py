@@ -0,0 +1,82 @@
+import math
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from analytics import MoodFrame, reference_insights, reference_mood_stats
+from models import MOODS, WEATHER_CONDITIONS
+
+# 'Happy' as a custom id shares its label with the built-in mood
+CUSTOM_MOODS = ['custom_zen', 'custom_meh', 'Happy']
+TAGS = ['social', 'exercise', 'work', 'family', 'outdoors']
+
+
+def random_entry(rng: random.Random, day: date) -> dict:
+    entry = {'date': day.isoformat(), 'mood_id': rng.choice(list(MOODS) + CUSTOM_MOODS)}
+    if rng.random() < 0.8:
+        entry['intensity'] = rng.randint(1, 5)
+    weather = rng.random()
+    if weather < 0.5:
+        entry['weather'] = {'condition': rng.choice(list(WEATHER_CONDITIONS)), 'temperature': rng.randint(-5, 35)}
+    elif weather < 0.6:
+        entry['weather'] = 'sunny'
+    elif weather < 0.65:
+        entry['weather'] = {'temperature': 20}
+    elif weather < 0.7:
+        entry['weather'] = None
+    tags = rng.random()
+    if tags < 0.6:
+        # Sampled with replacement, so an entry can repeat a tag
+        entry['tags'] = [rng.choice(TAGS) for _ in range(rng.randint(1, 4))]
+    elif tags < 0.65:
+        entry['tags'] = []
+    elif tags < 0.7:
+        entry['tags'] = 'social'
+    return entry
+
+
+def random_history(seed: int, size: int) -> list:
+    rng = random.Random(seed)
+    day = date(2024, 6, 1)
+    entries = []
+    for _ in range(size):
+        entries.append(random_entry(rng, day))
+        if rng.random() < 0.8:
+            day -= timedelta(days=1)
+    return entries
+
+
+def assert_same_stats(expected: dict, actual: dict):
+    for key, value in expected.items():
+        if key != 'activity_correlation':
+            assert actual[key] == value, key
+            continue
+        assert list(actual[key]) == list(value)
+        for tag, row in value.items():
+            other = actual[key][tag]
+            assert (other['count'], other['moods']) == (row['count'], row['moods']), tag
+            assert math.isclose(other['avg_intensity'], row['avg_intensity']), tag
+
+
+@pytest.mark.parametrize('seed', range(20))
+@pytest.mark.parametrize('size', [1, 5, 40, 300])
+def test_frame_matches_reference(seed, size):
+    entries = random_history(seed, size)
+    frame = MoodFrame(entries)
+    assert_same_stats(reference_mood_stats(entries), frame.stats())
+    assert frame.insights() == reference_insights(entries)
+
+
+def test_empty_history():
+    frame = MoodFrame([])
+    assert frame.stats() == reference_mood_stats([])
+    assert frame.insights() == reference_insights([])
+
+
+def test_repeated_tags_count_every_occurrence():
+    entries = [{'date': '2024-01-02', 'mood_id': 'happy', 'intensity': 5, 'tags': ['social', 'social']},
+               {'date': '2024-01-01', 'mood_id': 'sad', 'tags': ['social', 'work']}]
+    correlation = MoodFrame(entries).stats()['activity_correlation']
+    assert correlation['social'] == {'count': 3, 'avg_intensity': pytest.approx(13 / 3), 'moods': [5, 5, 3]}
+    assert correlation['work'] == {'count': 1, 'avg_intensity': 3.0, 'moods': [3]}
@@ -0,0 +1,58 @@
+import pytest
+
+from crisis import CRISIS_MATCHER, KeywordMatcher, find_crisis_keywords
+
+
+@pytest.mark.parametrize('note', [
+    "Everything feels hopeless today",
+    "A deep sense of hopelessness",
+    "Struggling with worthlessness again",
+    "I feel WORTHLESS.",
+    "thoughts of suicide",
+    "I've been cutting again",
+])
+def test_matches_keywords_and_inflections(note):
+    assert CRISIS_MATCHER.search(note)
+
+
+@pytest.mark.parametrize('note', [
+    "I just\n want  to die",
+    "I can’t go on like this",
+    "I can't go on like this",
+    "Sometimes I think I'd be better off dead",
+    "I want to END IT ALL",
+])
+def test_matches_multi_word_phrases(note):
+    assert CRISIS_MATCHER.search(note)
+
+
+@pytest.mark.parametrize('note', [
+    "Presented our cutting-edge research at work",
+    "Went for a long walk and felt calm",
+    "The talk was pointless but fun",
+    "Tried the new self_harm_awareness tag",
+    "",
+])
+def test_no_match(note):
+    assert not CRISIS_MATCHER.search(note)
+    assert find_crisis_keywords(note) == []
+
+
+def test_find_all_reports_keyword_and_offsets():
+    text = "Feeling hopelessness, like I want  to die"
+    matches = find_crisis_keywords(text)
+    assert [m.keyword for m in matches] == ['hopeless', 'want to die']
+    assert [text[m.start:m.end] for m in matches] == ['hopelessness', 'want  to die']
+
+
+def test_longest_phrase_wins():
+    matcher = KeywordMatcher(['give up', 'give up on everything'])
+    assert [m.keyword for m in matcher.find_all("I give up on everything")] == ['give up on everything']
+    assert [m.keyword for m in matcher.find_all("I give up on homework")] == ['give up']
+
+
+def test_large_phrase_lists_skip_the_prefilter():
+    phrases = [f'phrase{i}' for i in range(200)] + ['kill myself']
+    matcher = KeywordMatcher(phrases)
+    assert matcher.search("I want to kill myself")
+    assert not matcher.search("I killed it at myself-defense class")
@@ -0,0 +1,21 @@
+import asyncio
+
+from custom_moods import CustomMoodCache
+
+
+def test_mood_created_by_another_worker_is_found(mock_db):
+    async def scenario():
+        ours, theirs = CustomMoodCache(), CustomMoodCache()
+        assert not await ours.exists(mock_db, 'alice', 'zen')
+        # Created through the other worker, which only invalidates its own cache
+        await mock_db.custom_moods.insert_one({'id': 'zen', 'user_id': 'alice', 'name': 'Zen'})
+        theirs.invalidate('alice')
+        found = await ours.exists(mock_db, 'alice', 'zen')
+        await mock_db.custom_moods.delete_many({})
+        # Hits are served from the cache
+        return found, await ours.resolve(mock_db, 'alice', ['zen', 'other']), await ours.exists(mock_db, 'bob', 'zen')
+
+    found, resolved, other_user = asyncio.run(scenario())
+    assert found
+    assert list(resolved) == ['zen']
+    assert not other_user
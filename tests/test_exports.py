@@ -0,0 +1,177 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
+from datetime import date, datetime
+
+import pytest
+
+from exports import (
+    CSV_COLUMNS, accepts_gzip, csv_row, export_schema, flat_record, gzip_chunks, iter_columnar, iter_csv, iter_ndjson,
+    nested_key_types
+)
+
+
+def export_entry(i: int) -> dict:
+    entry = {
+        'id': f'e{i}', 'user_id': 'alice', 'date': f'2024-03-{i + 1:02d}', 'mood_id': 'happy', 'intensity': i % 5 + 1,
+        'note': f'día {i}, "quoted"\nsecond line', 'tags': ['work', 'family'][:i % 3],
+        'timestamp': datetime(2024, 3, i + 1, 9, 30), 'created_at': datetime(2024, 3, i + 1, 9, 30)
+    }
+    if i % 2:
+        entry['weather'] = {'condition': 'sunny', 'temperature': 20 + i}
+        entry['sleep_data'] = {'hours': 7.5, 'quality': 'good'}
+    return entry
+
+
+ENTRIES = [export_entry(i) for i in range(7)]
+
+
+async def collect(chunks) -> list:
+    return [chunk async for chunk in chunks]
+
+
+async def seed(db):
+    await db.mood_entries.insert_many([dict(entry) for entry in ENTRIES])
+
+
+def cursor(db):
+    return db.mood_entries.find({'user_id': 'alice'}, {'_id': 0}).sort('date', 1)
+
+
+def test_csv_round_trips_in_batches(mock_db):
+    async def scenario():
+        await seed(mock_db)
+        return await collect(iter_csv(cursor(mock_db), batch_size=3))
+
+    chunks = asyncio.run(scenario())
+    # Header plus three rows, three rows, then the last row
+    assert len(chunks) == 3
+    rows = list(csv.reader(io.StringIO(b''.join(chunks).decode('utf-8'))))
+    assert rows[0] == CSV_COLUMNS
+    assert rows[1:] == [[str(value) for value in csv_row(entry)] for entry in ENTRIES]
+
+
+def test_ndjson_round_trips_flattened_records(mock_db):
+    async def scenario():
+        await seed(mock_db)
+        return await collect(iter_ndjson(cursor(mock_db), batch_size=4))
+
+    chunks = asyncio.run(scenario())
+    assert len(chunks) == 2
+    records = [json.loads(line) for line in b''.join(chunks).decode('utf-8').splitlines()]
+    expected = []
+    for entry in ENTRIES:
+        record = flat_record(entry)
+        record['timestamp'] = record['timestamp'].isoformat()
+        record['created_at'] = record['created_at'].isoformat()
+        expected.append(record)
+    assert records == expected
+    assert records[1]['weather_temperature'] == 21
+    assert records[1]['sleep_quality'] == 'good'
+    assert 'weather_condition' not in records[0]
+
+
+def test_gzip_stream_is_one_member_of_the_plain_export(mock_db):
+    async def scenario():
+        await seed(mock_db)
+        plain = b''.join(await collect(iter_csv(cursor(mock_db), batch_size=2)))
+        compressed = b''.join(await collect(gzip_chunks(iter_csv(cursor(mock_db), batch_size=2))))
+        return plain, compressed
+
+    plain, compressed = asyncio.run(scenario())
+    assert gzip.decompress(compressed) == plain
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('gzip, deflate, br', True),
+    ('br;q=1.0, GZIP;q=0.5', True),
+    ('gzip;q=0', False),
+    ('gzip; q=0.000', False),
+    ('deflate', False),
+    ('', False),
+    (None, False),
+])
+def test_accepts_gzip(header, expected):
+    assert accepts_gzip(header) is expected
+
+
+def test_nested_key_types_on_server(mongo_url):
+    """`$type` in aggregation is not supported by mongomock"""
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    async def scenario():
+        client = AsyncIOMotorClient(mongo_url)
+        db = client['moodverse_export_test']
+        try:
+            await db.mood_entries.drop()
+            await seed(db)
+            await db.mood_entries.insert_many([
+                {'user_id': 'alice', 'date': '2024-04-01', 'mood_id': 'sad', 'weather': 'sunny',
+                 'location': {'lat': 1.5, 'extra': {'city': 'Oslo'}}},
+                {'user_id': 'alice', 'date': '2024-04-02', 'mood_id': 'sad',
+                 'weather': {'temperature': 18.5, 'condition': None}, 'location': {'lat': 2}},
+                {'user_id': 'bob', 'date': '2024-04-03', 'mood_id': 'sad', 'activity_data': {'steps': 100}},
+            ])
+            return await nested_key_types(db, {'user_id': 'alice'})
+        finally:
+            await client.drop_database('moodverse_export_test')
+            client.close()
+
+    assert asyncio.run(scenario()) == {
+        'weather_condition': {'string'},
+        'weather_temperature': {'int', 'double'},
+        'sleep_hours': {'double'},
+        'sleep_quality': {'string'},
+        'location_lat': {'int', 'double'},
+        'location_extra': {'object'},
+    }
+
+
+# As nested_key_types reports them for ENTRIES plus an object-valued key
+NESTED_TYPES = {
+    'weather_condition': {'string'}, 'weather_temperature': {'int'},
+    'sleep_hours': {'double'}, 'sleep_quality': {'string'}, 'sleep_stages': {'object'}
+}
+
+
+@pytest.mark.parametrize('export_format', ['parquet', 'arrow'])
+def test_columnar_export_reads_back(mock_db, export_format):
+    pa = pytest.importorskip('pyarrow')
+    pq = pytest.importorskip('pyarrow.parquet')
+    schema, json_columns = export_schema(NESTED_TYPES)
+    assert json_columns == {'sleep_stages'}
+    assert schema.field('weather_temperature').type == pa.int64()
+    assert schema.field('sleep_hours').type == pa.float64()
+    assert schema.field('sleep_stages').type == pa.string()
+
+    async def scenario():
+        await seed(mock_db)
+        await mock_db.mood_entries.update_one({'id': 'e1'}, {'$set': {'sleep_data.stages': {'deep': 2}}})
+        return await collect(iter_columnar(cursor(mock_db), schema, json_columns, export_format, batch_size=3))
+
+    data = b''.join(asyncio.run(scenario()))
+    if export_format == 'parquet':
+        parquet = pq.ParquetFile(io.BytesIO(data))
+        assert parquet.metadata.num_row_groups == 3
+        table = parquet.read()
+    else:
+        reader = pa.ipc.open_stream(io.BytesIO(data))
+        batches = list(reader)
+        assert [batch.num_rows for batch in batches] == [3, 3, 1]
+        table = pa.Table.from_batches(batches, schema=reader.schema)
+    assert table.schema.equals(schema)
+
+    rows = table.to_pylist()
+    assert [row['id'] for row in rows] == [entry['id'] for entry in ENTRIES]
+    assert rows[0]['date'] == date(2024, 3, 1)
+    assert rows[0]['timestamp'] == datetime(2024, 3, 1, 9, 30)
+    assert rows[0]['note'] == ENTRIES[0]['note']
+    assert rows[0]['mood_category'] == flat_record(ENTRIES[0])['mood_category']
+    assert rows[0]['weather_temperature'] is None
+    assert [row['tags'] for row in rows[:3]] == [[], ['work'], ['work', 'family']]
+    assert rows[1]['weather_temperature'] == 21
+    assert rows[1]['sleep_hours'] == 7.5
+    assert json.loads(rows[1]['sleep_stages']) == {'deep': 2}
+    assert rows[3]['sleep_stages'] is None
@@ -0,0 +1,25 @@
+import asyncio
+
+from friend_graph import FriendGraph
+
+
+def test_cached_negative_is_confirmed_against_friends(mock_db):
+    async def scenario():
+        graph = FriendGraph()
+        assert not await graph.connected(mock_db, 'alice', 'bob')
+        # Another worker records the request after alice's adjacency was cached
+        await mock_db.friends.insert_one({'user_id': 'bob', 'friend_id': 'alice', 'status': 'pending'})
+        return await graph.connected(mock_db, 'alice', 'bob'), await graph.connected(mock_db, 'alice', 'bob')
+
+    assert asyncio.run(scenario()) == (True, True)
+
+
+def test_add_request_updates_both_cached_users(mock_db):
+    async def scenario():
+        graph = FriendGraph()
+        await graph.adjacency(mock_db, 'alice')
+        await graph.adjacency(mock_db, 'bob')
+        await graph.add_request(mock_db, {'user_id': 'alice', 'friend_id': 'bob', 'status': 'pending'})
+        return (await graph.adjacency(mock_db, 'alice')).pending_out, (await graph.adjacency(mock_db, 'bob')).pending_in
+
+    assert asyncio.run(scenario()) == ({'bob'}, {'alice'})
@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+from imports import (
+    ImportRecordTooLarge, import_mood_entries, iter_csv_records, iter_lines, iter_ndjson_records, new_import_result,
+    rebuild_derived_state
+)
+from models import MOODS
+
+
+async def stream(*chunks: bytes):
+    for chunk in chunks:
+        yield chunk
+
+
+async def collect(records):
+    return [record async for record in records]
+
+
+def test_lines_split_across_chunks():
+    lines = asyncio.run(collect(iter_lines(stream(b'\xef\xbb\xbfone\ntw', b'o\nthree'))))
+    assert lines == ['one\n', 'two\n', 'three']
+
+
+def test_oversized_line_is_rejected_without_buffering_the_rest():
+    chunks = stream(b'{"date": "2024-01-01"}\n', b'x' * 40, b'x' * 40, b'\n')
+    with pytest.raises(ImportRecordTooLarge) as error:
+        asyncio.run(collect(iter_ndjson_records(chunks, max_size=64)))
+    assert error.value.line == 2
+
+
+def test_oversized_trailing_line_is_rejected():
+    with pytest.raises(ImportRecordTooLarge):
+        asyncio.run(collect(iter_lines(stream(b'x' * 100), max_size=64)))
+
+
+def test_oversized_multiline_csv_record_is_rejected():
+    body = b'Date,Mood,Note\n2024-01-01,happy,"' + b'line\n' * 20 + b'"\n'
+    with pytest.raises(ImportRecordTooLarge) as error:
+        asyncio.run(collect(iter_csv_records(stream(body), max_size=64)))
+    assert error.value.line == 2
+
+
+def test_records_within_the_limit_parse():
+    body = b'Date,Mood,Note\n2024-01-01,Happy,"two\nlines"\n'
+    records = asyncio.run(collect(iter_csv_records(stream(body), max_size=64)))
+    assert records == [(2, {'date': '2024-01-01', 'mood_id': 'happy', 'note': 'two\nlines'})]
+
+
+def test_aborted_import_keeps_counts_and_derived_state_can_be_rebuilt(mock_db):
+    lines = [f'{{"date": "2024-01-{day:02d}", "mood_id": "happy", "intensity": 4}}\n'.encode('utf-8') for day in range(1, 6)]
+
+    async def scenario():
+        result = new_import_result()
+        with pytest.raises(ImportRecordTooLarge):
+            await import_mood_entries(mock_db, 'alice', iter_ndjson_records(stream(*lines, b'x' * 100), max_size=64),
+                                      set(MOODS), max_rows=100, batch_size=2, result=result)
+        streak, _ = await rebuild_derived_state(mock_db, 'alice')
+        rollup = await mock_db.user_mood_rollups.find_one({'user_id': 'alice'})
+        return result, streak, rollup
+
+    result, streak, rollup = asyncio.run(scenario())
+    # The last partial batch is never written: the oversized line aborts before it flushes
+    assert result['inserted'] == 4
+    assert rollup['total_entries'] == 4
+    assert streak['longest'] == 4
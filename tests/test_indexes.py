@@ -0,0 +1,20 @@
+import asyncio
+from datetime import datetime
+
+from indexes import dedupe_mood_entries
+
+
+def test_dedupe_keeps_latest_entry_per_day(mock_db):
+    async def scenario():
+        await mock_db.mood_entries.insert_many([
+            {'id': 'old', 'user_id': 'alice', 'date': '2024-01-01', 'updated_at': datetime(2024, 1, 1, 8)},
+            {'id': 'new', 'user_id': 'alice', 'date': '2024-01-01', 'updated_at': datetime(2024, 1, 1, 20)},
+            {'id': 'other-day', 'user_id': 'alice', 'date': '2024-01-02', 'updated_at': datetime(2024, 1, 2)},
+            {'id': 'other-user', 'user_id': 'bob', 'date': '2024-01-01', 'updated_at': datetime(2024, 1, 1)},
+        ])
+        counted = await dedupe_mood_entries(mock_db, dry_run=True)
+        removed = await dedupe_mood_entries(mock_db)
+        remaining = await mock_db.mood_entries.distinct('id')
+        return counted, removed, sorted(remaining)
+
+    assert asyncio.run(scenario()) == (1, 1, ['new', 'other-day', 'other-user'])
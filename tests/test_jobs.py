@@ -0,0 +1,52 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from jobs import JOB_COLLECTION, JobQueue
+
+
+def stale_job(job_id: str, name: str) -> dict:
+    """Claimed by a worker that never finished it"""
+    now = datetime.utcnow()
+    return {'id': job_id, 'name': name, 'payload': {'value': job_id}, 'status': 'running', 'attempts': 1,
+            'run_after': now - timedelta(minutes=10), 'locked_until': now - timedelta(seconds=1), 'created_at': now}
+
+
+def test_running_queue_reclaims_expired_leases(mock_db):
+    async def scenario():
+        queue = JobQueue(mock_db, concurrency=1, persistent=True, poll_interval=0.01)
+        ran = []
+
+        @queue.register('record')
+        async def record(value: str):
+            ran.append(value)
+
+        await queue.start()
+        # The lease runs out while the queue is already up
+        await mock_db[JOB_COLLECTION].insert_one(stale_job('stale', 'record'))
+        live = dict(stale_job('live', 'record'), locked_until=datetime.utcnow() + timedelta(minutes=5))
+        await mock_db[JOB_COLLECTION].insert_one(live)
+        for _ in range(100):
+            if ran:
+                break
+            await asyncio.sleep(0.01)
+        await queue.shutdown()
+        return ran, await mock_db[JOB_COLLECTION].distinct('id')
+
+    assert asyncio.run(scenario()) == (['stale'], ['live'])
+
+
+def test_finishing_a_lost_claim_leaves_the_reclaimed_job(mock_db):
+    async def scenario():
+        queue = JobQueue(mock_db, persistent=True)
+
+        @queue.register('record')
+        async def record(value: str):
+            pass
+
+        await mock_db[JOB_COLLECTION].insert_one(stale_job('stale', 'record'))
+        lost = await mock_db[JOB_COLLECTION].find_one({'id': 'stale'})
+        reclaimed = await queue._claim()
+        await queue._run_persistent(lost)
+        return reclaimed['attempts'], await mock_db[JOB_COLLECTION].find_one({'id': 'stale'}, {'_id': 0, 'status': 1})
+
+    assert asyncio.run(scenario()) == (2, {'status': 'running'})
@@ -0,0 +1,34 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from notification_counters import UNREAD_COLLECTION, _adjust, insert_notification, mark_read, unread_count
+
+
+def notification(notification_id: str, timestamp: datetime) -> dict:
+    return {'id': notification_id, 'user_id': 'alice', 'read': False, 'timestamp': timestamp}
+
+
+def test_inserts_racing_counter_creation_are_counted_once(mock_db):
+    async def scenario():
+        stamped = datetime.utcnow() - timedelta(seconds=1)
+        # Both inserted before either adjusts; the first adjust creates the counter from a recount of both
+        await mock_db.notifications.insert_many([notification('a', stamped), notification('b', stamped)])
+        await _adjust(mock_db, 'alice', 1, stamped)
+        await _adjust(mock_db, 'alice', 1, stamped)
+        first = await unread_count(mock_db, 'alice')
+        await insert_notification(mock_db, notification('c', datetime.utcnow()))
+        await mark_read(mock_db, 'alice', ['a'])
+        return first, await unread_count(mock_db, 'alice')
+
+    assert asyncio.run(scenario()) == (2, 2)
+
+
+def test_insert_applies_to_counter_created_concurrently(mock_db):
+    async def scenario():
+        stamped = datetime.utcnow() - timedelta(seconds=1)
+        # Created by another write whose recount ran before this notification was stamped
+        await mock_db[UNREAD_COLLECTION].insert_one({'user_id': 'alice', 'unread': 4, 'counted_at': stamped - timedelta(seconds=1)})
+        await insert_notification(mock_db, notification('a', stamped))
+        return await unread_count(mock_db, 'alice')
+
+    assert asyncio.run(scenario()) == 5
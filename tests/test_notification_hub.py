@@ -0,0 +1,84 @@
+import asyncio
+from datetime import datetime
+
+from pymongo.errors import AutoReconnect, OperationFailure
+
+import notification_hub
+from notification_hub import NotificationFeed, NotificationHub
+
+
+class FlakyNotifications:
+    """`notifications` whose change stream fails with the queued errors, one per attempt"""
+
+    def __init__(self, collection, errors):
+        self._collection = collection
+        self.errors = list(errors)
+        self.attempts = 0
+
+    def watch(self, *args, **kwargs):
+        self.attempts += 1
+        raise self.errors.pop(0)
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+
+class FakeDB:
+    def __init__(self, db, notifications):
+        self._db = db
+        self.notifications = notifications
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+
+def notification(notification_id: str) -> dict:
+    return {'id': notification_id, 'user_id': 'alice', 'type': 'test', 'title': 't', 'body': 'b',
+            'read': False, 'timestamp': datetime.utcnow()}
+
+
+async def delivered_after_insert(feed, hub, db, notification_id: str):
+    async with hub.subscription('alice', 'websocket') as queue:
+        await asyncio.sleep(0.05)
+        await db.notifications.insert_one(notification(notification_id))
+        return (await asyncio.wait_for(queue.get(), timeout=2))['id']
+
+
+def test_poll_mode_delivers_inserts(mock_db):
+    async def scenario():
+        hub = NotificationHub()
+        feed = NotificationFeed(mock_db, hub, mode='poll', poll_interval=0.01)
+        feed.start()
+        try:
+            return await delivered_after_insert(feed, hub, mock_db, 'n1'), feed.active_mode, feed.publishes_locally
+        finally:
+            await feed.stop()
+
+    assert asyncio.run(scenario()) == ('n1', 'poll', False)
+
+
+def test_transient_errors_retry_then_unsupported_streams_fall_back_to_polling(mock_db, monkeypatch):
+    monkeypatch.setattr(notification_hub, 'RECONNECT_BACKOFF_SECONDS', (0.01, 0.02))
+    notifications = FlakyNotifications(mock_db.notifications, [
+        AutoReconnect('connection reset'), AutoReconnect('connection reset'),
+        OperationFailure('The $changeStream stage is only supported on replica sets', code=40573),
+    ])
+    db = FakeDB(mock_db, notifications)
+
+    async def scenario():
+        hub = NotificationHub()
+        feed = NotificationFeed(db, hub, poll_interval=0.01)
+        feed.start()
+        try:
+            return await delivered_after_insert(feed, hub, db, 'n2'), feed.active_mode
+        finally:
+            await feed.stop()
+
+    assert asyncio.run(scenario()) == ('n2', 'poll')
+    assert notifications.attempts == 3
+
+
+def test_local_mode_publishes_locally(mock_db):
+    feed = NotificationFeed(mock_db, NotificationHub(), mode='local')
+    feed.start()
+    assert feed.active_mode == 'local' and feed.publishes_locally
@@ -0,0 +1,47 @@
+import base64
+import json
+from datetime import datetime
+
+import pytest
+
+from pagination import decode_cursor, encode_cursor, keyset_filter
+
+
+def raw_cursor(values) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def test_round_trip():
+    timestamp = datetime(2024, 1, 2, 3, 4, 5)
+    assert decode_cursor(encode_cursor('2024-01-02', 'abc'), 2) == ('2024-01-02', 'abc')
+    assert decode_cursor(encode_cursor(timestamp, 'abc'), 2) == (timestamp, 'abc')
+
+
+@pytest.mark.parametrize('values', [
+    [{'$gt': ''}, 'abc'],
+    ['2024-01-02', {'$ne': None}],
+    [{'$dt': '2024-01-02T00:00:00', '$gt': ''}, 'abc'],
+    [{'$dt': 5}, 'abc'],
+    [['2024-01-02'], 'abc'],
+    [True, 'abc'],
+    ['2024-01-02'],
+    ['2024-01-02', 'abc', 'extra'],
+    {'date': '2024-01-02'},
+])
+def test_rejects_anything_encode_cursor_would_not_produce(values):
+    with pytest.raises(ValueError):
+        decode_cursor(raw_cursor(values), 2)
+
+
+def test_rejects_garbage():
+    with pytest.raises(ValueError):
+        decode_cursor('not a cursor!', 2)
+
+
+def test_keyset_filter_requires_a_value_per_field():
+    assert keyset_filter(('date', 'id'), ('2024-01-02', 'abc')) == {'$or': [
+        {'date': {'$lt': '2024-01-02'}},
+        {'date': '2024-01-02', 'id': {'$lt': 'abc'}},
+    ]}
+    with pytest.raises(ValueError):
+        keyset_filter(('date', 'id'), ('2024-01-02',))
@@ -0,0 +1,52 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from rollups import apply_mood_write, get_user_rollup, rebuild_user_rollup
+
+
+def entry(day: int, mood_id: str = 'happy', written_at: datetime = None) -> dict:
+    return {
+        'id': f'e{day}', 'user_id': 'u', 'date': f'2024-01-{day:02d}', 'mood_id': mood_id, 'intensity': 4,
+        'updated_at': written_at or datetime(2024, 1, day)
+    }
+
+
+def test_first_write_for_user_with_history_does_not_replace_it(mock_db):
+    async def scenario():
+        await mock_db.mood_entries.insert_many([entry(day) for day in range(1, 11)])
+        new = entry(11, written_at=datetime.utcnow())
+        await mock_db.mood_entries.insert_one(dict(new))
+        applied = await apply_mood_write(mock_db, 'u', after=new)
+        return applied, await get_user_rollup(mock_db, 'u')
+
+    applied, rollup = asyncio.run(scenario())
+    assert not applied
+    assert rollup['total_entries'] == 11
+
+
+def test_write_counted_by_rebuild_is_not_applied_again(mock_db):
+    async def scenario():
+        new = entry(1, written_at=datetime.utcnow() - timedelta(seconds=1))
+        await mock_db.mood_entries.insert_one(dict(new))
+        await rebuild_user_rollup(mock_db, 'u')
+        # The job for that write runs after the rebuild already saw the entry
+        await apply_mood_write(mock_db, 'u', after=new)
+        return await get_user_rollup(mock_db, 'u')
+
+    assert asyncio.run(scenario())['total_entries'] == 1
+
+
+def test_writes_after_rebuild_are_applied(mock_db):
+    async def scenario():
+        await mock_db.mood_entries.insert_one(entry(1))
+        await rebuild_user_rollup(mock_db, 'u')
+        before = entry(1)
+        after = dict(before, mood_id='sad', updated_at=datetime.utcnow() + timedelta(seconds=1))
+        second = entry(2, written_at=datetime.utcnow() + timedelta(seconds=1))
+        await apply_mood_write(mock_db, 'u', before=before, after=after)
+        await apply_mood_write(mock_db, 'u', after=second)
+        return await get_user_rollup(mock_db, 'u')
+
+    rollup = asyncio.run(scenario())
+    assert rollup['total_entries'] == 2
+    assert rollup['mood_counts'] == {'happy': 1, 'sad': 1}
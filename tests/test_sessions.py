@@ -0,0 +1,77 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from pymongo.errors import AutoReconnect, OperationFailure
+
+import sessions
+from sessions import DEGRADED_TTL_SECONDS, REVOCATION_COLLECTION, RevocationListener, SessionCache
+
+
+class FailingRevocations:
+    """`session_revocations` whose change stream fails with the queued errors, then blocks"""
+
+    def __init__(self, collection, errors):
+        self._collection = collection
+        self.errors = list(errors)
+        self.attempts = 0
+
+    def watch(self, *args, **kwargs):
+        self.attempts += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        raise AutoReconnect('still down')
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+
+class FakeDB:
+    def __init__(self, db, revocations):
+        self._db = db
+        self.revocations = revocations
+
+    def __getitem__(self, name):
+        return self.revocations if name == REVOCATION_COLLECTION else self._db[name]
+
+
+def test_listener_survives_errors_and_cuts_cache_ttl_while_down(mock_db, monkeypatch):
+    monkeypatch.setattr(sessions, 'RECONNECT_BACKOFF_SECONDS', (0.01, 0.02))
+    revocations = FailingRevocations(mock_db[REVOCATION_COLLECTION], [RuntimeError('boom')])
+    cache = SessionCache(ttl_seconds=60)
+    cache.put('token', 'alice', datetime.utcnow() + timedelta(days=1))
+
+    async def scenario():
+        listener = RevocationListener(FakeDB(mock_db, revocations), cache)
+        listener.start()
+        await asyncio.sleep(0.1)
+        running = not listener._task.done()
+        await listener.stop()
+        return running
+
+    assert asyncio.run(scenario())
+    assert revocations.attempts > 1
+    assert cache.ttl_seconds == DEGRADED_TTL_SECONDS
+    assert cache.get('token') is None
+
+
+def test_unsupported_change_streams_fall_back_to_polling_with_normal_ttl(mock_db, monkeypatch):
+    monkeypatch.setattr(sessions, 'RECONNECT_BACKOFF_SECONDS', (0.01, 0.02))
+    revocations = FailingRevocations(mock_db[REVOCATION_COLLECTION], [
+        AutoReconnect('connection reset'),
+        OperationFailure('The $changeStream stage is only supported on replica sets', code=40573),
+    ])
+    cache = SessionCache(ttl_seconds=60)
+
+    async def scenario():
+        listener = RevocationListener(FakeDB(mock_db, revocations), cache, poll_interval=0.01)
+        listener.start()
+        await asyncio.sleep(0.05)
+        cache.put('token', 'alice', datetime.utcnow() + timedelta(days=1))
+        await mock_db[REVOCATION_COLLECTION].insert_one({'session_token': 'token', 'revoked_at': datetime.utcnow()})
+        await asyncio.sleep(0.05)
+        await listener.stop()
+        return listener.active_mode
+
+    assert asyncio.run(scenario()) == 'poll'
+    assert cache.ttl_seconds == 60
+    assert cache.get('token') is None
@@ -0,0 +1,48 @@
+"""Runs the `$facet` pipeline on a real server; skipped when MONGO_URL (default localhost) is unreachable"""
+import asyncio
+import random
+import uuid
+from datetime import date, timedelta
+
+import pytest
+
+from analytics import reference_insights, reference_mood_stats
+from stats_pipeline import aggregate_mood_stats
+
+from .test_analytics import random_entry
+
+
+def comparable(stats: dict, approx: bool = False) -> dict:
+    """The pipeline groups tag intensities by value, so compare each tag's moods as a multiset"""
+    stats = dict(stats)
+    stats['activity_correlation'] = {
+        tag: {**row, 'moods': sorted(row['moods']),
+              'avg_intensity': pytest.approx(row['avg_intensity']) if approx else row['avg_intensity']}
+        for tag, row in stats['activity_correlation'].items()
+    }
+    return stats
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_aggregation_matches_reference(mongo_url, seed):
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    rng = random.Random(seed)
+    day = date(2024, 6, 1)
+    # One entry per day, as the (user_id, date) unique index guarantees
+    entries = [random_entry(rng, day - timedelta(days=i)) for i in range(rng.randint(1, 400))]
+
+    async def scenario():
+        client = AsyncIOMotorClient(mongo_url)
+        db = client[f'moodverse_test_{uuid.uuid4().hex[:8]}']
+        try:
+            await db.mood_entries.insert_many([{**entry, 'user_id': 'alice'} for entry in entries])
+            await db.mood_entries.insert_one({'user_id': 'bob', 'date': '2024-06-01', 'mood_id': 'sad'})
+            return await aggregate_mood_stats(db, 'alice')
+        finally:
+            await client.drop_database(db.name)
+            client.close()
+
+    stats, insights = asyncio.run(scenario())
+    assert comparable(stats) == comparable(reference_mood_stats(entries), approx=True)
+    assert insights == reference_insights(entries)
@@ -0,0 +1,65 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from timelines import TIMELINE_COLLECTION, fan_out_item, publish_feed_item, read_timeline, share_achievement
+
+ACHIEVEMENT = {'id': 'week_streak', 'name': 'Week Warrior', 'icon': '🔥', 'rarity': 'common', 'requirement': 7}
+
+
+def feed_item(item_id: str, minutes: int) -> dict:
+    return {'id': item_id, 'user_id': 'author', 'type': 'achievement', 'content': {},
+            'timestamp': datetime(2024, 1, 1) + timedelta(minutes=minutes)}
+
+
+async def seed(db, old_items: int = 5):
+    await db.friends.insert_one({'user_id': 'reader', 'friend_id': 'author', 'status': 'accepted'})
+    for i in range(old_items):
+        await publish_feed_item(db, feed_item(f'old{i}', i))
+
+
+def test_fan_out_does_not_create_timeline_that_hides_older_items(mock_db):
+    async def scenario():
+        await seed(mock_db)
+        await publish_feed_item(mock_db, feed_item('new', 60))
+        await fan_out_item(mock_db, 'new')
+        assert await mock_db[TIMELINE_COLLECTION].count_documents({'user_id': 'reader'}) == 0
+        return await read_timeline(mock_db, 'reader')
+
+    items = asyncio.run(scenario())
+    assert [item['id'] for item in items] == ['new', 'old4', 'old3', 'old2', 'old1', 'old0']
+
+
+def test_fan_out_pushes_onto_existing_timeline_once(mock_db):
+    async def scenario():
+        await seed(mock_db)
+        await read_timeline(mock_db, 'reader')
+        await publish_feed_item(mock_db, feed_item('new', 60))
+        await fan_out_item(mock_db, 'new')
+        # A retried job must not add the item twice
+        await fan_out_item(mock_db, 'new')
+        return await read_timeline(mock_db, 'reader')
+
+    items = asyncio.run(scenario())
+    assert [item['id'] for item in items] == ['new', 'old4', 'old3', 'old2', 'old1', 'old0']
+
+
+def test_share_achievement_respects_preference(mock_db):
+    async def scenario():
+        await mock_db.users.insert_many([
+            {'id': 'author', 'preferences': {'share_achievements': True}},
+            {'id': 'private', 'preferences': {'theme': 'dark'}},
+        ])
+        await seed(mock_db)
+        await read_timeline(mock_db, 'reader')
+
+        assert await share_achievement(mock_db, 'private', ACHIEVEMENT) is None
+        assert await share_achievement(mock_db, 'missing', ACHIEVEMENT) is None
+        item = await share_achievement(mock_db, 'author', ACHIEVEMENT)
+        await fan_out_item(mock_db, item['id'])
+        return item, await mock_db.social_feed.count_documents({}), await read_timeline(mock_db, 'reader')
+
+    item, stored, items = asyncio.run(scenario())
+    assert item['type'] == 'achievement'
+    assert item['content'] == {'id': 'week_streak', 'name': 'Week Warrior', 'icon': '🔥', 'rarity': 'common'}
+    assert stored == 6
+    assert items[0]['id'] == item['id']